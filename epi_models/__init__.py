@@ -1,3 +1,15 @@
+from .age_preview import AgePreview
+from .agent_based_model import AgentBasedModel
+from .country_sweep import CountrySweep
 from .deterministic_compartmental_model import DeterministicCompartmentalModel, DeterministicCompartmentalModelRunner
-from .deterministic_compartmental_model_scenario import DeterministicCompartmentalModelScenario, SingleInterventionScenario
-from .params import CampParams
\ No newline at end of file
+from .deterministic_compartmental_model_scenario import DeterministicCompartmentalModelScenario, Intervention, InterventionSchedule, MultipleInterventionScenario, ReactiveInterventionScenario, SingleInterventionScenario, StateCondition
+from .emulator import ScenarioEmulator
+from .intensity_profile import ConstantIntensity, DailyIntensity, ExponentialDecayIntensity, IntensityProfile, LinearDecayIntensity, RampUpIntensity
+from .metapopulation_model import MetapopulationModel
+from .model_spec import COVID_SPEC, Flow, ModelSpec
+from .network_model import NetworkModel
+from .params import CampParams
+from .progressive import ProgressiveRun, ProgressiveSnapshot
+from .scenario_grid import ScenarioGrid
+from .scheduler import ScenarioScheduler
+from .stochastic_compartmental_model import StochasticCompartmentalModel
@@ -0,0 +1,237 @@
+import numpy as np
+import pandas as pd
+
+from .config.compartmental_model import Config
+from .deterministic_compartmental_model import DeterministicCompartmentalModel
+from .frozen import read_only_array
+
+
+class CoarseAgeScenario(object):
+    """Scenario of the full model seen on the age compartments of a coarse copy, the infection matrix of every day is aggregated the way the one of the model is"""
+
+    reactive = False
+
+    def __init__(self, scenario, coarse_model, age_limits):
+        if scenario.reactive:
+            raise NotImplementedError(
+                "reactive scenarios switch on the states of the full model"
+            )
+        self.scenario = scenario
+        self.coarse_model = coarse_model
+        # number of the oldest coarse age compartments that start at or above the first high risk age, by the number
+        # of the oldest age compartments of the model
+        lower_limits = np.asarray(age_limits)[::-1]
+        self.high_risk_categories = (
+            np.asarray(coarse_model.age_limits)[:-1, None] >= lower_limits[None, :]
+        ).sum(axis=0)
+        # aggregated matrices by the id of the matrix of the scenario, which is kept alive alongside
+        self._infection_matrices = dict()
+
+    def aggregated_infection_matrix(self, infection_matrix):
+        key = id(infection_matrix)
+        if key not in self._infection_matrices:
+            self._infection_matrices[key] = (
+                infection_matrix,
+                read_only_array(
+                    DeterministicCompartmentalModel.aggregate_infection_matrix(
+                        infection_matrix, self.coarse_model
+                    )
+                ),
+            )
+        return self._infection_matrices[key][1]
+
+    def intervention_params_at_time_t(self, t: int):
+        param_dict = dict(self.scenario.intervention_params_at_time_t(t))
+        param_dict["infection_matrix"] = self.aggregated_infection_matrix(
+            param_dict["infection_matrix"]
+        )
+        param_dict["first_high_risk_category_n"] = self.high_risk_categories[
+            int(param_dict["first_high_risk_category_n"])
+        ]
+        return param_dict
+
+    def fingerprint(self):
+        return (
+            "coarse_ages",
+            tuple(self.coarse_model.age_limits),
+            self.scenario.fingerprint(),
+        )
+
+
+class AgePreview(object):
+    """Quick preview of the ensemble runs of a model on a few coarse age compartments, mapped back to the columns of the full model
+
+    The coarse model is DeterministicCompartmentalModel.with_age_limits, by default on the bands of
+    Config.age_preview_params, and runs the draws of the model with a fraction of its states and to looser tolerances.
+    The states are split back over the age compartments of the model like the parameters were aggregated: the
+    susceptible and offsite like the population, the rest like the infections times the share of them every
+    compartment holds, the symptomatic share for the symptomatic and isolated and so on down to the critical share for
+    the critical care and deaths. The preview is close while the epidemic spreads over the ages as it does at the
+    start. The shares are not worked out again when the interventions change, so the ones that change which ages
+    pass it on or which ages are removed, isolating the symptomatic and moving the high risk residents offsite, move
+    it further off: run lists them in the unaggregated_interventions attribute of the frame. error runs the full model
+    on the same draws and reports how far.
+    """
+
+    def __init__(self, model, age_limits=None):
+        if age_limits is None:
+            # the limits of the configuration the model has, between the ends of its own
+            age_limits = [
+                limit
+                for limit in Config.age_preview_params["age_limits"]
+                if limit in model.age_limits[1:-1]
+            ]
+            age_limits = [model.age_limits[0]] + age_limits + [model.age_limits[-1]]
+        self.model = model
+        self.coarse_model = model.with_age_limits(age_limits)
+        p_symptomatic = np.asarray(model.p_symptomatic)
+        p_hospitalised = p_symptomatic * np.asarray(model.p_hosp_given_symptomatic)
+        p_critical = p_hospitalised * np.asarray(model.p_critical_given_hospitalised)
+        # people every compartment applies to relative to the infections of an age compartment
+        applies_to = {
+            "I": p_symptomatic,
+            "Q": p_symptomatic,
+            "A": 1 - p_symptomatic,
+            "H": p_hospitalised,
+            "C": p_critical,
+            "U": p_critical,
+            "D": p_critical,
+        }
+        # (coarse, fine) shares of every compartment of a coarse age compartment in the ones it merges
+        self.age_shares = dict()
+        for code, _ in model.spec.compartments:
+            if code in ["S", "O"]:
+                self.age_shares[code] = self.coarse_model.age_weights
+                continue
+            shares = self.coarse_model.infection_weights * applies_to.get(code, 1)
+            totals = shares.sum(axis=1, keepdims=True)
+            self.age_shares[code] = read_only_array(
+                shares / np.where(totals > 0, totals, 1)
+            )
+
+    def scenario(self, scenario):
+        """scenario of the model on the coarse age compartments"""
+        return CoarseAgeScenario(scenario, self.coarse_model, self.model.age_limits)
+
+    def run(
+        self,
+        scenario,
+        generated_params_df=None,
+        t_stop=200,
+        initial_exposed=1,
+        initial_symp=1,
+        initial_asymp=1,
+        rtol=None,
+        atol=None,
+        **integrate_kwargs,
+    ):
+        """run_ensemble of the model with the draws integrated on the coarse age compartments, by default to the looser tolerances of Config.age_preview_params"""
+        if rtol is None:
+            rtol = Config.age_preview_params["rtol"]
+        if atol is None:
+            atol = Config.age_preview_params["atol"]
+        if generated_params_df is None:
+            generated_params_df = self.model.generate_epidemic_parameter_ranges(
+                self.model.num_iterations
+            )
+        time_range = np.arange(t_stop + 1)
+        # the coarse model keeps the growth of the epidemic so the draws run as they are
+        y_out = self.coarse_model.integrate_ensemble_chunks(
+            self.scenario(scenario),
+            generated_params_df,
+            self.coarse_model.initial_state_vector(
+                initial_exposed, initial_symp, initial_asymp
+            ),
+            time_range,
+            rtol=rtol,
+            atol=atol,
+            **integrate_kwargs,
+        )
+        simulation_result_frame = self.model.parse_ensemble_output(
+            self.expand(y_out), time_range, generated_params_df
+        )
+        simulation_result_frame.attrs["failed_draws"] = []
+        simulation_result_frame.attrs[
+            "unaggregated_interventions"
+        ] = self.unaggregated_interventions(scenario, time_range)
+        return simulation_result_frame
+
+    @staticmethod
+    def unaggregated_interventions(scenario, time_range):
+        """interventions of the scenario in force on some day of time_range that the shares of the age compartments don't follow"""
+        interventions = []
+        for t in time_range:
+            param_dict = scenario.intervention_params_at_time_t(t)
+            if (
+                param_dict["remove_symptomatic_rate"] > 0
+                and param_dict["isolation_capacity"] > 0
+                and "isolate_symptomatic" not in interventions
+            ):
+                interventions.append("isolate_symptomatic")
+            if (
+                param_dict["remove_high_risk_rate"] > 0
+                and "remove_high_risk_residents" not in interventions
+            ):
+                interventions.append("remove_high_risk_residents")
+        return interventions
+
+    def expand(self, y_out):
+        """(draws, compartments * age categories, time) states of the coarse model split over the age compartments of the model"""
+        num_draws, _, num_times = y_out.shape
+        shares = np.stack(
+            [self.age_shares[code] for code, _ in self.model.spec.compartments]
+        )
+        return np.einsum(
+            "dkct,ckf->dfct",
+            y_out.reshape(
+                num_draws, self.coarse_model.age_categories, len(shares), num_times
+            ),
+            shares,
+        ).reshape(num_draws, -1, num_times)
+
+    def error(
+        self,
+        scenario,
+        generated_params_df=None,
+        preview=None,
+        compartments=None,
+        **run_kwargs,
+    ):
+        """error of a preview of the scenario against the full model run on the same draws, a row per compartment
+
+        The errors of the totals are summarised like ScenarioEmulator.prediction_error, Age_relative_RMSE is the
+        relative RMSE over the age columns of the compartment.
+        """
+        if generated_params_df is None:
+            generated_params_df = self.model.generate_epidemic_parameter_ranges(
+                self.model.num_iterations
+            )
+        if compartments is None:
+            compartments = list(Config.longname.values())
+        if preview is None:
+            preview = self.run(scenario, generated_params_df, **run_kwargs)
+        exact = self.model.run_ensemble(scenario, generated_params_df, **run_kwargs)
+        num_draws = len(generated_params_df)
+        rows = []
+        for compartment in compartments:
+            predicted = preview[compartment].to_numpy().reshape(num_draws, -1)
+            expected = exact[compartment].to_numpy().reshape(num_draws, -1)
+            errors = predicted - expected
+            rmse = np.sqrt(np.mean(errors ** 2))
+            age_names = [compartment + "_" + age for age in self.model.ages]
+            age_errors = preview[age_names].to_numpy() - exact[age_names].to_numpy()
+            rows.append(
+                {
+                    "Compartment": compartment,
+                    "RMSE": rmse,
+                    "Max_abs_error": np.abs(errors).max(),
+                    "Relative_RMSE": rmse / max(np.sqrt(np.mean(expected ** 2)), 1e-12),
+                    # largest error of each run relative to its peak
+                    "Median_relative_error": np.median(
+                        np.abs(errors).max(axis=1) / np.maximum(expected.max(axis=1), 1)
+                    ),
+                    "Age_relative_RMSE": np.sqrt(np.mean(age_errors ** 2))
+                    / max(np.sqrt(np.mean(exact[age_names].to_numpy() ** 2)), 1e-12),
+                }
+            )
+        return pd.DataFrame(rows)
@@ -0,0 +1,332 @@
+import numpy as np
+
+from .config.compartmental_model import Config
+from .model import ModelId
+from .params import CampParams
+from .stochastic_compartmental_model import StochasticCompartmentalModel
+
+
+class AgentBasedModel(StochasticCompartmentalModel):
+    """Agent based model of the camp residents driven by the same camp parameters, contact matrices and scenarios
+
+    The agents are stored as a struct of arrays (age compartment, disease state, time left in the state, household
+    and isolation compliance) and every agent is advanced each day by vectorised transitions. On top of the age
+    structured mixing of the compartmental model part of the transmission happens within households and only the
+    compliant residents can be isolated. The output has the same shape as the compartmental models.
+    """
+
+    def __init__(
+        self,
+        camp_params: CampParams,
+        num_iterations=1000,
+        seed=None,
+        mean_household_size=None,
+        household_transmission_share=None,
+        isolation_compliance=None,
+    ):
+        super().__init__(camp_params, num_iterations, time_step=1, seed=seed)
+        model_params = Config.agent_based_model_params
+        self.mean_household_size = float(
+            model_params["mean_household_size"]
+            if mean_household_size is None
+            else mean_household_size
+        )
+        self.household_transmission_share = float(
+            model_params["household_transmission_share"]
+            if household_transmission_share is None
+            else household_transmission_share
+        )
+        self.isolation_compliance = float(
+            model_params["isolation_compliance"]
+            if isolation_compliance is None
+            else isolation_compliance
+        )
+        self.duration_shape = float(model_params["duration_shape"])
+        assert self.mean_household_size > 1
+        assert 0 <= self.household_transmission_share <= 1
+        assert 0 <= self.isolation_compliance <= 1
+
+    def id(self):
+        return ModelId.AgentBasedModel
+
+    def generate_agents(self, rng):
+        """struct of arrays describing the residents: age compartment, household and whether they comply with isolation"""
+        age = np.repeat(
+            np.arange(self.age_categories, dtype=np.int64), self.population_counts
+        )
+        num_agents = len(age)
+        num_households = max(int(np.ceil(num_agents / self.mean_household_size)), 1)
+        household = rng.permutation(num_agents) % num_households
+        compliant = rng.random(num_agents) < self.isolation_compliance
+        return {
+            "age": age,
+            "household": household,
+            "num_households": num_households,
+            "compliant": compliant,
+        }
+
+    def _durations(self, rng, rate, size):
+        """gamma distributed time spent in a state with the mean 1 / rate"""
+        return rng.gamma(self.duration_shape, 1 / (rate * self.duration_shape), size)
+
+    @staticmethod
+    def _choose(rng, candidates, number):
+        number = int(min(max(number, 0), len(candidates)))
+        return rng.choice(candidates, number, replace=False)
+
+    def count_agents(self, agents, state):
+        """number of agents in each compartment laid out as the y vector of the compartmental model"""
+        return np.bincount(
+            agents["age"] * self.number_compartments + state,
+            minlength=self.age_categories * self.number_compartments,
+        )
+
+    def transmission_pressure(self, agents, state, scenario_dict, beta):
+        """daily force of infection on every agent from the age structured mixing and from their household"""
+        index = Config.compartment_index
+        infectiousness = np.zeros(len(state))
+        infectiousness[state == index["I"]] = 1
+        infectiousness[state == index["A"]] = self.AsymptInfectiousFactor
+        transmission = scenario_dict["transmission_reduction_factor"] * beta
+        infectious_by_age = (
+            np.bincount(
+                agents["age"], weights=infectiousness, minlength=self.age_categories
+            )
+            / self.population_size
+        )
+        community_force = (
+            (1 - self.household_transmission_share)
+            * transmission
+            * np.dot(scenario_dict["infection_matrix"], infectious_by_age)
+        )
+        # an infectious person infects about beta * largest eigenvalue people a day in a fully susceptible camp
+        # and the household share of that is spread over their household members
+        household_force = (
+            self.household_transmission_share
+            * transmission
+            * np.real(self.largest_eigenvalue)
+            / (self.mean_household_size - 1)
+            * np.bincount(
+                agents["household"],
+                weights=infectiousness,
+                minlength=agents["num_households"],
+            )
+        )
+        return community_force[agents["age"]] + household_force[agents["household"]]
+
+    def step(
+        self,
+        rng,
+        agents,
+        state,
+        timer,
+        scenario_dict,
+        beta,
+        latent_rate,
+        removal_rate,
+        hosp_rate,
+        death_rate_ICU,
+        death_rate_no_ICU,
+    ):
+        """advance every agent by one day, state and timer are updated in place"""
+        index = Config.compartment_index
+        age = agents["age"]
+
+        # S -> E
+        susceptible = np.flatnonzero(state == index["S"])
+        force = self.transmission_pressure(agents, state, scenario_dict, beta)[
+            susceptible
+        ]
+        newly_exposed = susceptible[rng.random(len(susceptible)) < -np.expm1(-force)]
+
+        # agents whose time in the current state is up, found before anyone moves so nobody moves twice a day
+        timer -= 1
+        due = timer <= 0
+        due_agents = {
+            compartment: np.flatnonzero(due & (state == index[compartment]))
+            for compartment in ["E", "I", "A", "Q", "H", "C", "U"]
+        }
+
+        state[newly_exposed] = index["E"]
+        timer[newly_exposed] = self._durations(rng, latent_rate, len(newly_exposed))
+
+        # E -> I or A
+        leaving = due_agents["E"]
+        symptomatic = rng.random(len(leaving)) < self.p_symptomatic[age[leaving]]
+        state[leaving] = np.where(symptomatic, index["I"], index["A"])
+        timer[leaving] = self._durations(rng, removal_rate, len(leaving))
+
+        # I -> H or R, isolated agents leave Q the same way once they are no longer infectious
+        for compartment in ["I", "Q"]:
+            leaving = due_agents[compartment]
+            hospitalised = (
+                rng.random(len(leaving)) < self.p_hosp_given_symptomatic[age[leaving]]
+            )
+            state[leaving] = np.where(hospitalised, index["H"], index["R"])
+            timer[leaving] = np.where(
+                hospitalised, self._durations(rng, hosp_rate, len(leaving)), np.inf
+            )
+
+        # A -> R
+        state[due_agents["A"]] = index["R"]
+        timer[due_agents["A"]] = np.inf
+
+        # C -> D or back to H
+        leaving = due_agents["C"]
+        died = rng.random(len(leaving)) < self.death_prob_with_ICU
+        state[leaving] = np.where(died, index["D"], index["H"])
+        timer[leaving] = np.where(
+            died, np.inf, self._durations(rng, hosp_rate, len(leaving))
+        )
+
+        # U -> D
+        state[due_agents["U"]] = index["D"]
+        timer[due_agents["U"]] = np.inf
+
+        # H -> R or needing critical care, ICU beds allocated at random among the ones needing care
+        leaving = due_agents["H"]
+        needing_care = (
+            rng.random(len(leaving)) < self.p_critical_given_hospitalised[age[leaving]]
+        )
+        state[leaving[~needing_care]] = index["R"]
+        timer[leaving[~needing_care]] = np.inf
+        needing_care = leaving[needing_care]
+        icu_beds_free = np.floor(
+            scenario_dict["icu_capacity"] * self.population_size
+        ) - np.count_nonzero(state == index["C"])
+        icu_cared = self._choose(rng, needing_care, icu_beds_free)
+        without_icu = np.setdiff1d(needing_care, icu_cared, assume_unique=True)
+        state[icu_cared] = index["C"]
+        timer[icu_cared] = self._durations(rng, death_rate_ICU, len(icu_cared))
+        state[without_icu] = index["U"]
+        timer[without_icu] = self._durations(rng, death_rate_no_ICU, len(without_icu))
+
+        # Intervention: isolating compliant symptomatic residents within the isolation capacity
+        if (scenario_dict["remove_symptomatic_rate"] > 0) and (
+            scenario_dict["isolation_capacity"] > 0
+        ):
+            Q_left_over_capacity = np.floor(
+                scenario_dict["isolation_capacity"] * self.population_size
+            ) - np.count_nonzero(state == index["Q"])
+            isolated = self._choose(
+                rng,
+                np.flatnonzero((state == index["I"]) & agents["compliant"]),
+                min(
+                    rng.poisson(
+                        scenario_dict["remove_symptomatic_rate"] * self.population_size
+                    ),
+                    Q_left_over_capacity,
+                ),
+            )
+            # they keep the time left of their infectious period
+            state[isolated] = index["Q"]
+        else:
+            # the intervention is off so the ones still isolated go back into I
+            state[state == index["Q"]] = index["I"]
+
+        # Intervention: removing high risk residents from the oldest age compartments
+        if scenario_dict["remove_high_risk_rate"] > 0:
+            first_high_risk_category_n = (
+                self.age_categories - scenario_dict["first_high_risk_category_n"]
+            )
+            offsite = self._choose(
+                rng,
+                np.flatnonzero(
+                    (state == index["S"]) & (age >= first_high_risk_category_n)
+                ),
+                rng.poisson(
+                    scenario_dict["remove_high_risk_rate"] * self.population_size
+                ),
+            )
+            state[offsite] = index["O"]
+
+    def run_agents(
+        self,
+        rng,
+        agents,
+        scenario,
+        rates,
+        t_stop=200,
+        initial_exposed=1,
+        initial_symp=1,
+        initial_asymp=1,
+    ):
+        """run one simulation of all agents and return the daily counts with the shape (compartments * age categories, time)"""
+        index = Config.compartment_index
+        beta, latent_rate, removal_rate = rates[:3]
+        num_agents = len(agents["age"])
+        state = np.full(num_agents, index["S"], dtype=np.int64)
+        timer = np.full(num_agents, np.inf)
+        seeded = rng.choice(
+            num_agents, initial_exposed + initial_symp + initial_asymp, replace=False
+        )
+        for compartment, rate, seeded_agents in [
+            ("E", latent_rate, seeded[:initial_exposed]),
+            (
+                "I",
+                removal_rate,
+                seeded[initial_exposed : initial_exposed + initial_symp],
+            ),
+            ("A", removal_rate, seeded[initial_exposed + initial_symp :]),
+        ]:
+            state[seeded_agents] = index[compartment]
+            timer[seeded_agents] = self._durations(rng, rate, len(seeded_agents))
+        y_out = np.zeros(
+            (self.age_categories * self.number_compartments, t_stop + 1),
+            dtype=np.int64,
+        )
+        y_out[:, 0] = self.count_agents(agents, state)
+        for day in range(t_stop):
+            scenario_dict = scenario.intervention_params_at_time_t(day)
+            self.step(rng, agents, state, timer, scenario_dict, *rates)
+            y_out[:, day + 1] = self.count_agents(agents, state)
+        return y_out
+
+    def run_replicates(
+        self,
+        scenario,
+        generated_params_df,
+        t_stop=200,
+        initial_exposed=1,
+        initial_symp=1,
+        initial_asymp=1,
+        seed=None,
+    ):
+        """run one simulation per draw on the same set of agents and return the daily counts with the shape (draws, compartments * age categories, time)"""
+        if scenario.reactive:
+            raise NotImplementedError(
+                "reactive scenarios need the solver of the deterministic model"
+            )
+        rng = np.random.default_rng(self.seed if seed is None else seed)
+        agents = self.generate_agents(rng)
+        y_out = np.zeros(
+            (
+                len(generated_params_df),
+                self.age_categories * self.number_compartments,
+                t_stop + 1,
+            ),
+            dtype=np.int64,
+        )
+        for i, (_, row) in enumerate(generated_params_df.iterrows()):
+            rates = [
+                row[param_name]
+                for param_name in [
+                    "beta",
+                    "latentRate",
+                    "removalRate",
+                    "hospRate",
+                    "deathRateICU",
+                    "deathRateNoICU",
+                ]
+            ]
+            y_out[i] = self.run_agents(
+                rng,
+                agents,
+                scenario,
+                rates,
+                t_stop,
+                initial_exposed,
+                initial_symp,
+                initial_asymp,
+            )
+        return y_out
@@ -0,0 +1,107 @@
+import numpy as np
+import pandas as pd
+
+from .ensemble import ensemble_array, num_times_of
+
+# outcome of every draw and the name of the paired difference that is a benefit when positive
+OUTCOME_DIFFERENCE_NAMES = {
+    "Deaths": "Deaths_averted",
+    "Peak_symptomatic": "Peak_reduction",
+    "ICU_days": "ICU_days_saved",
+}
+
+
+def draw_outcomes(frame, num_times=None):
+    """outcomes of every draw of a result frame: deaths by the end, the peak of symptomatic infections and the days spent in critical care"""
+    if num_times is None:
+        num_times = num_times_of(frame)
+    return outcomes_of_arrays(
+        ensemble_array(frame, "Deaths", num_times),
+        ensemble_array(frame, "Infected_symptomatic", num_times),
+        ensemble_array(frame, "Critical", num_times),
+        ensemble_array(frame, "Time", num_times)[0],
+    )
+
+
+def outcomes_of_arrays(deaths, symptomatic, critical, time_range):
+    """draw_outcomes from (draws, time) arrays of the people dead, infected with symptoms and in critical care"""
+    # trapezoidal rule over the time points
+    icu_days = ((critical[:, 1:] + critical[:, :-1]) / 2 * np.diff(time_range)).sum(
+        axis=1
+    )
+    return {
+        "Deaths": deaths[:, -1],
+        "Peak_symptomatic": symptomatic.max(axis=1),
+        "ICU_days": icu_days,
+    }
+
+
+def paired_comparison(baseline_frame, scenario_frame, quantiles=(0.05, 0.5, 0.95)):
+    """differences (baseline minus scenario) and ratios (scenario over baseline) of the outcomes of two result frames paired by draw
+
+    Both frames have to come from the same generated parameters so that draw i of one is draw i of the other, pairs with
+    a failed draw on either side are left out.
+    """
+    num_times = num_times_of(baseline_frame)
+    assert num_times_of(scenario_frame) == num_times
+    baseline_r0 = ensemble_array(baseline_frame, "R0", num_times)[:, 0]
+    scenario_r0 = ensemble_array(scenario_frame, "R0", num_times)[:, 0]
+    assert np.array_equal(
+        baseline_r0, scenario_r0
+    ), "the frames are not paired draw by draw"
+    baseline_outcomes = draw_outcomes(baseline_frame, num_times)
+    scenario_outcomes = draw_outcomes(scenario_frame, num_times)
+    rows = []
+    for outcome, difference_name in OUTCOME_DIFFERENCE_NAMES.items():
+        baseline_values = baseline_outcomes[outcome]
+        scenario_values = scenario_outcomes[outcome]
+        paired = ~(np.isnan(baseline_values) | np.isnan(scenario_values))
+        baseline_values, scenario_values = (
+            baseline_values[paired],
+            scenario_values[paired],
+        )
+        differences = baseline_values - scenario_values
+        ratios = np.divide(
+            scenario_values,
+            baseline_values,
+            out=np.full(len(baseline_values), np.nan),
+            where=baseline_values > 0,
+        )
+        row = {
+            "Outcome": outcome,
+            "Difference": difference_name,
+            "Num_pairs": int(paired.sum()),
+            "Baseline_mean": baseline_values.mean() if paired.any() else np.nan,
+            "Scenario_mean": scenario_values.mean() if paired.any() else np.nan,
+            "Difference_mean": differences.mean() if paired.any() else np.nan,
+            # standard error of the mean paired difference, small when the draws are strongly correlated
+            "Difference_se": differences.std(ddof=1) / np.sqrt(len(differences))
+            if len(differences) > 1
+            else np.nan,
+        }
+        for quantile in quantiles:
+            row[f"Difference_q{quantile:g}"] = (
+                np.quantile(differences, quantile) if paired.any() else np.nan
+            )
+        for quantile in quantiles:
+            row[f"Ratio_q{quantile:g}"] = (
+                np.nanquantile(ratios, quantile)
+                if np.isfinite(ratios).any()
+                else np.nan
+            )
+        rows.append(row)
+    return pd.DataFrame(rows)
+
+
+def compare_scenarios(baseline_frame, scenario_frames, quantiles=(0.05, 0.5, 0.95)):
+    """paired comparison of every scenario against the baseline, the scenarios are a dict of result frames or a frame of several scenarios told apart by the Scenario_suffix column"""
+    if isinstance(scenario_frames, pd.DataFrame):
+        scenario_frames = dict(
+            tuple(scenario_frames.groupby("Scenario_suffix", sort=False))
+        )
+    comparisons = []
+    for scenario_suffix, scenario_frame in scenario_frames.items():
+        comparison = paired_comparison(baseline_frame, scenario_frame, quantiles)
+        comparison.insert(0, "Scenario_suffix", scenario_suffix)
+        comparisons.append(comparison)
+    return pd.concat(comparisons, axis=0, ignore_index=True)
@@ -9,79 +9,126 @@ class Config(object):
         "default_quarantine_period": 200,
         "better_hygiene_infection_scale": 0.7,
     }
+    agent_based_model_params = {
+        "mean_household_size": 5,
+        # share of an infectious person's transmission that happens within their household
+        "household_transmission_share": 0.3,
+        # share of the residents who comply when asked to isolate
+        "isolation_compliance": 0.8,
+        # shape of the gamma distributed time spent in each disease state
+        "duration_shape": 2,
+    }
+    network_model_params = {
+        # neighbouring households making up a block of the camp
+        "households_per_block": 20,
+        # share of the contacts outside the household that are made within the block
+        "block_contact_share": 0.5,
+        # contact graphs kept built, the least recently used one is dropped past this
+        "graph_cache_size": 4,
+        # edge weight masks of the scenarios every network model keeps, the least recently used one is dropped past this
+        "edge_mask_cache_size": 16,
+    }
+    hybrid_model_params = {
+        # age compartments with fewer people exposed or infectious than this are advanced stochastically
+        "threshold": 10,
+        # tau-leaping steps a day for the stochastic age compartments
+        "steps_per_day": 4,
+    }
+    reaction_delay_params = {
+        # share of the population infected with symptoms that triggers a reaction
+        "symptomatic_share": 0.0001,
+        # number of deaths that triggers a reaction
+        "deaths": 1,
+    }
+    intensity_profile_params = {
+        # share of the intervention effect left at the end of a window when it decays
+        "decay_final_intensity": 0.7,
+        # days between the points the intensity of an intervention is precomputed at
+        "grid_step": 0.25,
+    }
+    calibration_params = {
+        # starting points of the fit, run in parallel
+        "num_starts": 8,
+        "r0_bounds": (1.0, 8.0),
+        "reporting_fraction_bounds": (0.01, 1.0),
+        # days covered by every observed count
+        "days_per_period": 7,
+    }
+    emulator_params = {
+        # total degree of the Legendre polynomials of the factors
+        "degree": 4,
+        # share of the variance of the log curves kept by the principal components
+        "explained_variance": 0.99999,
+        # ridge penalty of the polynomial fit relative to the mean squared feature
+        "ridge": 1e-8,
+    }
+    linear_split_params = {
+        # steps a day of the exponential integrator
+        "steps_per_day": 4,
+        # engines of single draws ode_equations keeps for the next calls
+        "draw_engine_cache_size": 64,
+    }
+    capacity_smoothing_params = {
+        # width in people of the smooth minimum of the capacity limits when smoothing is on
+        "width": 1.0,
+    }
+    age_preview_params = {
+        # limits of the age compartments of the preview, unions of the ten year compartments of the camp
+        "age_limits": [0, 20, 60, 80],
+        # tolerances of the preview runs, the coarse age compartments are further off than these anyway
+        "rtol": 1e-3,
+        "atol": 1e-8,
+    }
+    progressive_params = {
+        # compartments and daily quantiles of the bands of a progressive run
+        "compartments": ["Infected_symptomatic", "Critical", "Deaths"],
+        "quantiles": [0.05, 0.5, 0.95],
+        # seconds between snapshots
+        "snapshot_interval": 1.0,
+        # draws of the first batch, the batches then double up to the largest size
+        "first_batch_size": 4,
+        "max_batch_size": 32,
+        # method of the vectorised ensemble pass of the early snapshots, False to run the draws one by one only
+        "ensemble_method": "ETD2RK",
+        # confidence of the intervals of the quantiles the precision of a snapshot is worked out from
+        "confidence": 0.95,
+    }
     CONTACT_MATRIX_DIR = Path(os.path.dirname(__file__)) / "contact_matrices"
+    # integrators tried in turn for a draw until one succeeds, each entry is passed on to ode.set_integrator
+    integrator_fallback_chain = [
+        {"name": "vode", "nsteps": 5000},
+        {"name": "vode", "nsteps": 50000},
+        {"name": "lsoda", "nsteps": 50000},
+        {"name": "vode", "method": "bdf", "nsteps": 50000, "rtol": 1e-8, "atol": 1e-10},
+    ]
+    # wall-clock seconds a single draw may spend in the solver across all the integrators tried
+    draw_time_budget = 60
+    # code, long name and short name of every compartment in the order of the state vector
+    compartments = [
+        ("S", "Susceptible", "Sus."),
+        ("E", "Exposed", "Exp."),
+        ("I", "Infected_symptomatic", "Inf. (symp.)"),
+        ("A", "Infected_asymptomatic", "Asym."),
+        ("R", "Recovered", "Rec."),
+        ("H", "Hospitalised", "Hosp."),
+        ("C", "Critical", "Crit."),
+        ("D", "Deaths", "Deaths"),
+        ("O", "Offsite", "Offsite"),
+        ("Q", "Quarantined", "Quar."),
+        ("U", "No_ICU_Care", "No ICU"),
+    ]
+    # the changes in every compartment follow the compartments
     compartment_index = {
-        "S": 0,
-        "E": 1,
-        "I": 2,
-        "A": 3,
-        "R": 4,
-        "H": 5,
-        "C": 6,
-        "D": 7,
-        "O": 8,
-        "Q": 9,
-        "U": 10,
-        "CS": 11,
-        "CE": 12,
-        "CI": 13,
-        "CA": 14,
-        "CR": 15,
-        "CH": 16,
-        "CC": 17,
-        "CD": 18,
-        "CO": 19,
-        "CQ": 20,
-        "CU": 21,
-        "Ninf": 22,
-    }
-    longname = {
-        "S": "Susceptible",
-        "E": "Exposed",
-        "I": "Infected_symptomatic",
-        "A": "Infected_asymptomatic",
-        "R": "Recovered",
-        "H": "Hospitalised",
-        "C": "Critical",
-        "D": "Deaths",
-        "O": "Offsite",
-        "Q": "Quarantined",
-        "U": "No_ICU_Care",
-        # 'CS': 'Change in Susceptible',
-        # 'CE': 'Change in Exposed',
-        # 'CI': 'Change in Infected (symptomatic)',
-        # 'CA': 'Change in Asymptomatically Infected',
-        # 'CR': 'Change in Recovered',
-        # 'CH': 'Change in Hospitalised',
-        # 'CC': 'Change in Critical',
-        # 'CD': 'Change in Deaths',
-        # 'CO': 'Change in Offsite',
-        # 'CQ': 'Change in Quarantined',
-        # 'CU': 'Change in No ICU Care',
-        # 'Ninf': 'Change in total active infections',  # sum of E, I, A
+        **{code: i for i, (code, _, _) in enumerate(compartments)},
+        **{
+            "C" + code: i
+            for i, (code, _, _) in enumerate(compartments, len(compartments))
+        },
+        "Ninf": 2 * len(compartments),
     }
+    longname = {code: name for code, name, _ in compartments}
     shortname = {
-        "S": "Sus.",
-        "E": "Exp.",
-        "I": "Inf. (symp.)",
-        "A": "Asym.",
-        "R": "Rec.",
-        "H": "Hosp.",
-        "C": "Crit.",
-        "D": "Deaths",
-        "O": "Offsite",
-        "Q": "Quar.",
-        "U": "No ICU",
-        "CS": "Change in Sus.",
-        "CE": "Change in Exp.",
-        "CI": "Change in Inf. (symp.)",
-        "CA": "Change in Asym.",
-        "CR": "Change in Rec.",
-        "CH": "Change in Hosp.",
-        "CC": "Change in Crit.",
-        "CD": "Change in Deaths",
-        "CO": "Change in Offsite",
-        "CQ": "Change in Quar.",
-        "CU": "Change in No ICU",
+        **{code: name for code, _, name in compartments},
+        **{"C" + code: "Change in " + name for code, _, name in compartments},
         "Ninf": "New Infected",  # newly exposed to the disease = - change in susceptibles
     }
@@ -0,0 +1,170 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from .comparison import outcomes_of_arrays
+from .config.compartmental_model import Config
+from .deterministic_compartmental_model import DeterministicCompartmentalModelRunner
+from .deterministic_compartmental_model_scenario import (
+    DeterministicCompartmentalModelScenario,
+)
+from .params import CampParams
+
+
+class CountrySweep(object):
+    """Run one camp against the contact matrices of a set of countries, for camps whose residents come from several or unknown countries
+
+    The camp is processed once. The contact matrices of all the countries are aggregated to the age compartments of
+    the camp and their eigenvalues worked out as one stacked batch, every country then gets a copy of the model sharing
+    the rest of its state. The baselines of every country run through the ensemble path on a shared executor with the
+    same draws of the epidemic parameters, so differences between countries come from the contact matrices alone.
+    """
+
+    def __init__(
+        self,
+        camp_params: CampParams,
+        countries=None,
+        num_iterations=1000,
+        max_workers=None,
+    ):
+        self.runner = DeterministicCompartmentalModelRunner(camp_params, num_iterations)
+        model = self.runner.model
+        if countries is None:
+            countries = model.available_countries()
+        self.countries = list(countries)
+        assert len(self.countries) > 0, "the sweep needs at least one country"
+        self.max_workers = max_workers
+        self.infection_matrices = model._aggregate_contact_matrices(
+            np.stack([model._load_contact_matrix(c) for c in self.countries]),
+            model.population_vector,
+            model.age_limits,
+        )
+        self.largest_eigenvalues = model._largest_eigenvalues(
+            self.infection_matrices, model.population_vector
+        )
+        self.models = {
+            country: model.with_infection_matrix(infection_matrix, largest_eigenvalue)
+            for country, infection_matrix, largest_eigenvalue in zip(
+                self.countries, self.infection_matrices, self.largest_eigenvalues
+            )
+        }
+        self.camp_baseline_params = self.runner.process_camp_params(camp_params)
+
+    def scenarios(self, country):
+        """baselines of the camp on the contact matrix of a country"""
+        model = self.models[country]
+        return {
+            "do_nothing_baseline": DeterministicCompartmentalModelScenario(
+                model.population_size, model.infection_matrix
+            ),
+            "camp_baseline": DeterministicCompartmentalModelScenario(
+                model.population_size,
+                model.infection_matrix,
+                *self.camp_baseline_params,
+            ),
+        }
+
+    def run_country(self, country, t_stop=200, chunk_size=1000, **integrate_kwargs):
+        """outcomes of every draw of the baselines on the contact matrix of a country"""
+        model = self.models[country]
+        # beta follows the eigenvalue of the contact matrix for the same R0
+        generated_params_df = model.derive_epidemic_rates(
+            self.runner.generated_params_df.copy()
+        )
+        y0 = model.initial_state_vector(1, 1, 1)
+        time_range = np.arange(t_stop + 1)
+        index = Config.compartment_index
+        outcomes = dict()
+        for scenario_name, scenario in self.scenarios(country).items():
+            chunk_outcomes = []
+            for chunk_start in range(0, len(generated_params_df), chunk_size):
+                chunk = slice(chunk_start, chunk_start + chunk_size)
+                y_out = model.integrate_ensemble(
+                    scenario,
+                    generated_params_df.iloc[chunk],
+                    y0,
+                    time_range,
+                    **integrate_kwargs,
+                )
+                totals = model.population_size * y_out.reshape(
+                    len(y_out), model.age_categories, model.number_compartments, -1
+                ).sum(axis=1)
+                chunk_outcomes.append(
+                    outcomes_of_arrays(
+                        totals[:, index["D"]],
+                        totals[:, index["I"]],
+                        totals[:, index["C"]],
+                        time_range,
+                    )
+                )
+            outcomes[scenario_name] = {
+                outcome: np.concatenate([values[outcome] for values in chunk_outcomes])
+                for outcome in chunk_outcomes[0]
+            }
+        return outcomes
+
+    def run(self, quantiles=(0.05, 0.5, 0.95), **run_kwargs):
+        """outcomes of the baselines for every country and how sensitive they are to the contact matrix
+
+        Returns a frame of the mean and quantiles of every outcome over the draws per country and scenario, and a frame
+        per scenario and outcome of the spread of the country means, the countries at either end and the share of the
+        variance over all countries and draws that is between the countries.
+        """
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            country_outcomes = dict(
+                zip(
+                    self.countries,
+                    executor.map(
+                        lambda country: self.run_country(country, **run_kwargs),
+                        self.countries,
+                    ),
+                )
+            )
+        rows = []
+        for country, largest_eigenvalue in zip(
+            self.countries, self.largest_eigenvalues
+        ):
+            for scenario_name, outcomes in country_outcomes[country].items():
+                for outcome, values in outcomes.items():
+                    row = {
+                        "Country": country,
+                        "Largest_eigenvalue": largest_eigenvalue,
+                        "Scenario": scenario_name,
+                        "Outcome": outcome,
+                        "Mean": np.mean(values),
+                    }
+                    for quantile, value in zip(
+                        quantiles, np.quantile(values, quantiles)
+                    ):
+                        row[f"q{quantile:g}"] = value
+                    rows.append(row)
+        outcome_frame = pd.DataFrame(rows)
+        sensitivity_rows = []
+        for (scenario_name, outcome), group in outcome_frame.groupby(
+            ["Scenario", "Outcome"], sort=False
+        ):
+            # (countries, draws) with the draws paired across the countries
+            values = np.stack(
+                [
+                    country_outcomes[country][scenario_name][outcome]
+                    for country in group["Country"]
+                ]
+            )
+            means = group["Mean"].to_numpy()
+            total_variance = values.var()
+            sensitivity_rows.append(
+                {
+                    "Scenario": scenario_name,
+                    "Outcome": outcome,
+                    "Country_mean_min": means.min(),
+                    "Country_mean_median": np.median(means),
+                    "Country_mean_max": means.max(),
+                    "Least_severe_country": group["Country"].iloc[means.argmin()],
+                    "Most_severe_country": group["Country"].iloc[means.argmax()],
+                    "Between_country_share": means.var() / total_variance
+                    if total_variance > 0
+                    else 0.0,
+                }
+            )
+        return outcome_frame, pd.DataFrame(sensitivity_rows)
@@ -1,20 +1,51 @@
+import time
+from copy import copy
+from functools import lru_cache
 from math import ceil, floor
 from typing import Tuple
 
 import numpy as np
 import pandas as pd
-from scipy.integrate import ode
+from scipy.integrate import ode, solve_ivp
+from scipy.sparse import bsr_matrix
 
 from .config.compartmental_model import Config
 from .deterministic_compartmental_model_scenario import (
     DeterministicCompartmentalModelScenario,
     SingleInterventionScenario,
 )
+from .ensemble import (
+    ensemble_array,
+    num_times_of,
+    perron_roots,
+    reaction_delays,
+    smooth_minimum,
+)
+from .frozen import read_only_array
+from .linear_split import LinearSplitEngine
 from .model import Model, ModelId, ModelRunner
+from .model_spec import COVID_SPEC, DRAW_RATE_COLUMNS
 from .params import CampParams
+from .progressive import ProgressiveRun
+from .scenario_grid import ScenarioGrid
+from .time_budget import TimeBudget
+
+
+@lru_cache(maxsize=Config.linear_split_params["draw_engine_cache_size"])
+def _cached_draw_engine(model, rates, stochastic_mask):
+    """engine of ode_equations for the rates of a draw and the tuple of the age compartments left to the stochastic leaps, or None"""
+    engine = model.draw_engine(*rates)
+    if stochastic_mask is not None:
+        engine = engine.with_stochastic_mask(np.array(stochastic_mask))
+    return engine
 
 
 class DeterministicCompartmentalModel(Model):
+    # compartments and flows, ode_equations and the integrators run the equations compiled from it
+    spec = COVID_SPEC
+    # width in people of the smooth minimum of the capacity limits, zero keeps the hard minimum
+    capacity_smoothing = 0.0
+
     def __init__(self, camp_params: CampParams, num_iterations=1000):
         super().__init__()
         # load parameters
@@ -29,6 +60,9 @@ class DeterministicCompartmentalModel(Model):
             self.im_beta_list,
             self.largest_eigenvalue,
         ) = self.process_and_load_camp_parameters(camp_params)
+        # the arrays of the model are shared with its scenarios, copies and caches so they are read-only
+        self.population_vector = read_only_array(self.population_vector)
+        self.infection_matrix = read_only_array(self.infection_matrix)
         self.num_iterations = num_iterations
 
     def id(self):
@@ -69,33 +103,193 @@ class DeterministicCompartmentalModel(Model):
             largest_eigenvalue,
         )
 
+    # contact matrices already read keyed by the country
+    _contact_matrix_cache = dict()
+
     @staticmethod
-    def _generate_contact_matrix(country, population_vector, age_limits):
-        """Squeeze 5-year gap, 16 age compartment POLYMOD contact matrix into 10-year gap, 8 age compartment used in this model"""
-        # TODO Walk through this code and write some tests for it
-        contact_matrix_path = Config.CONTACT_MATRIX_DIR / f"{country}.csv"
-        contact_matrix = pd.read_csv(contact_matrix_path).to_numpy()
-        n_categories = len(age_limits) - 1
-        ind_limits = np.array(age_limits / 5, dtype=int)
+    def available_countries():
+        """countries there is a contact matrix for"""
+        return sorted(path.stem for path in Config.CONTACT_MATRIX_DIR.glob("*.csv"))
+
+    @classmethod
+    def _load_contact_matrix(cls, country):
+        """16 age compartment POLYMOD contact matrix of a country, read once"""
+        if country not in cls._contact_matrix_cache:
+            contact_matrix_path = Config.CONTACT_MATRIX_DIR / f"{country}.csv"
+            # some of the files have a header row of column names and some don't
+            contact_matrix = pd.read_csv(contact_matrix_path, header=None)
+            contact_matrix = contact_matrix[
+                pd.to_numeric(contact_matrix[0], errors="coerce").notna()
+            ]
+            cls._contact_matrix_cache[country] = read_only_array(
+                contact_matrix.to_numpy(dtype=float)
+            )
+        return cls._contact_matrix_cache[country]
+
+    @staticmethod
+    def _aggregate_contact_matrices(contact_matrices, population_vector, age_limits):
+        """Squeeze a (countries, 16, 16) stack of 5-year gap contact matrices into the age compartments of age_limits at once, the contacts of a compartment are the population weighted mean over its 5-year bands"""
+        ind_limits = np.array(np.asarray(age_limits) / 5, dtype=int)
+        n_categories = len(ind_limits) - 1
         p = np.zeros(16)
+        # weights of the 5-year bands within their compartment and membership of the bands
+        weights = np.zeros((n_categories, 16))
+        membership = np.zeros((n_categories, 16))
         for i in range(n_categories):
-            p[ind_limits[i] : ind_limits[i + 1]] = population_vector[i] / (
-                ind_limits[i + 1] - ind_limits[i]
+            band = slice(ind_limits[i], ind_limits[i + 1])
+            p[band] = population_vector[i] / (ind_limits[i + 1] - ind_limits[i])
+            weights[i, band] = p[band] / p[band].sum()
+            membership[i, band] = 1
+        return np.einsum(
+            "ia,nab,jb->nij",
+            weights,
+            np.asarray(contact_matrices, dtype=float),
+            membership,
+        )
+
+    @classmethod
+    def _generate_contact_matrix(cls, country, population_vector, age_limits):
+        """Squeeze 5-year gap, 16 age compartment POLYMOD contact matrix into 10-year gap, 8 age compartment used in this model"""
+        return cls._aggregate_contact_matrices(
+            cls._load_contact_matrix(country)[None], population_vector, age_limits
+        )[0]
+
+    @staticmethod
+    def _largest_eigenvalues(contact_matrices, population_vector):
+        """largest eigenvalue of the next generation matrix of every contact matrix of a (countries, k, k) stack"""
+        eigenvalues = np.linalg.eigvals(
+            0.01 * population_vector[None, :, None] * np.asarray(contact_matrices)
+        )
+        # the next generation matrices are nonnegative so their largest eigenvalue is real
+        return np.real(eigenvalues).max(axis=1)
+
+    def with_infection_matrix(self, infection_matrix, largest_eigenvalue=None):
+        """copy of the model on another infection matrix of the camp, the other read-only state is shared"""
+        if largest_eigenvalue is None:
+            largest_eigenvalue = self._largest_eigenvalues(
+                infection_matrix[None], self.population_vector
+            )[0]
+        model = copy(self)
+        model.infection_matrix = read_only_array(infection_matrix)
+        model.largest_eigenvalue = largest_eigenvalue
+        model.im_beta_list = np.real(
+            np.linspace(self.beta_list[0], self.beta_list[2], 20) / largest_eigenvalue
+        )
+        return model
+
+    def with_capacity_smoothing(self, width=None):
+        """copy of the model with the kinks of the capacity limits of the interventions and the ICU smoothed out over width people, see smooth_minimum
+
+        Each smoothed flow stays below the hard one by at most width / 2 people a day, so the solver takes bigger
+        steps when a capacity binds at the cost of that much error at the switch.
+        """
+        if width is None:
+            width = Config.capacity_smoothing_params["width"]
+        assert width >= 0, "the smoothing width can't be negative"
+        model = copy(self)
+        model.capacity_smoothing = float(width)
+        return model
+
+    def capacity_minimum(self, a, b):
+        """minimum of a capacity limit, smoothed when capacity_smoothing is on, a is never negative"""
+        if not self.capacity_smoothing:
+            return np.minimum(a, b)
+        return smooth_minimum(
+            a, b, self.capacity_smoothing / self.state_population_size()
+        )
+
+    def state_population_size(self):
+        """number of people the states of the equations are fractions of, a scalar or an array broadcast against the (draws, 1) totals of the states"""
+        return self.population_size
+
+    @staticmethod
+    def _age_labels(age_limits):
+        """labels of the age compartments between the limits, the last one is open ended"""
+        return [
+            f"{low}_{high - 1}" for low, high in zip(age_limits[:-2], age_limits[1:-1])
+        ] + [f"{age_limits[-2]}_above"]
+
+    def with_age_limits(self, age_limits):
+        """copy of the model on coarser age compartments, each a union of the age compartments of the model
+
+        The parameters are aggregated exactly for the epidemic at the start, when the susceptibles are spread like
+        the population and the infections like the leading eigenvector of the next generation matrix of the model,
+        weighted by how infectious the symptomatic and asymptomatic people of every age compartment are. The contacts
+        of a coarse compartment are the population weighted mean of the ones merged and the contacts with a coarse
+        compartment the infection weighted mean, every probability is weighted by the infections it applies to so the
+        expected numbers of symptomatic, hospitalised and critical people are kept, and the next generation matrix
+        keeps its largest eigenvalue so the draws of beta carry over. age_weights holds the population share and
+        infection_weights the infection share of every compartment of the model within its coarse compartment.
+        """
+        age_limits = np.asarray(age_limits, dtype=int)
+        assert (
+            age_limits[0] == self.age_limits[0]
+            and age_limits[-1] == self.age_limits[-1]
+            and np.isin(age_limits, self.age_limits).all()
+            and np.all(np.diff(age_limits) > 0)
+        ), "the age compartments are unions of the ones of the model"
+        # (coarse, fine) membership of the compartments of the model
+        coarse = np.searchsorted(age_limits, self.age_limits[:-1], side="right") - 1
+        membership = (
+            coarse[None, :] == np.arange(len(age_limits) - 1)[:, None]
+        ).astype(float)
+
+        def shares(values):
+            totals = membership @ values
+            return membership * values / np.where(totals > 0, totals, 1)[:, None]
+
+        p_symptomatic = np.asarray(self.p_symptomatic)
+        p_hosp_given_symptomatic = np.asarray(self.p_hosp_given_symptomatic)
+        infectiousness = p_symptomatic + self.AsymptInfectiousFactor * (
+            1 - p_symptomatic
+        )
+        eigenvalues, eigenvectors = np.linalg.eig(
+            0.01
+            * self.population_vector[:, None]
+            * self.infection_matrix
+            * infectiousness[None, :]
+        )
+        # the leading eigenvector of a nonnegative matrix is nonnegative up to its sign
+        infections = np.abs(np.real(eigenvectors[:, np.argmax(np.real(eigenvalues))]))
+        age_weights = shares(self.population_vector)
+        infection_weights = shares(infections)
+
+        def weighted_mean(values, weights):
+            totals = infection_weights @ weights
+            return (infection_weights @ (weights * values)) / np.where(
+                totals > 0, totals, 1
             )
-        transformed_matrix = np.zeros((n_categories, n_categories))
-        for i in range(n_categories):
-            for j in range(n_categories):
-                sump = sum(p[ind_limits[i] : ind_limits[i + 1]])
-                b = (
-                    contact_matrix[
-                        ind_limits[i] : ind_limits[i + 1],
-                        ind_limits[j] : ind_limits[j + 1],
-                    ]
-                    * np.array(p[ind_limits[i] : ind_limits[i + 1]]).transpose()
-                )
-                v1 = b.sum() / sump
-                transformed_matrix[i, j] = v1
-        return transformed_matrix
+
+        model = copy(self)
+        model.age_limits = read_only_array(age_limits)
+        model.ages = self._age_labels(age_limits)
+        model.age_categories = len(model.ages)
+        model.age_weights = read_only_array(age_weights)
+        model.infection_weights = read_only_array(infection_weights)
+        model.population_vector = read_only_array(membership @ self.population_vector)
+        model.p_symptomatic = read_only_array(
+            weighted_mean(p_symptomatic, np.ones(self.age_categories))
+        )
+        model.p_hosp_given_symptomatic = read_only_array(
+            weighted_mean(p_hosp_given_symptomatic, p_symptomatic)
+        )
+        model.p_critical_given_hospitalised = read_only_array(
+            weighted_mean(
+                np.asarray(self.p_critical_given_hospitalised),
+                p_symptomatic * p_hosp_given_symptomatic,
+            )
+        )
+        model.contact_weights = read_only_array(shares(infections * infectiousness))
+        return model.with_infection_matrix(
+            self.aggregate_infection_matrix(self.infection_matrix, model)
+        )
+
+    @staticmethod
+    def aggregate_infection_matrix(infection_matrix, coarse_model):
+        """infection matrix of the model on the coarse age compartments of a copy made by with_age_limits"""
+        return (
+            coarse_model.age_weights @ infection_matrix @ coarse_model.contact_weights.T
+        )
 
     @staticmethod
     def _generate_infection_matrix(contact_matrix, population_vector, beta_list):
@@ -159,19 +353,10 @@ class DeterministicCompartmentalModel(Model):
     def load_model_parameters(self):
         # in toatl there are 11 disease compartments
         self.number_compartments = 11
-        # 8 age compartments with 10 year gap in each
-        self.ages = [
-            "0_9",
-            "10_19",
-            "20_29",
-            "30_39",
-            "40_49",
-            "50_59",
-            "60_69",
-            "70_above",
-        ]
+        # 8 age compartments with 10 year gap in each, the camp population comes in these
+        self.age_limits = read_only_array([0, 10, 20, 30, 40, 50, 60, 70, 80], int)
+        self.ages = self._age_labels(self.age_limits)
         self.age_categories = len(self.ages)
-        self.age_limits = np.array([0, 10, 20, 30, 40, 50, 60, 70, 80], dtype=int)
         # 11 disease state compartments
         self.calculated_categories = [
             "S",
@@ -212,12 +397,23 @@ class DeterministicCompartmentalModel(Model):
         removal_rate = 1 / (float(self.Infectious_period))
         self.beta_list = [R_0 * removal_rate for R_0 in self.R_0_list]
 
-        self.p_symptomatic = np.array(self.p_symptomatic)
-        self.p_hosp_given_symptomatic = np.array(self.p_hosp_given_symptomatic)
-        self.p_critical_given_hospitalised = np.array(
+        self.p_symptomatic = read_only_array(self.p_symptomatic)
+        self.p_hosp_given_symptomatic = read_only_array(self.p_hosp_given_symptomatic)
+        self.p_critical_given_hospitalised = read_only_array(
             self.p_critical_given_hospitalised
         )
 
+    def epidemic_parameter_distribution(self, scale=1):
+        """mean and standard deviation of the normal draws of R0 and the periods in days"""
+        return {
+            "R0": (self.R_0_list[1], np.std(self.R_0_list)),
+            "LatentPeriod": (self.Latent_period, scale),
+            "RemovalPeriod": (self.Infectious_period, scale),
+            "HospPeriod": (self.Hosp_period, scale),
+            "DeathICUPeriod": (self.Death_period_withICU, scale),
+            "DeathNoICUPeriod": (self.Death_period, scale),
+        }
+
     def generate_epidemic_parameter_ranges(
         self, num_iterations, scale=1, lb=1, seed=42
     ):
@@ -225,26 +421,14 @@ class DeterministicCompartmentalModel(Model):
         # TODO: make this process deterministic so everytime the instantiation of the runner object is exactly the same use linspace rather than normal distribution if we want to break up the tasks into smaller chunks for distributed processing
         generated_params = {}
         np.random.seed(seed)
-        generated_params["R0"] = np.random.normal(
-            self.R_0_list[1], np.std(self.R_0_list), num_iterations
-        )
-        generated_params["LatentPeriod"] = np.random.normal(
-            self.Latent_period, scale, num_iterations
-        )
-        generated_params["RemovalPeriod"] = np.random.normal(
-            self.Infectious_period, scale, num_iterations
-        )
-        generated_params["HospPeriod"] = np.random.normal(
-            self.Hosp_period, scale, num_iterations
-        )
-        generated_params["DeathICUPeriod"] = np.random.normal(
-            self.Death_period_withICU, scale, num_iterations
-        )
-        generated_params["DeathNoICUPeriod"] = np.random.normal(
-            self.Death_period, scale, num_iterations
-        )
+        for name, (mean, std) in self.epidemic_parameter_distribution(scale).items():
+            generated_params[name] = np.random.normal(mean, std, num_iterations)
         generated_params_df = pd.DataFrame(generated_params)
         generated_params_df[generated_params_df <= 1] = lb
+        return self.derive_epidemic_rates(generated_params_df)
+
+    def derive_epidemic_rates(self, generated_params_df):
+        """add the rates and beta the model runs on to a frame of R0 and periods in days"""
         generated_params_df["latentRate"] = 1 / generated_params_df["LatentPeriod"]
         generated_params_df["removalRate"] = 1 / generated_params_df["RemovalPeriod"]
         generated_params_df["hospRate"] = 1 / generated_params_df["HospPeriod"]
@@ -268,6 +452,28 @@ class DeterministicCompartmentalModel(Model):
         # if wasn't in any of these time interval
         return False
 
+    def draw_engine(
+        self,
+        beta,
+        latent_rate,
+        removal_rate,
+        hosp_rate,
+        death_rate_ICU,
+        death_rate_no_ICU,
+    ):
+        """LinearSplitEngine of the equations of a single draw"""
+        rates = (
+            beta,
+            latent_rate,
+            removal_rate,
+            hosp_rate,
+            death_rate_ICU,
+            death_rate_no_ICU,
+        )
+        return LinearSplitEngine(
+            self, pd.DataFrame([dict(zip(DRAW_RATE_COLUMNS, rates))])
+        )
+
     def ode_equations(
         self,
         t,
@@ -279,194 +485,603 @@ class DeterministicCompartmentalModel(Model):
         death_rate_ICU,
         death_rate_no_ICU,
         scenario,
+        stochastic_mask=None,
     ):
-        """ t is the time step and y is the value of the eqaution at each time step and this equation is run through at each integration time step"""
-        # extract scenario dict for this time step:
-        scenario_dict = scenario.intervention_params_at_time_t(t)
-        # print(scenario_dict)
-        y2d = y.reshape(self.age_categories, self.number_compartments).T
-        # the gradients of number of people with respect to time
-        dydt2d = np.zeros(y2d.shape)
-
-        # some calculations upfront to make the differential equations look clean later
-        S_vec = y2d[Config.compartment_index["S"], :]
-        E_vec = y2d[Config.compartment_index["E"], :]
-        I_vec = y2d[Config.compartment_index["I"], :]
-        H_vec = y2d[Config.compartment_index["H"], :]
-        A_vec = y2d[Config.compartment_index["A"], :]
-        C_vec = y2d[Config.compartment_index["C"], :]
-        Q_vec = y2d[Config.compartment_index["Q"], :]
-
-        E_latent = latent_rate * y2d[Config.compartment_index["E"], :]
-        I_removed = removal_rate * I_vec
-        Q_quarantined = self.quarant_rate * Q_vec
-
-        total_I = sum(I_vec)
-        total_H = sum(H_vec)
-
-        # Intervention: removing high risk population
-        first_high_risk_category_n = (
-            self.age_categories - scenario_dict["first_high_risk_category_n"]
+        """t is the time step and y is the value of the eqaution at each time step and this equation is run through at each integration time step
+
+        The equations are compiled from the specification of the model into an engine that is kept for the next calls
+        with the same rates, the integrators compile the engine of their draws once per run. In hybrid runs the flows of the infection chain (S -> E -> I/A -> removed) of the age
+        compartments flagged in stochastic_mask are left out and advanced by hybrid_leap instead.
+        """
+        if stochastic_mask is not None:
+            stochastic_mask = tuple(np.asarray(stochastic_mask, dtype=bool).tolist())
+        engine = _cached_draw_engine(
+            self,
+            (
+                beta,
+                latent_rate,
+                removal_rate,
+                hosp_rate,
+                death_rate_ICU,
+                death_rate_no_ICU,
+            ),
+            stochastic_mask,
         )
-        S_removal = sum(y2d[Config.compartment_index["S"]], first_high_risk_category_n)
-        remove_high_risk_people = min(S_removal, scenario_dict["remove_high_risk_rate"])
+        return engine.rhs(t, y, scenario)
 
-        # Intervention: removing symptomatic individuals
-        # these are put into Q ('quarantine');
-        quarantined_sicks_sendback = 0
-        if (scenario_dict["remove_symptomatic_rate"] > 0) and (
-            scenario_dict["isolation_capacity"] > 0
+    @staticmethod
+    def ensemble_scenario_dict(scenario, t, param_overrides=None):
+        """parameters of a scenario at time t with the overrides of an ensemble run"""
+        scenario_dict = scenario.intervention_params_at_time_t(t)
+        if param_overrides:
+            scenario_dict = dict(scenario_dict, **param_overrides)
+        return scenario_dict
+
+    def high_risk_offsite(
+        self, S_vec, first_high_risk_category_n, remove_high_risk_rate
+    ):
+        """people moved offsite a day out of the susceptibles S_vec, a (..., age categories) array, the removal rate is taken from the oldest first_high_risk_category_n age compartments in proportion to their susceptibles, 0 while nobody is removed
+
+        The number of compartments and the rate are scalars or broadcast against S_vec without its age axis, like (draws, 1) arrays.
+        """
+        if not isinstance(first_high_risk_category_n, np.ndarray) and not isinstance(
+            remove_high_risk_rate, np.ndarray
         ):
-            remove_symptomatic_rate = min(
-                total_I, scenario_dict["remove_symptomatic_rate"]
+            # the same removal for every draw takes a slice of the age compartments
+            if not remove_high_risk_rate > 0:
+                return 0
+            S_high_risk = S_vec[..., self.age_categories - first_high_risk_category_n :]
+            S_removal = S_high_risk.sum(axis=-1, keepdims=True)
+            if not S_removal.all():
+                S_removal = np.where(S_removal > 0, S_removal, 1)
+            offsite = np.zeros_like(S_vec)
+            offsite[..., self.age_categories - first_high_risk_category_n :] = (
+                self.capacity_minimum(S_removal, remove_high_risk_rate)
+                / S_removal
+                * S_high_risk
             )
-            # check on the capacity as people are coming out of quarantine everyday
-            # Q_occupied = sum(Q_vec - Q_quarantined)
-            total_Q = sum(Q_vec)
-            Q_left_over_capacity = scenario_dict["isolation_capacity"] - total_Q
-            remove_symptomatic_rate = min(Q_left_over_capacity, remove_symptomatic_rate)
-            quarantine_sicks = (
-                remove_symptomatic_rate / total_I
-            ) * I_vec  # no age bias in who is moved
+            return offsite
+        remove_high_risk_rate = np.asarray(remove_high_risk_rate, dtype=float)
+        if not remove_high_risk_rate.any():
+            return 0
+        high_risk = np.arange(self.age_categories) >= self.age_categories - np.asarray(
+            first_high_risk_category_n
+        )
+        S_high_risk = high_risk * S_vec
+        S_removal = S_high_risk.sum(axis=-1, keepdims=True)
+        remove_high_risk_people = self.capacity_minimum(
+            S_removal, remove_high_risk_rate
+        )
+        return (
+            remove_high_risk_people
+            / np.where(S_removal > 0, S_removal, 1)
+            * S_high_risk
+        )
+
+    def infection_pressure(self, scenario_dict, I_vec, A_vec):
+        """infections a susceptible of every age compartment gets a day per unit of beta from the infectious (draws, age categories) I_vec and A_vec"""
+        # Intervention: shielding and transmission reduction via better hygiene
+        return scenario_dict["transmission_reduction_factor"] * (
+            (I_vec + self.AsymptInfectiousFactor * A_vec)
+            @ scenario_dict["infection_matrix"].T
+        )
+
+    def ensemble_nonlinear_flows(self, scenario_dict, states, rates):
+        """flows of the equations that aren't linear in the state: infections, the removals limited by the interventions and the flows limited by the ICU capacity, as (draws, age categories) arrays from the (draws, age categories) states of S, I, A, H, C and Q, the flows that are off are 0
+
+        rates are the (draws, 1) beta of every draw and the ICU rates of covid_hook_parameters.
+        """
+        S_vec, I_vec, A_vec, H_vec, C_vec, Q_vec = (
+            states[code] for code in ["S", "I", "A", "H", "C", "Q"]
+        )
+
+        # Intervention: removing symptomatic individuals
+        remove_symptomatic_rate = scenario_dict["remove_symptomatic_rate"]
+        isolation_capacity = scenario_dict["isolation_capacity"]
+        # a bool for the parameters of a scenario, a (draws, 1) array for the ones set per draw
+        isolating = (remove_symptomatic_rate > 0) & (isolation_capacity > 0)
+        if isinstance(isolating, np.ndarray):
+            some_isolating, all_isolating = isolating.any(), isolating.all()
         else:
-            # the intervention is off
-            quarantine_sicks = 0
-            if sum(Q_vec - Q_quarantined) > 0:
-                # there are some people in the quarantined who are still infectious (not moved to hospitalisation yet
-                quarantined_sicks_sendback = Q_vec - Q_quarantined
+            some_isolating = all_isolating = isolating
+        quarantine_sicks = quarantined_sicks_sendback = 0
+        if some_isolating:
+            total_I = I_vec.sum(axis=1, keepdims=True)
+            removed = self.capacity_minimum(
+                self.capacity_minimum(total_I, remove_symptomatic_rate),
+                isolation_capacity - Q_vec.sum(axis=1, keepdims=True),
+            )
+            if all_isolating and total_I.all():
+                quarantine_sicks = removed / total_I * I_vec
+            else:
+                quarantine_sicks = (
+                    np.where(isolating & (total_I > 0), removed, 0)
+                    / np.where(total_I > 0, total_I, 1)
+                    * I_vec
+                )
+        # the isolated who are still infectious go back while the intervention is off
+        if not all_isolating and Q_vec.any():
+            quarantined_sicks_sendback = np.where(
+                isolating, 0, (1 - self.quarant_rate) * Q_vec
+            )
 
         # ICU capacity
-        if total_H > 0:  # can't divide by 0
-            hospitalized_on_icu = scenario_dict["icu_capacity"] / total_H * H_vec
-            # ICU beds allocated on a first come, first served basis based on the numbers in hospital
+        icu_capacity = scenario_dict["icu_capacity"]
+        total_H = H_vec.sum(axis=1, keepdims=True)
+        if total_H.all():
+            hospitalized_on_icu = H_vec * icu_capacity / total_H
         else:
-            hospitalized_on_icu = np.full(
-                self.age_categories,
-                (scenario_dict["icu_capacity"] / self.population_size),
+            hospitalized_on_icu = np.where(
+                total_H > 0,
+                icu_capacity / np.where(total_H > 0, total_H, 1) * H_vec,
+                icu_capacity / self.state_population_size(),
             )
 
-        # Laying out differential equations:
-        # S
-        # Intervention: shielding
-        infection_I = np.dot(scenario_dict["infection_matrix"], I_vec)
-        infection_A = np.dot(scenario_dict["infection_matrix"], A_vec)
-        infection_total = infection_I + self.AsymptInfectiousFactor * infection_A
-        offsite = remove_high_risk_people / S_removal * S_vec
-        # Intervention: transimission reduction via better hygiene
-        dydt2d[Config.compartment_index["S"], :] = (
-            -scenario_dict["transmission_reduction_factor"]
-            * beta
+        return {
+            "newly_exposed": rates["beta"]
             * S_vec
-            * infection_total
-            - offsite
-        )
+            * self.infection_pressure(scenario_dict, I_vec, A_vec),
+            # Intervention: removing high risk population
+            "offsite": self.high_risk_offsite(
+                S_vec,
+                scenario_dict["first_high_risk_category_n"],
+                scenario_dict["remove_high_risk_rate"],
+            ),
+            "quarantine_sicks": quarantine_sicks,
+            "quarantined_sicks_sendback": quarantined_sicks_sendback,
+            "recovered_on_icu": rates["icu_recovery_rate"]
+            * self.capacity_minimum(C_vec, hospitalized_on_icu),
+            # beds freed by the deaths in ICU are taken up straight away
+            "icu_cared": self.capacity_minimum(
+                rates["icu_need_rate"] * H_vec,
+                hospitalized_on_icu - rates["icu_stay"] * C_vec,
+            ),
+        }
 
-        # E
-        dydt2d[Config.compartment_index["E"], :] = (
-            scenario_dict["transmission_reduction_factor"]
-            * beta
-            * S_vec
-            * infection_total
-            - E_latent
+    def integrate_ensemble(
+        self,
+        scenario,
+        generated_params_df,
+        y0,
+        time_range,
+        param_overrides=None,
+        rtol=1e-6,
+        atol=1e-12,
+        method="RK45",
+        reduced_state=False,
+    ):
+        """integrate every draw of generated_params_df together as one vectorised system sharing the steps, returns the states as a (draws, compartments * age categories, time) array
+
+        The right hand side is compiled from the specification of the model by LinearSplitEngine. The explicit
+        Runge-Kutta method "RK45" is cheap per step but the system is stiff: the fastest rates (the isolated and the
+        critical leave within days) and the switches of the capacity limits bound its step size, and the draws share
+        the steps of the stiffest one, so it slows down with short periods, hard capacity limits and many draws. The
+        implicit "BDF" is not bound by the fast rates, it solves with the block diagonal Jacobian of the engine as a
+        sparse matrix of one block per draw, but the Jacobians and the factorisations cost more than the steps saved
+        while the switches of the capacity limits set the step, as on the camp baselines. method "ETD2RK" integrates the linear and nonlinear parts
+        separately with the exponential integrator of the engine in fixed steps, rtol and atol are then unused.
+
+        With reduced_state=True only the compartments the dynamics depend on are integrated and the downstream ones
+        (U, R, D and O) are recovered from their inflows over the dense output of the solver. The system is then
+        smaller and leaves out the switches of the ICU capacity in U, so both methods take fewer and cheaper steps.
+        """
+        if scenario.reactive:
+            raise NotImplementedError(
+                "reactive scenarios switch at different times for every draw"
+            )
+        num_draws = len(generated_params_df)
+        if param_overrides is not None:
+            param_overrides = {
+                key: np.asarray(value, dtype=float).reshape(-1, 1)
+                if np.ndim(value)
+                else value
+                for key, value in param_overrides.items()
+            }
+        engine = LinearSplitEngine(self, generated_params_df)
+        if method == "ETD2RK":
+            if reduced_state:
+                raise NotImplementedError(
+                    "the exponential integrator has no dense output to recover the downstream compartments from"
+                )
+            return engine.integrate(scenario, y0, time_range, param_overrides)
+        # the equations integrated and the states of a draw they run on
+        system, mask = engine, np.ones(len(y0), dtype=bool)
+        if reduced_state:
+            system, mask = engine.reduced(), engine.dynamic_mask()
+        solver_options = dict()
+        if method == "BDF":
+            num_states = np.count_nonzero(mask)
+
+            def jacobian(t, y, scenario, param_overrides):
+                return bsr_matrix(
+                    (
+                        system.jacobian(t, y, scenario, param_overrides),
+                        np.arange(num_draws),
+                        np.arange(num_draws + 1),
+                    ),
+                    shape=(num_draws * num_states, num_draws * num_states),
+                ).tocsc()
+
+            solver_options["jac"] = jacobian
+        elif method != "RK45":
+            raise NotImplementedError(f"ensemble method {method} is not supported")
+        solution = solve_ivp(
+            system.rhs,
+            (time_range[0], time_range[-1]),
+            np.tile(y0[mask], num_draws),
+            method=method,
+            t_eval=time_range,
+            dense_output=reduced_state,
+            rtol=rtol,
+            atol=atol,
+            args=(scenario, param_overrides),
+            **solver_options,
         )
-
-        # I
-        dydt2d[Config.compartment_index["I"], :] = (
-            self.p_symptomatic * E_latent
-            - I_removed
-            - quarantine_sicks
-            + quarantined_sicks_sendback
+        if solution.status == -1:
+            raise RuntimeError(f"ensemble ode solver failed: {solution.message}")
+        if not reduced_state:
+            return solution.y.reshape(num_draws, len(y0), len(time_range))
+        node_times = engine.quadrature_times(time_range)
+        return engine.recover_downstream(
+            y0,
+            time_range,
+            solution.y,
+            solution.sol(node_times.ravel()).reshape((-1,) + node_times.shape),
+            scenario,
+            param_overrides,
         )
 
-        # A
-        A_removed = removal_rate * A_vec
-        dydt2d[Config.compartment_index["A"], :] = (
-            1 - self.p_symptomatic
-        ) * E_latent - A_removed
-
-        # H
-        dydt2d[Config.compartment_index["H"], :] = (
-            self.p_hosp_given_symptomatic * I_removed
-            - hosp_rate * H_vec
-            + death_rate_ICU
-            * (1 - self.death_prob_with_ICU)
-            * np.minimum(C_vec, hospitalized_on_icu)  # recovered from ICU
-            + self.p_hosp_given_symptomatic * Q_quarantined
-            # proportion of removed people who were hospitalised once returned
+    def run_ensemble(
+        self,
+        scenario,
+        generated_params_df=None,
+        t_stop=200,
+        initial_exposed=1,
+        initial_symp=1,
+        initial_asymp=1,
+        param_overrides=None,
+        chunk_size=1000,
+        rtol=1e-6,
+        atol=1e-12,
+        method="RK45",
+        reduced_state=False,
+    ):
+        """run_single_simulation for the whole ensemble at once, chunks of draws are integrated together instead of one run_model call per draw"""
+        if generated_params_df is None:
+            generated_params_df = self.generate_epidemic_parameter_ranges(
+                self.num_iterations
+            )
+        time_range = np.arange(t_stop + 1)
+        y_out = self.integrate_ensemble_chunks(
+            scenario,
+            generated_params_df,
+            self.initial_state_vector(initial_exposed, initial_symp, initial_asymp),
+            time_range,
+            param_overrides,
+            chunk_size,
+            rtol,
+            atol,
+            method,
+            reduced_state,
         )
-
-        # Intervention Critical care (ICU)
-        deaths_on_icu = death_rate_ICU * C_vec
-        without_deaths_on_icu = C_vec - deaths_on_icu
-        needing_care = (
-            hosp_rate * self.p_critical_given_hospitalised * H_vec
-        )  # number needing care
-
-        # number who get icu care (these entered category C)
-        # print(f"at time {t} the hospitalized_on_icu value is {hospitalized_on_icu*20000}")
-        # print(f"at time {t} the without_deaths_on_icu value is {without_deaths_on_icu*20000}")
-        icu_cared = np.minimum(
-            needing_care, hospitalized_on_icu - without_deaths_on_icu
+        simulation_result_frame = self.parse_ensemble_output(
+            y_out, time_range, generated_params_df
         )
+        simulation_result_frame.attrs["failed_draws"] = []
+        return simulation_result_frame
 
-        # amount entering is minimum of: amount of beds available**/number needing it
-        # **including those that will be made available by new deaths
-        # without ICU treatment
-        dydt2d[Config.compartment_index["C"], :] = icu_cared - deaths_on_icu
-
-        # Uncared - no ICU
-        deaths_without_icu = (
-            death_rate_no_ICU * y2d[Config.compartment_index["U"], :]
-        )  # died without ICU treatment (all cases that don't get treatment die)
-        dydt2d[Config.compartment_index["U"], :] = (
-            needing_care - icu_cared - deaths_without_icu
-        )  # without ICU treatment
-
-        # R
-        # proportion of removed people who recovered once returned
-        dydt2d[Config.compartment_index["R"], :] = (
-            (1 - self.p_hosp_given_symptomatic) * I_removed
-            + A_removed
-            + hosp_rate * (1 - self.p_critical_given_hospitalised) * H_vec
-            + (1 - self.p_hosp_given_symptomatic) * Q_quarantined
+    def integrate_ensemble_chunks(
+        self,
+        scenario,
+        generated_params_df,
+        y0,
+        time_range,
+        param_overrides=None,
+        chunk_size=1000,
+        rtol=1e-6,
+        atol=1e-12,
+        method="RK45",
+        reduced_state=False,
+    ):
+        """integrate_ensemble over chunks of at most chunk_size draws, the states of all the draws come as one array"""
+        y_out = []
+        for chunk_start in range(0, len(generated_params_df), chunk_size):
+            chunk = slice(chunk_start, chunk_start + chunk_size)
+            chunk_overrides = None
+            if param_overrides is not None:
+                chunk_overrides = {
+                    key: value[chunk] if np.ndim(value) else value
+                    for key, value in param_overrides.items()
+                }
+            y_out.append(
+                self.integrate_ensemble(
+                    scenario,
+                    generated_params_df.iloc[chunk],
+                    y0,
+                    time_range,
+                    chunk_overrides,
+                    rtol,
+                    atol,
+                    method,
+                    reduced_state,
+                )
+            )
+        return np.concatenate(y_out)
+
+    def sensitivity_engine(self, rates):
+        """LinearSplitEngine of the draws sensitivity_equations evaluates, one with the rates of a run and one with twice its beta"""
+        draw_rates = dict(rates[DRAW_RATE_COLUMNS])
+        return LinearSplitEngine(
+            self,
+            pd.DataFrame([draw_rates, dict(draw_rates, beta=2 * draw_rates["beta"])]),
         )
 
-        # D
-        dydt2d[Config.compartment_index["D"], :] = (
-            deaths_without_icu
-            + self.death_prob_with_ICU
-            * deaths_on_icu  # died despite attempted ICU treatment
+    def sensitivity_equations(self, t, y, engine, scenario):
+        """ode_equations together with the cumulative symptomatic infections and the forward sensitivities of both with respect to beta, y holds the states, the cumulative infections and then their sensitivities and engine is the sensitivity_engine of the rates"""
+        beta = engine.draw_rates["beta"][0, 0]
+        latent_rate = engine.draw_rates["latentRate"][0, 0]
+        num_states = self.number_compartments * self.age_categories
+        states, sensitivities = y[: num_states + 1], y[num_states + 1 :]
+        state_sensitivities = sensitivities[:num_states]
+        # the equations are linear in beta so its derivative is the difference with the draw of twice beta, and the
+        # jacobian of the engine is exact so the sensitivities don't depend on a step
+        both_states = np.tile(states[:num_states], 2)
+        dydt = engine.rhs(t, both_states, scenario).reshape(2, num_states)
+        jacobian = engine.jacobian(t, both_states, scenario)[0]
+        exposed = slice(
+            Config.compartment_index["E"], num_states, self.number_compartments
         )
-
-        # O
-        dydt2d[Config.compartment_index["O"], :] = offsite
-
-        # Q
-        dydt2d[Config.compartment_index["Q"], :] = (
-            quarantine_sicks - Q_quarantined - quarantined_sicks_sendback
+        return np.concatenate(
+            [
+                dydt[0],
+                [np.sum(self.p_symptomatic * latent_rate * states[exposed])],
+                jacobian @ state_sensitivities + (dydt[1] - dydt[0]) / beta,
+                [
+                    np.sum(
+                        self.p_symptomatic * latent_rate * state_sensitivities[exposed]
+                    )
+                ],
+            ]
         )
 
-        # here the ICU implementation involves as np.minimum TODO: simulate an experiment for the people needing care below the the actual ICU capacity and observe if there is any dubious behaviour
-
-        return dydt2d.T.reshape(y.shape)
+    def calibration_rates(self, r0):
+        """rates of a run at the central periods of the epidemic parameters with the given R0"""
+        return self.derive_epidemic_rates(
+            pd.DataFrame(
+                {
+                    "R0": [float(r0)],
+                    "LatentPeriod": [float(self.Latent_period)],
+                    "RemovalPeriod": [float(self.Infectious_period)],
+                    "HospPeriod": [float(self.Hosp_period)],
+                    "DeathICUPeriod": [float(self.Death_period_withICU)],
+                    "DeathNoICUPeriod": [float(self.Death_period)],
+                }
+            )
+        ).iloc[0]
 
-    def run_model(
+    def expected_counts(
         self,
+        r0,
+        reporting_fraction,
+        num_periods,
         scenario,
-        t_stop=200,
-        r0=None,
-        beta=None,
-        latent_rate=None,
-        removal_rate=None,
-        hosp_rate=None,
-        death_rate_ICU=None,
-        death_rate_no_ICU=None,
-        initial_exposed=0,
-        initial_symp=0,
-        initial_asymp=0,
-        intergrator_type="vode",
+        initial_exposed=1,
+        initial_symp=1,
+        initial_asymp=1,
+        days_per_period=None,
     ):
-        """high level function for running the model via differential equation solver from scipy"""
+        """reported cases and deaths expected in every period and their derivatives with respect to R0 and the reporting fraction, as arrays of shape (periods,) and (periods, 2)"""
+        if scenario.reactive:
+            raise NotImplementedError(
+                "the sensitivities of reactive scenarios jump at their switches"
+            )
+        if days_per_period is None:
+            days_per_period = Config.calibration_params["days_per_period"]
+        rates = self.calibration_rates(r0)
+        num_states = self.number_compartments * self.age_categories
+        y0 = np.zeros(2 * (num_states + 1))
+        y0[:num_states] = self.initial_state_vector(
+            initial_exposed, initial_symp, initial_asymp
+        )
+        time_range = days_per_period * np.arange(num_periods + 1)
+        solution = solve_ivp(
+            self.sensitivity_equations,
+            (time_range[0], time_range[-1]),
+            y0,
+            method="RK45",
+            t_eval=time_range,
+            rtol=1e-6,
+            atol=1e-12,
+            args=(self.sensitivity_engine(rates), scenario),
+        )
+        if solution.status == -1:
+            raise RuntimeError(f"ode solver failed: {solution.message}")
+        deaths = slice(
+            Config.compartment_index["D"], num_states, self.number_compartments
+        )
+        symptomatic, symptomatic_sensitivity = solution.y[num_states], solution.y[-1]
+        dead = solution.y[deaths].sum(axis=0)
+        dead_sensitivity = solution.y[num_states + 1 :][deaths].sum(axis=0)
+        # beta is proportional to R0
+        dbeta_dr0 = rates["beta"] / rates["R0"]
+        new_symptomatic = self.population_size * np.diff(symptomatic)
+        cases = reporting_fraction * new_symptomatic
+        cases_gradient = np.column_stack(
+            [
+                reporting_fraction
+                * self.population_size
+                * np.diff(symptomatic_sensitivity)
+                * dbeta_dr0,
+                new_symptomatic,
+            ]
+        )
+        deaths_expected = self.population_size * np.diff(dead)
+        deaths_gradient = np.column_stack(
+            [
+                self.population_size * np.diff(dead_sensitivity) * dbeta_dr0,
+                np.zeros(num_periods),
+            ]
+        )
+        return cases, cases_gradient, deaths_expected, deaths_gradient
+
+    def calibration_loss(self, params, observed, scenario, loss="poisson", **kwargs):
+        """loss of the expected counts against the observed ones and its gradient with respect to (R0, reporting fraction)
+
+        observed has a Period column numbering the periods from 1 (weeks by default) and the Cases and/or Deaths counted
+        in each, missing counts are left out. The loss is the Poisson negative log-likelihood (up to a constant) or the
+        sum of squares. The information matrix of the fit comes back as well.
+        """
+        r0, reporting_fraction = params
+        periods = observed["Period"].to_numpy(dtype=int) - 1
+        cases, cases_gradient, deaths, deaths_gradient = self.expected_counts(
+            r0, reporting_fraction, periods.max() + 1, scenario, **kwargs
+        )
+        expected, gradients, counts = [], [], []
+        for column, expected_counts, gradient in [
+            ("Cases", cases, cases_gradient),
+            ("Deaths", deaths, deaths_gradient),
+        ]:
+            if column not in observed:
+                continue
+            counted = observed[column].notna().to_numpy()
+            expected.append(expected_counts[periods[counted]])
+            gradients.append(gradient[periods[counted]])
+            counts.append(observed[column].to_numpy(dtype=float)[counted])
+        expected = np.maximum(np.concatenate(expected), 1e-9)
+        gradients = np.concatenate(gradients)
+        counts = np.concatenate(counts)
+        if loss == "poisson":
+            value = np.sum(expected - counts * np.log(expected))
+            gradient = (1 - counts / expected) @ gradients
+            information = gradients.T @ (gradients / expected[:, None])
+        elif loss == "least_squares":
+            residuals = expected - counts
+            value = np.sum(residuals ** 2)
+            gradient = 2 * residuals @ gradients
+            # gauss-newton approximation with the residual variance
+            variance = value / max(len(counts) - len(params), 1)
+            information = gradients.T @ gradients / max(variance, 1e-12)
+        else:
+            raise NotImplementedError(f"loss {loss} is not supported")
+        return value, gradient, information
+
+    def calibration_fit(self, start, observed, scenario, loss="poisson", **kwargs):
+        """L-BFGS-B search for the (R0, reporting fraction) of least calibration_loss from a start"""
+        # local import as the module is only needed for calibrating
+        from scipy.optimize import minimize
+
+        return minimize(
+            lambda params: self.calibration_loss(
+                params, observed, scenario, loss, **kwargs
+            )[:2],
+            start,
+            jac=True,
+            method="L-BFGS-B",
+            bounds=[
+                Config.calibration_params["r0_bounds"],
+                Config.calibration_params["reporting_fraction_bounds"],
+            ],
+        )
+
+    def calibrate(
+        self,
+        observed,
+        scenario=None,
+        loss="poisson",
+        num_starts=None,
+        max_workers=None,
+        num_iterations=None,
+        seed=0,
+        **kwargs,
+    ):
+        """fit R0 and the reporting fraction to observed counts and draw an ensemble of parameters around the fit
+
+        The gradient of the loss comes from the forward sensitivities integrated with the model, every start of a multi
+        start L-BFGS-B search runs in a process of its own as the integrations of the small system are mostly Python
+        that threads would take turns on. Returns the fitted parameters (with their standard errors from the
+        information matrix and the result of every start) and a generated_params_df whose R0 and reporting_fraction
+        are drawn together from the approximate distribution of the fit, which can be passed to the runner. The
+        reporting fraction is left missing when only deaths were observed, as they don't identify it.
+        """
+        # local import as the module is only needed for calibrating
+        from concurrent.futures import ProcessPoolExecutor
+
+        if scenario is None:
+            scenario = DeterministicCompartmentalModelScenario(
+                self.population_size, self.infection_matrix
+            )
+        if scenario.reactive:
+            raise NotImplementedError(
+                "the sensitivities of reactive scenarios jump at their switches"
+            )
+        if num_starts is None:
+            num_starts = Config.calibration_params["num_starts"]
+        if num_iterations is None:
+            num_iterations = self.num_iterations
+        bounds = [
+            Config.calibration_params["r0_bounds"],
+            Config.calibration_params["reporting_fraction_bounds"],
+        ]
+        lower, upper = np.array(bounds).T
+        rng = np.random.default_rng(seed)
+        starts = lower + (upper - lower) * rng.random((num_starts, 2))
+
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            fits = [
+                future.result()
+                for future in [
+                    executor.submit(
+                        self.calibration_fit, start, observed, scenario, loss, **kwargs
+                    )
+                    for start in starts
+                ]
+            ]
+        best = min(fits, key=lambda result: result.fun)
+        _, _, information = self.calibration_loss(
+            best.x, observed, scenario, loss, **kwargs
+        )
+        if "Cases" not in observed:
+            # the reporting fraction is not identified by the deaths alone
+            covariance = np.diag([1 / max(information[0, 0], 1e-12), np.nan])
+        else:
+            covariance = np.linalg.pinv(information)
+        fitted_params = {
+            "R0": best.x[0],
+            "reporting_fraction": best.x[1],
+            "R0_se": np.sqrt(max(covariance[0, 0], 0)),
+            "reporting_fraction_se": np.sqrt(max(covariance[1, 1], 0)),
+            "loss": best.fun,
+            "starts": pd.DataFrame(
+                {
+                    "R0_start": starts[:, 0],
+                    "reporting_fraction_start": starts[:, 1],
+                    "R0": [result.x[0] for result in fits],
+                    "reporting_fraction": [result.x[1] for result in fits],
+                    "loss": [result.fun for result in fits],
+                    "converged": [result.success for result in fits],
+                }
+            ),
+        }
+        generated_params_df = self.generate_epidemic_parameter_ranges(
+            num_iterations, seed=seed
+        )
+        if "Cases" not in observed:
+            draws = np.column_stack(
+                [
+                    rng.normal(best.x[0], fitted_params["R0_se"], num_iterations),
+                    np.full(num_iterations, np.nan),
+                ]
+            )
+        else:
+            draws = rng.multivariate_normal(
+                best.x, covariance, num_iterations, method="eigh"
+            )
+        generated_params_df["R0"] = np.clip(draws[:, 0], *bounds[0])
+        generated_params_df["reporting_fraction"] = np.clip(draws[:, 1], *bounds[1])
+        return fitted_params, self.derive_epidemic_rates(generated_params_df)
+
+    def initial_state_vector(self, initial_exposed=0, initial_symp=0, initial_asymp=0):
+        """state vector at the start of the epidemic with the initial people spread over the age compartments"""
         # initialise the epidemic
         seir_matrix = np.zeros((self.number_compartments, 1))
 
@@ -487,39 +1102,73 @@ class DeterministicCompartmentalModel(Model):
         )
 
         # initial conditions
-        y0 = y_initial.T.reshape(self.number_compartments * self.age_categories)
+        return y_initial.T.reshape(self.number_compartments * self.age_categories)
 
-        sol = (
-            ode(self.ode_equations)
-            .set_f_params(
-                beta,
-                latent_rate,
-                removal_rate,
-                hosp_rate,
-                death_rate_ICU,
-                death_rate_no_ICU,
-                scenario,
-            )
-            .set_integrator(intergrator_type, nsteps=5000)
-        )
+    def run_model(
+        self,
+        scenario,
+        t_stop=200,
+        r0=None,
+        beta=None,
+        latent_rate=None,
+        removal_rate=None,
+        hosp_rate=None,
+        death_rate_ICU=None,
+        death_rate_no_ICU=None,
+        initial_exposed=0,
+        initial_symp=0,
+        initial_asymp=0,
+        intergrator_type="vode",
+        integrator_params=None,
+        time_budget=None,
+        hybrid=False,
+        rng=None,
+        reduced_state=False,
+    ):
+        """high level function for running the model via differential equation solver from scipy, with hybrid=True the age compartments with few people exposed or infectious are advanced stochastically instead, with reduced_state=True the downstream compartments are recovered from their inflows instead of integrated"""
+        y0 = self.initial_state_vector(initial_exposed, initial_symp, initial_asymp)
 
+        if integrator_params is None:
+            integrator_params = {"name": intergrator_type, "nsteps": 5000}
+        f_params = (
+            beta,
+            latent_rate,
+            removal_rate,
+            hosp_rate,
+            death_rate_ICU,
+            death_rate_no_ICU,
+            scenario,
+        )
         time_range = np.arange(t_stop + 1)  # 1 time value per day
 
-        sol.set_initial_value(y0, time_range[0])
-
-        y_out = np.zeros((len(y0), len(time_range)))
-
-        t_sim = 0
-        y_out[:, 0] = sol.y
-        for t in time_range[1:]:
-            if sol.successful():
-                sol.integrate(t)
-                t_sim = t_sim + 1
-                y_out[:, t_sim] = sol.y
-            else:
-                raise RuntimeError("ode solver unsuccessful")
+        if scenario.reactive:
+            if hybrid:
+                raise NotImplementedError(
+                    "hybrid runs are not available for reactive scenarios"
+                )
+            # the switches are kept on a copy of the scenario for this run only
+            run = scenario.start_run(y0)
+            y_out = self.integrate_with_events(
+                run, y0, time_range, f_params, integrator_params, time_budget
+            )
+        elif reduced_state:
+            if hybrid:
+                raise NotImplementedError("hybrid runs integrate the whole state")
+            y_out = self.integrate_reduced(
+                y0, time_range, f_params, integrator_params, time_budget
+            )
+        else:
+            y_out = self.integrate_daily(
+                y0,
+                time_range,
+                f_params,
+                integrator_params,
+                time_budget,
+                hybrid,
+                rng,
+            )
 
-        y_sum = np.zeros((self.number_compartments, t_sim + 1))
+        y_sum = np.zeros((self.number_compartments, len(time_range)))
         for compartment in Config.longname.keys():
             for i in range(self.age_categories):  # age_categories
                 y_sum[Config.compartment_index[compartment], :] += y_out[
@@ -539,9 +1188,309 @@ class DeterministicCompartmentalModel(Model):
             death_rate_ICU,
             death_rate_no_ICU,
         )
+        if scenario.reactive:
+            solution_frame.attrs["switch_times"] = list(run.switch_times)
 
         return solution_frame
 
+    def integrate_daily(
+        self,
+        y0,
+        time_range,
+        f_params,
+        integrator_params,
+        time_budget=None,
+        hybrid=False,
+        rng=None,
+    ):
+        """integrate the equations from one day to the next and return the state of every day with the shape (compartments * age categories, time)"""
+        beta, latent_rate, removal_rate, *_, scenario = f_params
+        # the equations are compiled once for the run and again whenever the stochastic age compartments change
+        engine = self.draw_engine(*f_params[:-1])
+        budget = TimeBudget(time_budget)
+        sol = (
+            ode(budget.bound(engine.rhs))
+            .set_f_params(scenario)
+            .set_integrator(**integrator_params)
+        )
+
+        sol.set_initial_value(y0, time_range[0])
+
+        y_out = np.zeros((len(y0), len(time_range)))
+
+        if hybrid and (rng is None):
+            rng = np.random.default_rng()
+        stochastic_mask = np.zeros(self.age_categories, dtype=bool)
+
+        t_sim = 0
+        y_out[:, 0] = sol.y
+        for t in time_range[1:]:
+            if hybrid:
+                # switch the age compartments between the solver and the stochastic steps for the coming day
+                new_stochastic_mask = self.stochastic_bands(
+                    sol.y, Config.hybrid_model_params["threshold"]
+                )
+                if (new_stochastic_mask != stochastic_mask).any():
+                    y_switch = sol.y
+                    sol = (
+                        ode(
+                            budget.bound(
+                                engine.with_stochastic_mask(new_stochastic_mask).rhs
+                            )
+                        )
+                        .set_f_params(scenario)
+                        .set_integrator(**integrator_params)
+                    )
+                    sol.set_initial_value(
+                        self.integerise_bands(
+                            rng, y_switch, new_stochastic_mask & ~stochastic_mask
+                        ),
+                        t - 1,
+                    )
+                    stochastic_mask = new_stochastic_mask
+            sol.integrate(t)
+            budget.check()
+            if not sol.successful():
+                raise RuntimeError("ode solver unsuccessful")
+            if stochastic_mask.any():
+                y_leaped = self.hybrid_leap(
+                    rng,
+                    sol.y,
+                    stochastic_mask,
+                    scenario.intervention_params_at_time_t(t - 1),
+                    beta,
+                    latent_rate,
+                    removal_rate,
+                )
+                # the solver is only restarted when somebody moved
+                if y_leaped is not None:
+                    sol.set_initial_value(y_leaped, t)
+            t_sim = t_sim + 1
+            y_out[:, t_sim] = sol.y
+
+        return y_out
+
+    def integrate_reduced(
+        self, y0, time_range, f_params, integrator_params, time_budget=None
+    ):
+        """integrate_daily for the states the dynamics depend on only, the downstream compartments (U, R, D and O) are recovered from their inflows over the dense output of the solver, the result has the same shape (compartments * age categories, time)
+
+        The solver runs on the equations of the remaining compartments only, at the tolerances of integrator_params as
+        they are. It stops at the quadrature nodes within every day as well as at the days and reads the states there
+        off its interpolating polynomial without taking extra steps. A single draw is bound by the cost of the
+        nonlinear flows, which stays the same, so the run takes about as long as integrate_daily, the ensembles of
+        integrate_ensemble are where leaving out the downstream compartments pays off.
+        """
+        *rates, scenario = f_params
+        engine = self.draw_engine(*rates)
+        mask = engine.dynamic_mask()
+        budget = TimeBudget(time_budget)
+        sol = (
+            ode(budget.bound(engine.reduced().rhs))
+            .set_f_params(scenario)
+            .set_integrator(**integrator_params)
+        )
+        sol.set_initial_value(y0[mask], time_range[0])
+        # the nodes of every day and then the day itself
+        stops = np.concatenate(
+            [engine.quadrature_times(time_range), time_range[1:, None]], axis=1
+        )
+        stop_states = np.zeros((np.count_nonzero(mask),) + stops.shape)
+        for day, day_stops in enumerate(stops):
+            for k, t in enumerate(day_stops):
+                sol.integrate(t)
+                budget.check()
+                if not sol.successful():
+                    raise RuntimeError("ode solver unsuccessful")
+                stop_states[:, day, k] = sol.y
+        dynamic_states = np.concatenate([y0[mask, None], stop_states[:, :, -1]], axis=1)
+        return engine.recover_downstream(
+            y0, time_range, dynamic_states, stop_states[:, :, :-1], scenario
+        )[0]
+
+    def integrate_with_events(
+        self,
+        scenario,
+        y0,
+        time_range,
+        f_params,
+        integrator_params,
+        time_budget=None,
+    ):
+        """integrate through the switches of a run of a reactive scenario from its start_run, the solver locates each switch as the root of the next condition of the run and restarts from there"""
+        # the tolerances default to the ones of vode
+        solver_options = {
+            "method": "BDF" if integrator_params.get("method") == "bdf" else "LSODA",
+            "rtol": integrator_params.get("rtol", 1e-6),
+            "atol": integrator_params.get("atol", 1e-12),
+        }
+        engine = self.draw_engine(*f_params[:-1])
+        budget = TimeBudget(time_budget)
+        equations = budget.bound(engine.rhs)
+        y_out = np.zeros((len(y0), len(time_range)))
+        y_out[:, 0] = y0
+        t_start, y_start = time_range[0], y0
+        while True:
+            event = scenario.next_event()
+            days_left = time_range[time_range > t_start]
+            sol = solve_ivp(
+                equations,
+                (t_start, time_range[-1]),
+                y_start,
+                t_eval=days_left,
+                events=None if event is None else [event],
+                args=(scenario,),
+                **solver_options,
+            )
+            budget.check()
+            if sol.status == -1:
+                raise RuntimeError("ode solver unsuccessful")
+            y_out[:, np.searchsorted(time_range, sol.t)] = sol.y
+            if sol.status == 0:
+                # reached the end of the time range
+                return y_out
+            t_start, y_start = sol.t_events[0][0], sol.y_events[0][0]
+            scenario.switch(t_start)
+
+    def stochastic_bands(self, y, threshold):
+        """age compartments with fewer than threshold people exposed or infectious"""
+        y2d = y.reshape(self.age_categories, self.number_compartments).T
+        infected = sum(
+            y2d[Config.compartment_index[compartment], :]
+            for compartment in ["E", "I", "A"]
+        )
+        return infected * self.population_size < threshold
+
+    def integerise_bands(self, rng, y, stochastic_mask):
+        """round the people exposed or infectious in the stochastic age compartments to whole people, the difference goes back into S so the population is conserved"""
+        y2d = y.reshape(self.age_categories, self.number_compartments).T.copy()
+        for compartment in ["E", "I", "A"]:
+            people = y2d[Config.compartment_index[compartment], stochastic_mask] * (
+                self.population_size
+            )
+            # rounded up with a probability of the fractional part so the expected number is kept
+            rounded = np.floor(people) + (rng.random(len(people)) < people % 1)
+            y2d[Config.compartment_index[compartment], stochastic_mask] = (
+                rounded / self.population_size
+            )
+            y2d[Config.compartment_index["S"], stochastic_mask] += (
+                people - rounded
+            ) / self.population_size
+        return y2d.T.reshape(y.shape)
+
+    def hybrid_leap(
+        self,
+        rng,
+        y,
+        stochastic_mask,
+        scenario_dict,
+        beta,
+        latent_rate,
+        removal_rate,
+    ):
+        """advance the infection chain of the stochastic age compartments by one day of binomial tau-leaping on whole people, None when nobody moved
+
+        The symptomatic of those age compartments are isolated at the rate per person of the equations, worked out on
+        the infectious of every age compartment and the isolation capacity the isolated leave, so they share the
+        capacity with the ones the solver isolates.
+        """
+        steps_per_day = Config.hybrid_model_params["steps_per_day"]
+        tau = 1 / steps_per_day
+        index = Config.compartment_index
+        people = self.population_size * (
+            y.reshape(self.age_categories, self.number_compartments).T
+        )
+        # E, I and A hold whole people in the stochastic age compartments, S keeps its fractional part
+        S = people[index["S"], stochastic_mask]
+        E, I, A = (
+            np.rint(people[index[compartment], stochastic_mask])
+            for compartment in ["E", "I", "A"]
+        )
+        H_entering = 0
+        R_entering = 0
+        Q_entering = 0
+        isolating = (scenario_dict["remove_symptomatic_rate"] > 0) and (
+            scenario_dict["isolation_capacity"] > 0
+        )
+        # probabilities of leaving E and A in a step and of going E -> I and I -> H when leaving
+        latent_prob, removal_prob = -np.expm1(
+            -tau * np.array([latent_rate, removal_rate])
+        )
+        branch_prob = np.stack(
+            [
+                self.p_symptomatic[stochastic_mask],
+                self.p_hosp_given_symptomatic[stochastic_mask],
+            ]
+        )
+        moved = False
+        for step in range(steps_per_day):
+            infectious = (
+                people[index["I"], :]
+                + self.AsymptInfectiousFactor * people[index["A"], :]
+            )
+            infectious[stochastic_mask] = I + self.AsymptInfectiousFactor * A
+            force_of_infection = (
+                scenario_dict["transmission_reduction_factor"]
+                * beta
+                * np.dot(scenario_dict["infection_matrix"], infectious)[stochastic_mask]
+                / self.population_size
+            )
+            # Intervention: removing symptomatic individuals
+            isolation_rate = 0
+            total_I = (people[index["I"], ~stochastic_mask].sum() + I.sum()) / (
+                self.population_size
+            )
+            if isolating and total_I > 0:
+                total_Q = (people[index["Q"], :].sum() + np.sum(Q_entering)) / (
+                    self.population_size
+                )
+                isolation_rate = max(
+                    self.capacity_minimum(
+                        self.capacity_minimum(
+                            total_I, scenario_dict["remove_symptomatic_rate"]
+                        ),
+                        scenario_dict["isolation_capacity"] - total_Q,
+                    )
+                    / total_I,
+                    0,
+                )
+            leaving = rng.binomial(
+                np.maximum(np.stack([np.floor(S), E, I, A]), 0).astype(np.int64),
+                np.stack(
+                    [
+                        -np.expm1(-force_of_infection * tau),
+                        np.full(len(S), latent_prob),
+                        np.full(
+                            len(S), -np.expm1(-tau * (removal_rate + isolation_rate))
+                        ),
+                        np.full(len(S), removal_prob),
+                    ]
+                ),
+            )
+            newly_exposed, E_latent, I_leaving, A_removed = leaving
+            # the symptomatic leaving are isolated or removed in proportion to the rates
+            I_isolated = rng.binomial(
+                I_leaving, isolation_rate / (removal_rate + isolation_rate)
+            )
+            I_removed = I_leaving - I_isolated
+            E_to_I, I_to_H = rng.binomial(np.stack([E_latent, I_removed]), branch_prob)
+            S = S - newly_exposed
+            E = E + newly_exposed - E_latent
+            I = I + E_to_I - I_leaving
+            A = A + E_latent - E_to_I - A_removed
+            H_entering = H_entering + I_to_H
+            R_entering = R_entering + I_removed - I_to_H + A_removed
+            Q_entering = Q_entering + I_isolated
+            moved = moved or bool(leaving.any())
+        if not moved:
+            return None
+        for compartment, value in [("S", S), ("E", E), ("I", I), ("A", A)]:
+            people[index[compartment], stochastic_mask] = value
+        people[index["H"], stochastic_mask] += H_entering
+        people[index["R"], stochastic_mask] += R_entering
+        people[index["Q"], stochastic_mask] += Q_entering
+        return (people / self.population_size).T.reshape(y.shape)
+
     def parse_model_output(
         self,
         y_out,
@@ -606,6 +1555,110 @@ class DeterministicCompartmentalModel(Model):
         assert len(col_names) == len(data_store_df.columns)
         return data_store_df
 
+    def parse_ensemble_output(self, y_out, time_range, generated_params_df):
+        """vectorised version of parse_model_output for a whole ensemble where y_out has the shape (draws, compartments * age categories, time), the draws are stacked in the same layout run_single_simulation gives"""
+        AGE_SEP = "_"  # separate compartment and age in column name
+        num_draws = y_out.shape[0]
+        num_times = len(time_range)
+        (
+            disease_compartment_col_names,
+            disease_age_compartment_col_names,
+        ) = self.spec.output_columns(self.ages, AGE_SEP)
+        # scale according to total population number N
+        y_out = self.population_size * y_out
+        y_sum = y_out.reshape(
+            num_draws,
+            self.age_categories,
+            len(disease_compartment_col_names),
+            num_times,
+        ).sum(axis=1)
+        data_store = y_out.transpose(0, 2, 1).reshape(num_draws * num_times, -1)
+        aggregated_compartment_output = y_sum.transpose(0, 2, 1).reshape(
+            num_draws * num_times, -1
+        )
+        data_store_df = pd.DataFrame(
+            data_store,
+            columns=disease_age_compartment_col_names,
+            index=np.tile(np.arange(num_times), num_draws),
+        )
+        data_store_df["Time"] = np.tile(time_range, num_draws)
+        for col_name, param_name in [
+            ("R0", "R0"),
+            ("latentRate", "latentRate"),
+            ("removalRate", "removalRate"),
+            ("hospRate", "hospRate"),
+            ("deathRateICU", "deathRateICU"),
+            ("deathRateNoIcu", "deathRateNoICU"),
+        ]:
+            data_store_df[col_name] = np.repeat(
+                generated_params_df[param_name].to_numpy(), num_times
+            )
+        for i, col_name in enumerate(disease_compartment_col_names):
+            data_store_df[col_name] = aggregated_compartment_output[:, i]
+        return data_store_df
+
+    def effective_reproduction_number(self, frame, scenario):
+        """R_eff of every draw (rows) and day (columns) of a result frame of the scenario, the largest eigenvalue of the next generation matrix made from the susceptible fractions and the transmission reduction and infection matrix of the scenario on that day, scaled the same way as R0"""
+        if scenario.reactive:
+            raise NotImplementedError(
+                "the effective reproduction number of reactive scenarios depends on the switches of every run"
+            )
+        num_times = num_times_of(frame)
+        time_range = ensemble_array(frame, "Time", num_times)[0]
+        susceptible = (
+            ensemble_array(
+                frame,
+                [Config.longname["S"] + "_" + age for age in self.ages],
+                num_times,
+            )
+            / self.population_size
+        )
+        # beta over the removal rate of every draw is R0 over the largest eigenvalue of the camp
+        beta_over_removal_rate = ensemble_array(frame, "R0", num_times)[:, 0] / np.real(
+            self.largest_eigenvalue
+        )
+        effective_reproduction_number = np.zeros(susceptible.shape[:2])
+        vectors = None
+        for day, t in enumerate(time_range):
+            scenario_dict = scenario.intervention_params_at_time_t(t)
+            next_generation_matrices = (
+                susceptible[:, day, :, None] * scenario_dict["infection_matrix"]
+            )
+            # the eigenvectors barely move from one day to the next so they start the next power iteration
+            roots, vectors = perron_roots(next_generation_matrices, vectors)
+            effective_reproduction_number[:, day] = (
+                scenario_dict["transmission_reduction_factor"]
+                * beta_over_removal_rate
+                * roots
+            )
+        return effective_reproduction_number
+
+    def run_model_with_fallback(
+        self, integrator_chain=None, time_budget=None, **run_model_kwargs
+    ):
+        """run_model retried with each integrator of the chain in turn until one succeeds within the time budget shared across attempts, returns the solution frame (None if every integrator failed) and the errors met along the way"""
+        if integrator_chain is None:
+            integrator_chain = Config.integrator_fallback_chain
+        start_time = time.monotonic()
+        errors = []
+        for integrator_params in integrator_chain:
+            remaining_budget = None
+            if time_budget is not None:
+                remaining_budget = time_budget - (time.monotonic() - start_time)
+                if remaining_budget <= 0:
+                    errors.append("ode solver exceeded its time budget")
+                    break
+            try:
+                solution_frame = self.run_model(
+                    integrator_params=integrator_params,
+                    time_budget=remaining_budget,
+                    **run_model_kwargs,
+                )
+                return solution_frame, errors
+            except RuntimeError as error:
+                errors.append(f"{integrator_params}: {error}")
+        return None, errors
+
     def run_single_simulation(
         self,
         scenario,
@@ -614,6 +1667,11 @@ class DeterministicCompartmentalModel(Model):
         initial_exposed=1,
         initial_symp=1,
         initial_asymp=1,
+        integrator_chain=None,
+        time_budget=Config.draw_time_budget,
+        hybrid=False,
+        seed=None,
+        reduced_state=False,
     ):
         # allow two implementation where one the initial seeds are fixed throughout
         # and the second one where initial exposed/symp/asymp are input as arrays
@@ -621,9 +1679,13 @@ class DeterministicCompartmentalModel(Model):
             generated_params_df = self.generate_epidemic_parameter_ranges(
                 self.num_iterations
             )  # default run 1000 iterations
+        rng = np.random.default_rng(seed) if hybrid else None
         sols = []
+        failed_draws = []
         for index, row in generated_params_df.iterrows():
-            sol = self.run_model(
+            sol, errors = self.run_model_with_fallback(
+                integrator_chain=integrator_chain,
+                time_budget=time_budget,
                 scenario=scenario,
                 t_stop=t_stop,
                 r0=row["R0"],
@@ -635,9 +1697,30 @@ class DeterministicCompartmentalModel(Model):
                 death_rate_no_ICU=row["deathRateNoICU"],
                 initial_symp=initial_symp,
                 initial_asymp=initial_asymp,
+                hybrid=hybrid,
+                rng=rng,
+                reduced_state=reduced_state,
             )
+            if sol is None:
+                # keep a block of missing values for the failed draw so the other draws stay aligned
+                sol = self.parse_model_output(
+                    np.full(
+                        (self.number_compartments * self.age_categories, t_stop + 1),
+                        np.nan,
+                    ),
+                    np.full((self.number_compartments, t_stop + 1), np.nan),
+                    np.arange(t_stop + 1),
+                    row["R0"],
+                    row["latentRate"],
+                    row["removalRate"],
+                    row["hospRate"],
+                    row["deathRateICU"],
+                    row["deathRateNoICU"],
+                )
+                failed_draws.append({"draw": index, "errors": errors})
             sols.append(sol)
         simulation_result_frame = pd.concat(sols, axis=0)
+        simulation_result_frame.attrs["failed_draws"] = failed_draws
         return simulation_result_frame
 
     def run_multiple_simulations(
@@ -648,6 +1731,11 @@ class DeterministicCompartmentalModel(Model):
         initial_exposed=1,
         initial_symp=1,
         initial_asymp=1,
+        integrator_chain=None,
+        time_budget=Config.draw_time_budget,
+        hybrid=False,
+        seed=None,
+        reduced_state=False,
     ):
         if generated_params_df is None:
             generated_params_df = self.generate_epidemic_parameter_ranges(
@@ -656,18 +1744,29 @@ class DeterministicCompartmentalModel(Model):
         simulation_result_frame_dict = {}
         for scenario_key, scenario in scenario_dict.items():
             simulation_result_frame_dict[scenario_key] = self.run_single_simulation(
-                scenario, generated_params_df
+                scenario,
+                generated_params_df,
+                integrator_chain=integrator_chain,
+                time_budget=time_budget,
+                hybrid=hybrid,
+                seed=seed,
+                reduced_state=reduced_state,
             )
         return simulation_result_frame_dict
 
 
 class DeterministicCompartmentalModelRunner(ModelRunner):
-    def __init__(self, camp_params: CampParams, num_iterations=1000):
+    def __init__(
+        self, camp_params: CampParams, num_iterations=1000, generated_params_df=None
+    ):
         super().__init__()
         self.model = DeterministicCompartmentalModel(camp_params)
-        self.generated_params_df = self.model.generate_epidemic_parameter_ranges(
-            num_iterations
-        )
+        # a calibrated ensemble from DeterministicCompartmentalModel.calibrate can be passed in
+        if generated_params_df is None:
+            generated_params_df = self.model.generate_epidemic_parameter_ranges(
+                num_iterations
+            )
+        self.generated_params_df = generated_params_df
         self.do_nothing_scenario = DeterministicCompartmentalModelScenario(
             self.model.population_size, self.model.infection_matrix
         )
@@ -772,17 +1871,33 @@ class DeterministicCompartmentalModelRunner(ModelRunner):
         # two reaction delay time params from here:
         # 1. when number of symptomatically infected patients reach a thershold (0.01%)
         # 2. when the first death because of COVID occurs
-        pass
+        return reaction_delays(camp_baseline)
 
     @staticmethod
     def parse_scenario_dict_of_frames(result_dict):
         list_of_dfs = []
+        failed_draws = []
         for scenario_suffix, scenario_df in result_dict.items():
             scenario_df["Scenario_suffix"] = [scenario_suffix] * len(scenario_df)
             list_of_dfs.append(scenario_df)
-        return pd.concat(list_of_dfs, axis=0)
+            for failed_draw in scenario_df.attrs.get("failed_draws", []):
+                failed_draws.append(dict(failed_draw, Scenario_suffix=scenario_suffix))
+        parsed_df = pd.concat(list_of_dfs, axis=0)
+        parsed_df.attrs["failed_draws"] = failed_draws
+        return parsed_df
+
+    def run_scenario_grid(self, scenario_grid):
+        """run every distinct scenario of a grid once and give its results to each scenario id sharing it"""
+        result_dict = dict.fromkeys(scenario_grid.scenario_ids())
+        for scenario, scenario_ids in scenario_grid.distinct_scenarios():
+            scenario_df = self.model.run_single_simulation(
+                scenario, self.generated_params_df
+            )
+            for scenario_id in scenario_ids:
+                result_dict[scenario_id] = scenario_df.copy()
+        return self.parse_scenario_dict_of_frames(result_dict)
 
-    def run_better_hygiene_scenarios(self):
+    def generate_better_hygiene_scenarios(self):
         # run better hygiene intervention compared to the current camp baseline at one month, three months and six months
         # relative increase 5% 10% and 15%
         camp_base_line_factor = self.camp_baseline.baseline_param_dict[
@@ -805,65 +1920,55 @@ class DeterministicCompartmentalModelRunner(ModelRunner):
             "three_month": duration_three_month_end_time,
             "six_month": duration_six_month_end_time,
         }
-        intervention_scenarios_generated = {}
-        for effectiveness_name, effectiveness_value in effectiveness_range.items():
-            for end_times_name, end_times_value in end_times_range.items():
-                scenario_id = "|".join([effectiveness_name, end_times_name])
-                intervention_scenarios_generated[
-                    scenario_id
-                ] = SingleInterventionScenario(
-                    self.model.population_size,
-                    intervention_start_time,
-                    end_times_value,
-                    self.model.infection_matrix,
-                    transmission_reduction_factor_inter=effectiveness_value,
-                    camp_specific_baseline_scenario=self.camp_baseline,
-                )
-        better_hygiene_intervention_result = self.model.run_multiple_simulations(
-            intervention_scenarios_generated, self.generated_params_df
+
+        def build_scenario(effectiveness, end_times):
+            return SingleInterventionScenario(
+                self.model.population_size,
+                intervention_start_time,
+                end_times,
+                self.model.infection_matrix,
+                transmission_reduction_factor_inter=effectiveness,
+                camp_specific_baseline_scenario=self.camp_baseline,
+            )
+
+        return ScenarioGrid(
+            build_scenario,
+            [("effectiveness", effectiveness_range), ("end_times", end_times_range)],
         )
-        return self.parse_scenario_dict_of_frames(better_hygiene_intervention_result)
 
-    def run_increase_icu_capacity_scenarios(self):
+    def run_better_hygiene_scenarios(self):
+        return self.run_scenario_grid(self.generate_better_hygiene_scenarios())
+
+    def generate_increase_icu_capacity_scenarios(self):
         # use 0.1% total population as the baseline
         current_capacity = self.camp_baseline.baseline_param_dict["icu_capacity"]
         intervention_start_time = [0]
         intervention_end_time = [200]
         ideal_number_of_icus = ceil(self.model.population_size * 0.001)
-        intervention_scenarios_generated = {}
         if current_capacity < ideal_number_of_icus * 0.5:
-            intervention_scenarios_generated[
-                "increase_to_ideal_icu_capacity"
-            ] = SingleInterventionScenario(
+            capacity_range = {"increase_to_ideal_icu_capacity": ideal_number_of_icus}
+        else:
+            capacity_range = {
+                "increase_by_50%": ceil(current_capacity * 1.5),
+                "increase_by_100%": ceil(current_capacity * 2.0),
+            }
+
+        def build_scenario(capacity):
+            return SingleInterventionScenario(
                 self.model.population_size,
                 intervention_start_time,
                 intervention_end_time,
                 self.model.infection_matrix,
-                icu_capacity_inter=ideal_number_of_icus,
+                icu_capacity_inter=capacity,
                 camp_specific_baseline_scenario=self.camp_baseline,
             )
-        else:
-            capacity_range = {
-                "increase_by_50%": ceil(current_capacity * 1.5),
-                "increase_by_100%": ceil(current_capacity * 2.0),
-            }
-            for capacity_name, capacity in capacity_range.items():
-                intervention_scenarios_generated[
-                    capacity_name
-                ] = SingleInterventionScenario(
-                    self.model.population_size,
-                    intervention_start_time,
-                    intervention_end_time,
-                    self.model.infection_matrix,
-                    icu_capacity_inter=capacity,
-                    camp_specific_baseline_scenario=self.camp_baseline,
-                )
-        increase_icu_intervention_result = self.model.run_multiple_simulations(
-            intervention_scenarios_generated, self.generated_params_df
-        )
-        return self.parse_scenario_dict_of_frames(increase_icu_intervention_result)
 
-    def run_remove_more_high_risk_residents_scenarios(self):
+        return ScenarioGrid(build_scenario, [("capacity", capacity_range)])
+
+    def run_increase_icu_capacity_scenarios(self):
+        return self.run_scenario_grid(self.generate_increase_icu_capacity_scenarios())
+
+    def generate_remove_more_high_risk_residents_scenarios(self):
         offsite_removal_number = int(self.camp_params.high_risk_offsite_number)
         # explore rate of moving people offsite in 1 week/3 weeks/6 weeks
         intervention_start_time = [0]
@@ -878,7 +1983,6 @@ class DeterministicCompartmentalModelRunner(ModelRunner):
             self.model.population_size
             * (self.model.population_vector[-1] + self.model.population_vector[-2])
         )
-        intervention_scenarios_generated = {}
         if (
             offsite_removal_number
             < number_of_people_in_last_age_compartment
@@ -911,46 +2015,35 @@ class DeterministicCompartmentalModelRunner(ModelRunner):
             rate_removal_one_week = floor(new_offsite_removal_number / 7)
             rate_removal_three_week = floor(new_offsite_removal_number / 21)
             rate_removal_six_week = floor(new_offsite_removal_number / 42)
-        intervention_scenarios_generated[
-            "removal_one_week"
-        ] = SingleInterventionScenario(
-            self.model.population_size,
-            intervention_start_time,
-            duration_one_week_end_time,
-            self.model.infection_matrix,
-            first_high_risk_category_n_inter=first_high_risk_category_n,
-            remove_high_risk_rate_inter=rate_removal_one_week,
-            camp_specific_baseline_scenario=self.camp_baseline,
-        )
-        intervention_scenarios_generated[
-            "removal_three_week"
-        ] = SingleInterventionScenario(
-            self.model.population_size,
-            intervention_start_time,
-            duration_three_weeks_end_time,
-            self.model.infection_matrix,
-            first_high_risk_category_n_inter=first_high_risk_category_n,
-            remove_high_risk_rate_inter=rate_removal_three_week,
-            camp_specific_baseline_scenario=self.camp_baseline,
-        )
-        intervention_scenarios_generated[
-            "removal_six_week"
-        ] = SingleInterventionScenario(
-            self.model.population_size,
-            intervention_start_time,
-            duration_six_weeks_end_time,
-            self.model.infection_matrix,
-            first_high_risk_category_n_inter=first_high_risk_category_n,
-            remove_high_risk_rate_inter=rate_removal_six_week,
-            camp_specific_baseline_scenario=self.camp_baseline,
-        )
+        removal_range = {
+            "removal_one_week": (duration_one_week_end_time, rate_removal_one_week),
+            "removal_three_week": (
+                duration_three_weeks_end_time,
+                rate_removal_three_week,
+            ),
+            "removal_six_week": (duration_six_weeks_end_time, rate_removal_six_week),
+        }
+
+        def build_scenario(removal):
+            end_times, rate_removal = removal
+            return SingleInterventionScenario(
+                self.model.population_size,
+                intervention_start_time,
+                end_times,
+                self.model.infection_matrix,
+                first_high_risk_category_n_inter=first_high_risk_category_n,
+                remove_high_risk_rate_inter=rate_removal,
+                camp_specific_baseline_scenario=self.camp_baseline,
+            )
 
-        increase_remove_high_risk_result = self.model.run_multiple_simulations(
-            intervention_scenarios_generated, self.generated_params_df
+        return ScenarioGrid(build_scenario, [("removal", removal_range)])
+
+    def run_remove_more_high_risk_residents_scenarios(self):
+        return self.run_scenario_grid(
+            self.generate_remove_more_high_risk_residents_scenarios()
         )
-        return self.parse_scenario_dict_of_frames(increase_remove_high_risk_result)
 
-    def run_isolate_symptomatic_scenario(self):
+    def generate_isolate_symptomatic_scenarios(self):
         isolation_capacity = int(self.camp_params.isolation_capacity)
         # if the isolation capacity is below camp population * 0.005 then experiment with camp population * 0.005 and if the isolation capacity is above camp population * 0.005, exepriment with current capacity and 1.5 the original capacity
         if isolation_capacity == 0:
@@ -992,28 +2085,31 @@ class DeterministicCompartmentalModelRunner(ModelRunner):
             "one_hundred_day": duration_100_end_time,
             "two_hundred_day": duration_200_end_time,
         }
-        intervention_scenarios_generated = {}
-        for capacity_name, capacity_value in capacity_range.items():
-            for rate_name, rate_value in rate_range.items():
-                for end_times_name, end_times_value in end_times_range.items():
-                    scenario_id = "|".join([capacity_name, rate_name, end_times_name])
-                    intervention_scenarios_generated[
-                        scenario_id
-                    ] = SingleInterventionScenario(
-                        self.model.population_size,
-                        intervention_start_time,
-                        end_times_value,
-                        self.model.infection_matrix,
-                        isolation_capacity_inter=capacity_value,
-                        remove_symptomatic_rate_inter=rate_value,
-                        camp_specific_baseline_scenario=self.camp_baseline,
-                    )
-        better_isolation_intervention_result = self.model.run_multiple_simulations(
-            intervention_scenarios_generated, self.generated_params_df
+
+        def build_scenario(capacity, rate, end_times):
+            return SingleInterventionScenario(
+                self.model.population_size,
+                intervention_start_time,
+                end_times,
+                self.model.infection_matrix,
+                isolation_capacity_inter=capacity,
+                remove_symptomatic_rate_inter=rate,
+                camp_specific_baseline_scenario=self.camp_baseline,
+            )
+
+        return ScenarioGrid(
+            build_scenario,
+            [
+                ("capacity", capacity_range),
+                ("rate", rate_range),
+                ("end_times", end_times_range),
+            ],
         )
-        return self.parse_scenario_dict_of_frames(better_isolation_intervention_result)
 
-    def run_shielding_scenario(self):
+    def run_isolate_symptomatic_scenario(self):
+        return self.run_scenario_grid(self.generate_isolate_symptomatic_scenarios())
+
+    def generate_shielding_scenarios(self):
         # check if there is ability to shield
         if self.camp_params.ability_to_shield is True:
             intervention_start_time = [0]
@@ -1025,27 +2121,45 @@ class DeterministicCompartmentalModelRunner(ModelRunner):
                 "one_hundred_day": duration_100_end_time,
                 "two_hundred_day": duration_200_end_time,
             }
-            intervention_scenarios_generated = {}
-            for end_times_name, end_times_value in end_times_range.items():
-                intervention_scenarios_generated[
-                    end_times_name
-                ] = SingleInterventionScenario(
+
+            def build_scenario(end_times):
+                return SingleInterventionScenario(
                     self.model.population_size,
                     intervention_start_time,
-                    end_times_value,
+                    end_times,
                     self.model.infection_matrix,
                     apply_shielding=True,
                     camp_specific_baseline_scenario=self.camp_baseline,
                 )
-            shielding_intervention_result = self.model.run_multiple_simulations(
-                intervention_scenarios_generated, self.generated_params_df
-            )
-            return self.parse_scenario_dict_of_frames(shielding_intervention_result)
+
+            return ScenarioGrid(build_scenario, [("end_times", end_times_range)])
         elif self.camp_params.ability_to_shield is False:
-            return pd.DataFrame()
+            return {}
         else:
             raise NotImplementedError
 
+    def run_shielding_scenario(self):
+        intervention_scenarios_generated = self.generate_shielding_scenarios()
+        if not intervention_scenarios_generated:
+            return pd.DataFrame()
+        return self.run_scenario_grid(intervention_scenarios_generated)
+
+    def scenario_families(self):
+        """map the name of each intervention family to the method generating its scenarios, in the order run_different_scenarios runs them"""
+        return {
+            "better_hygiene": self.generate_better_hygiene_scenarios,
+            "increase_icu_capacity": self.generate_increase_icu_capacity_scenarios,
+            "remove_more_high_risk_residents": self.generate_remove_more_high_risk_residents_scenarios,
+            "isolate_symptomatic": self.generate_isolate_symptomatic_scenarios,
+            "shielding": self.generate_shielding_scenarios,
+        }
+
+    def run_progressive(self, snapshot_interval=None, **progressive_kwargs):
+        """run every scenario on growing batches of draws and yield snapshots of their percentile bands every snapshot_interval seconds, see ProgressiveRun, the last snapshot is over all the draws"""
+        return ProgressiveRun(
+            self, snapshot_interval=snapshot_interval, **progressive_kwargs
+        ).snapshots()
+
     def run_different_scenarios(self):
         """here we run all intervention scenarios possible in a batch"""
         better_hygiene_intervention_result = self.run_better_hygiene_scenarios()
@@ -1,4 +1,37 @@
+from bisect import bisect_right
+from collections.abc import Mapping
+from copy import copy
+
+import numpy as np
+
+from .config.compartmental_model import Config
+from .frozen import freeze_param_dict
+from .intensity_profile import ConstantIntensity, LinearDecayIntensity
+
+
+def canonical_value(value):
+    """hashable form of a scenario parameter, arrays and floats are rounded so equal parameters compare equal"""
+    if isinstance(value, np.ndarray):
+        return (value.shape, np.round(value, 12).tobytes())
+    if isinstance(value, (float, np.floating)):
+        return round(float(value), 12)
+    if isinstance(value, Mapping):
+        return canonical_params(value)
+    if isinstance(value, (list, tuple)):
+        return tuple(canonical_value(item) for item in value)
+    return value
+
+
+def canonical_params(param_dict):
+    return tuple(
+        sorted((key, canonical_value(value)) for key, value in param_dict.items())
+    )
+
+
 class DeterministicCompartmentalModelScenario(object):
+    # reactive scenarios switch their intervention on and off on conditions of the state instead of fixed times
+    reactive = False
+
     def __init__(
         self,
         population_size,
@@ -24,7 +57,10 @@ class DeterministicCompartmentalModelScenario(object):
         param_dict["remove_high_risk_rate"] = remove_high_risk_rate
         param_dict["icu_capacity"] = icu_capacity
         param_dict["infection_matrix"] = infection_matrix
-        self.baseline_param_dict = self.parse_param_dict(param_dict, population_size)
+        self.baseline_param_dict = freeze_param_dict(
+            self.parse_param_dict(param_dict, population_size)
+        )
+        self._fingerprint = None
 
     @staticmethod
     def _validate_input_params(
@@ -35,20 +71,37 @@ class DeterministicCompartmentalModelScenario(object):
         icu_capacity,
         infection_matrix,
     ):
-        assert infection_matrix.shape == (8, 8)
+        assert (
+            infection_matrix.ndim == 2
+            and infection_matrix.shape[0] == infection_matrix.shape[1]
+        )
         assert transmission_reduction_factor >= 0
         assert transmission_reduction_factor <= 1
         assert remove_symptomatic_rate >= 0
         assert remove_high_risk_rate >= 0
         assert first_high_risk_category_n >= 0
-        assert first_high_risk_category_n <= 8
+        assert first_high_risk_category_n <= infection_matrix.shape[0]
         assert icu_capacity >= 0
 
+    @staticmethod
+    def _validate_input_time(start_times, end_times):
+        assert len(start_times) >= 1
+        assert len(start_times) == len(
+            end_times
+        ), "intervention start times and duration given for each start time don't match"
+        assert start_times[0] >= 0
+        for start, end in zip(start_times, end_times):
+            assert end >= start
+        assert all(isinstance(t, int) for t in start_times)
+        assert all(isinstance(t, int) for t in end_times)
+
     @staticmethod
     def apply_shielding(infection_matrix, shiled_increase=2, n_oldest_group=1):
         divider = (
             -n_oldest_group
         )  # determines which groups separated. -1 means only oldest group separated from the rest
+        # work on a copy, the matrix passed in may be shared with the model and other scenarios
+        infection_matrix = np.array(infection_matrix, dtype=float)
 
         infection_matrix[:divider, :divider] = (
             shiled_increase * infection_matrix[:divider, :divider]
@@ -65,51 +118,17 @@ class DeterministicCompartmentalModelScenario(object):
 
         return infection_matrix
 
-    @staticmethod
-    def parse_param_dict(raw_param_dict, population_size: int):
-        parsed_param_dict = dict(raw_param_dict)
-        parsed_param_dict["isolation_capacity"] = (
-            raw_param_dict["isolation_capacity"] / population_size
-        )
-        parsed_param_dict["remove_symptomatic_rate"] = (
-            raw_param_dict["remove_symptomatic_rate"] / population_size
-        )
-        parsed_param_dict["remove_high_risk_rate"] = (
-            raw_param_dict["remove_high_risk_rate"] / population_size
-        )
-        parsed_param_dict["icu_capacity"] = (
-            raw_param_dict["icu_capacity"] / population_size
-        )
-        return parsed_param_dict
-
-    def intervention_params_at_time_t(self, t: int):
-        return self.baseline_param_dict
-
-
-class SingleInterventionScenario(DeterministicCompartmentalModelScenario):
-    # TODO: give two intensity setting mode - one is constant where values stay the same throughout the duration or the other one is a linear decay or inverse exponential decay where the efficacy of the intervention decreases throughout the intervention cycles
-    def __init__(
+    def build_intervention_param_dict(
         self,
         population_size,
-        start_times,
-        end_times,
-        infection_matrix,
-        apply_shielding=False,
         transmission_reduction_factor_inter=None,
         isolation_capacity_inter=None,
         remove_symptomatic_rate_inter=None,
         remove_high_risk_rate_inter=None,
         first_high_risk_category_n_inter=None,
         icu_capacity_inter=None,
-        inter_rate_change="Constant",
-        camp_specific_baseline_scenario=None,
     ):
-        super().__init__(population_size, infection_matrix)
-        if camp_specific_baseline_scenario is not None:
-            # swap out the baseline params with the camp current params
-            self.baseline_param_dict = (
-                camp_specific_baseline_scenario.baseline_param_dict
-            )
+        """intervention parameters with the ones not given taken from the baseline, numbers of people are scaled by the population size"""
         param_dict = dict()
         if transmission_reduction_factor_inter is None:
             param_dict["transmission_reduction_factor"] = self.baseline_param_dict[
@@ -153,6 +172,84 @@ class SingleInterventionScenario(DeterministicCompartmentalModelScenario):
         else:
             icu_capacity_inter = icu_capacity_inter / population_size
             param_dict["icu_capacity"] = icu_capacity_inter
+        return param_dict
+
+    @staticmethod
+    def parse_param_dict(raw_param_dict, population_size: int):
+        parsed_param_dict = dict(raw_param_dict)
+        parsed_param_dict["isolation_capacity"] = (
+            raw_param_dict["isolation_capacity"] / population_size
+        )
+        parsed_param_dict["remove_symptomatic_rate"] = (
+            raw_param_dict["remove_symptomatic_rate"] / population_size
+        )
+        parsed_param_dict["remove_high_risk_rate"] = (
+            raw_param_dict["remove_high_risk_rate"] / population_size
+        )
+        parsed_param_dict["icu_capacity"] = (
+            raw_param_dict["icu_capacity"] / population_size
+        )
+        return parsed_param_dict
+
+    def intervention_params_at_time_t(self, t: int):
+        return self.baseline_param_dict
+
+    def fingerprint(self):
+        """canonical form of the compiled parameters, scenarios with the same fingerprint give the same results"""
+        # the parameter records are frozen so the fingerprint only needs working out once
+        if self._fingerprint is None:
+            self._fingerprint = self.compute_fingerprint()
+        return self._fingerprint
+
+    def compute_fingerprint(self):
+        return ("baseline", canonical_params(self.baseline_param_dict))
+
+
+class SingleInterventionScenario(DeterministicCompartmentalModelScenario):
+    # the intensity profile scales how far the numeric parameters move from the baseline to the intervention values over a window
+    profiled_params = [
+        "transmission_reduction_factor",
+        "isolation_capacity",
+        "remove_symptomatic_rate",
+        "remove_high_risk_rate",
+        "icu_capacity",
+    ]
+
+    def __init__(
+        self,
+        population_size,
+        start_times,
+        end_times,
+        infection_matrix,
+        apply_shielding=False,
+        transmission_reduction_factor_inter=None,
+        isolation_capacity_inter=None,
+        remove_symptomatic_rate_inter=None,
+        remove_high_risk_rate_inter=None,
+        first_high_risk_category_n_inter=None,
+        icu_capacity_inter=None,
+        inter_rate_change="Constant",
+        camp_specific_baseline_scenario=None,
+        intensity_profile=None,
+    ):
+        super().__init__(population_size, infection_matrix)
+        if camp_specific_baseline_scenario is not None:
+            # swap out the baseline params with the camp current params
+            self.baseline_param_dict = (
+                camp_specific_baseline_scenario.baseline_param_dict
+            )
+        self.baseline_param_dict = freeze_param_dict(
+            dict(self.baseline_param_dict, infection_matrix=infection_matrix)
+        )
+        param_dict = self.build_intervention_param_dict(
+            population_size,
+            transmission_reduction_factor_inter,
+            isolation_capacity_inter,
+            remove_symptomatic_rate_inter,
+            remove_high_risk_rate_inter,
+            first_high_risk_category_n_inter,
+            icu_capacity_inter,
+        )
         self._validate_input_params(
             param_dict["transmission_reduction_factor"],
             param_dict["remove_symptomatic_rate"],
@@ -161,63 +258,403 @@ class SingleInterventionScenario(DeterministicCompartmentalModelScenario):
             param_dict["icu_capacity"],
             infection_matrix,
         )
-        self.intervention_param_dict = param_dict
         self._validate_input_time(start_times, end_times)
         self.start_times = start_times
         self.end_times = end_times
-        self.baseline_param_dict["infection_matrix"] = infection_matrix
         if apply_shielding:
             infection_matrix = self.apply_shielding(infection_matrix)
-        else:
-            infection_matrix = infection_matrix
-        self.intervention_param_dict["infection_matrix"] = infection_matrix
+        param_dict["infection_matrix"] = infection_matrix
+        self.intervention_param_dict = freeze_param_dict(param_dict)
         self.inter_rate_change = inter_rate_change
+        if intensity_profile is None:
+            if inter_rate_change == "Constant":
+                intensity_profile = ConstantIntensity()
+            elif inter_rate_change == "Decay":
+                intensity_profile = LinearDecayIntensity()
+            else:
+                raise NotImplementedError(
+                    f"intervention rate change {inter_rate_change} is not supported"
+                )
+        self.intensity_profile = intensity_profile
+        self.windows = sorted(zip(start_times, end_times))
+        self.window_starts = [start for start, _ in self.windows]
+        if not intensity_profile.constant:
+            self.intensity_tables = [
+                self.intensity_table(start, end) for start, end in self.windows
+            ]
 
-    @staticmethod
-    def _validate_input_time(start_times, end_times):
-        assert len(start_times) >= 1
-        assert len(start_times) == len(
-            end_times
-        ), "intervention start times and duration given for each start time don't match"
-        assert start_times[0] >= 0
-        for start, end in zip(start_times, end_times):
-            assert end >= start
-        assert all(isinstance(t, int) for t in start_times)
-        assert all(isinstance(t, int) for t in end_times)
+    def compute_fingerprint(self):
+        if canonical_params(self.intervention_param_dict) == canonical_params(
+            {key: self.baseline_param_dict[key] for key in self.intervention_param_dict}
+        ):
+            # an intervention leaving every parameter at the baseline is the baseline whatever its windows
+            return super().compute_fingerprint()
+        profile = self.intensity_profile
+        return (
+            "single",
+            canonical_params(self.baseline_param_dict),
+            canonical_params(self.intervention_param_dict),
+            tuple(self.windows),
+            "constant" if profile.constant else type(profile).__name__,
+            None if profile.constant else canonical_params(vars(profile)),
+        )
+
+    def intensity_table(self, start, end):
+        """parameters on the intensity grid of a window, moving from the baseline to the intervention values with the intensity"""
+        times, intensity = self.intensity_profile.intensity_grid(start, end)
+        baseline = np.array(
+            [self.baseline_param_dict[key] for key in self.profiled_params],
+            dtype=float,
+        )
+        intervention = np.array(
+            [self.intervention_param_dict[key] for key in self.profiled_params],
+            dtype=float,
+        )
+        return times, baseline + intensity[:, None] * (intervention - baseline)
 
     def intervention_params_at_time_t(self, t: int):
-        for start, end in zip(self.start_times, self.end_times):
-            if (t >= start) and (t <= end):
-                if self.inter_rate_change == "Constant":
-                    return self.intervention_param_dict
-                elif self.inter_rate_change == "Decay":
-                    # first check which components are different to the baseline dict
-                    intervention_dict = {
-                        k: self.intervention_param_dict[k]
-                        for k in self.baseline_param_dict
-                        if self.intervention_param_dict[k]
-                        != self.baseline_param_dict[k]
-                    }
-                    baseline_dict_updated = {
-                        k: self.intervention_param_dict[k]
-                        for k in self.baseline_param_dict
-                        if self.intervention_param_dict[k]
-                        == self.baseline_param_dict[k]
-                    }
-                    assert (
-                        len(intervention_dict) == 1
-                    ), "SingleInterventionScenario should have only one intervention only"
-                    # use a linear decay formulae to update the rate
-                    initial_rate = intervention_dict.values()[0]
-                    current_rate = 0.3 * initial_rate / end * (start - t) + initial_rate
-                    baseline_dict_updated[intervention_dict.keys()[0]] = current_rate
-                    baseline_dict_updated[
-                        "infection_matrix"
-                    ] = self.intervention_param_dict["infection_matrix"]
-                    return baseline_dict_updated
-            else:
-                return self.baseline_param_dict
+        window = bisect_right(self.window_starts, t) - 1
+        if window < 0 or t > self.windows[window][1]:
+            return self.baseline_param_dict
+        if self.intensity_profile.constant:
+            return self.intervention_param_dict
+        times, table = self.intensity_tables[window]
+        point = min(max(np.searchsorted(times, t), 1), len(times) - 1)
+        if point == 0 or times[point] == times[point - 1]:
+            params = table[point]
+        else:
+            share = (t - times[point - 1]) / (times[point] - times[point - 1])
+            params = table[point - 1] + share * (table[point] - table[point - 1])
+        param_dict = dict(zip(self.profiled_params, params.tolist()))
+        param_dict["first_high_risk_category_n"] = self.intervention_param_dict[
+            "first_high_risk_category_n"
+        ]
+        param_dict["infection_matrix"] = self.intervention_param_dict[
+            "infection_matrix"
+        ]
+        return param_dict
+
+
+class StateCondition(object):
+    """condition on the number of people in some disease compartments, met once the number goes above (or below) the threshold"""
+
+    def __init__(
+        self,
+        compartments,
+        threshold,
+        population_size,
+        above=True,
+        age_categories=None,
+    ):
+        self.number_compartments = len(Config.longname)
+        self.compartment_indices = [
+            Config.compartment_index[compartment] for compartment in compartments
+        ]
+        # positions in the state vector laid out as compartment + age category * number of compartments, every age
+        # category of however many the model has when not given
+        self.indices = None
+        if age_categories is not None:
+            self.indices = np.array(
+                [
+                    index + age * self.number_compartments
+                    for index in self.compartment_indices
+                    for age in age_categories
+                ]
+            )
+        self.threshold = threshold / population_size
+        self.direction = 1 if above else -1
+
+    def margin(self, y):
+        """distance of the state from the threshold, its root is where the condition starts to be met"""
+        if self.indices is None:
+            return (
+                y.reshape(-1, self.number_compartments)[
+                    :, self.compartment_indices
+                ].sum()
+                - self.threshold
+            )
+        return y[self.indices].sum() - self.threshold
+
+    def is_met(self, y):
+        return self.direction * self.margin(y) >= 0
+
+
+class ReactiveInterventionScenario(DeterministicCompartmentalModelScenario):
+    """intervention switched on when the start condition is met and off again when the stop condition is met
+
+    The solver locates every switch as the root of the condition that is next in line. Every run integrates a copy of
+    the scenario from start_run, which keeps track of whether the intervention is on and of the times it was switched,
+    so the scenario itself is never switched and runs of it can go on at the same time.
+    """
+
+    reactive = True
+
+    def __init__(
+        self,
+        population_size,
+        infection_matrix,
+        start_condition: StateCondition,
+        stop_condition: StateCondition = None,
+        apply_shielding=False,
+        transmission_reduction_factor_inter=None,
+        isolation_capacity_inter=None,
+        remove_symptomatic_rate_inter=None,
+        remove_high_risk_rate_inter=None,
+        first_high_risk_category_n_inter=None,
+        icu_capacity_inter=None,
+        camp_specific_baseline_scenario=None,
+        max_switches=10,
+    ):
+        super().__init__(population_size, infection_matrix)
+        if camp_specific_baseline_scenario is not None:
+            # swap out the baseline params with the camp current params
+            self.baseline_param_dict = (
+                camp_specific_baseline_scenario.baseline_param_dict
+            )
+        self.baseline_param_dict = freeze_param_dict(
+            dict(self.baseline_param_dict, infection_matrix=infection_matrix)
+        )
+        param_dict = self.build_intervention_param_dict(
+            population_size,
+            transmission_reduction_factor_inter,
+            isolation_capacity_inter,
+            remove_symptomatic_rate_inter,
+            remove_high_risk_rate_inter,
+            first_high_risk_category_n_inter,
+            icu_capacity_inter,
+        )
+        self._validate_input_params(
+            param_dict["transmission_reduction_factor"],
+            param_dict["remove_symptomatic_rate"],
+            param_dict["remove_high_risk_rate"],
+            param_dict["first_high_risk_category_n"],
+            param_dict["icu_capacity"],
+            infection_matrix,
+        )
+        if apply_shielding:
+            infection_matrix = self.apply_shielding(infection_matrix)
+        param_dict["infection_matrix"] = infection_matrix
+        self.intervention_param_dict = freeze_param_dict(param_dict)
+        self.start_condition = start_condition
+        self.stop_condition = stop_condition
+        self.max_switches = max_switches
+        # the scenario stays switched off, the runs switch their copies
+        self.running = False
+        self.active = False
+        self.switch_times = []
+
+    def start_run(self, y0):
+        """copy of the scenario for a run from y0, the intervention is on from the start if the start condition is already met"""
+        run = copy(self)
+        run.running = True
+        run.active = bool(self.start_condition.is_met(y0))
+        run.switch_times = [0] if run.active else []
+        return run
+
+    def next_event(self):
+        """event function for the solver that finds the next switch, None if there is none to come"""
+        condition = self.stop_condition if self.active else self.start_condition
+        if (condition is None) or (len(self.switch_times) >= self.max_switches):
+            return None
+
+        def event(t, y, *args):
+            return condition.margin(y)
+
+        event.terminal = True
+        event.direction = condition.direction
+        return event
+
+    def switch(self, t):
+        if not self.running:
+            raise RuntimeError("only the runs from start_run switch")
+        self.active = not self.active
+        self.switch_times.append(t)
+
+    def compute_fingerprint(self):
+        # the switch times depend on the run so reactive scenarios are never merged
+        return ("reactive", id(self))
+
+    def intervention_params_at_time_t(self, t):
+        if self.active:
+            return self.intervention_param_dict
+        return self.baseline_param_dict
+
+
+class Intervention(object):
+    """one intervention of a package with the time windows it is in place, the parameters not given are left to the other interventions or the baseline"""
+
+    def __init__(
+        self,
+        start_times,
+        end_times,
+        apply_shielding=False,
+        transmission_reduction_factor=None,
+        isolation_capacity=None,
+        remove_symptomatic_rate=None,
+        remove_high_risk_rate=None,
+        first_high_risk_category_n=None,
+        icu_capacity=None,
+    ):
+        DeterministicCompartmentalModelScenario._validate_input_time(
+            start_times, end_times
+        )
+        self.start_times = start_times
+        self.end_times = end_times
+        self.apply_shielding = apply_shielding
+        self.params = {
+            "transmission_reduction_factor": transmission_reduction_factor,
+            "isolation_capacity": isolation_capacity,
+            "remove_symptomatic_rate": remove_symptomatic_rate,
+            "remove_high_risk_rate": remove_high_risk_rate,
+            "first_high_risk_category_n": first_high_risk_category_n,
+            "icu_capacity": icu_capacity,
+        }
+
+
+class InterventionSchedule(object):
+    """piecewise constant intervention parameters, the record of every segment between the sorted breakpoints is looked up by bisection"""
+
+    def __init__(self, breakpoints, segment_param_dicts):
+        assert len(segment_param_dicts) == len(breakpoints) + 1
+        assert list(breakpoints) == sorted(breakpoints)
+        self.breakpoints = list(breakpoints)
+        self.segment_param_dicts = list(segment_param_dicts)
+
+    @classmethod
+    def from_windows(cls, windows, build_param_dict):
+        """schedule of interventions given as (start_times, end_times) windows, build_param_dict gets the indices of the interventions in place in a segment"""
+        # an intervention is in place from its start time up to and including its end time
+        breakpoints = sorted(
+            {float(start) for start_times, _ in windows for start in start_times}
+            | {
+                np.nextafter(float(end), np.inf)
+                for _, end_times in windows
+                for end in end_times
+            }
+        )
+        segment_param_dicts = []
+        for segment_start in [-np.inf] + breakpoints:
+            active = tuple(
+                i
+                for i, (start_times, end_times) in enumerate(windows)
+                if any(
+                    start <= segment_start <= end
+                    for start, end in zip(start_times, end_times)
+                )
+            )
+            segment_param_dicts.append(build_param_dict(active))
+        return cls(breakpoints, segment_param_dicts)
+
+    def param_dict_at_time_t(self, t):
+        return self.segment_param_dicts[bisect_right(self.breakpoints, t)]
 
 
 class MultipleInterventionScenario(DeterministicCompartmentalModelScenario):
-    pass
+    """package of interventions in place over their own time windows
+
+    The breakpoints of all the interventions are merged into one schedule and the combined parameters of every segment
+    are worked out up front, so looking up the parameters at a time is one bisection however many interventions are
+    stacked. Where interventions in place together set the same parameter, transmission reduction factors multiply and
+    otherwise the largest value is taken. Shielding is applied to a copy of the infection matrix once.
+    """
+
+    def __init__(
+        self,
+        population_size,
+        infection_matrix,
+        interventions,
+        camp_specific_baseline_scenario=None,
+    ):
+        super().__init__(population_size, infection_matrix)
+        assert len(interventions) >= 1
+        if camp_specific_baseline_scenario is not None:
+            # swap out the baseline params with the camp current params
+            self.baseline_param_dict = (
+                camp_specific_baseline_scenario.baseline_param_dict
+            )
+        self.baseline_param_dict = freeze_param_dict(
+            dict(self.baseline_param_dict, infection_matrix=infection_matrix)
+        )
+        self.interventions = list(interventions)
+        shielded_infection_matrix = None
+        if any(intervention.apply_shielding for intervention in self.interventions):
+            shielded_infection_matrix = self.apply_shielding(infection_matrix)
+        segment_param_dicts = dict()
+
+        def build_param_dict(active):
+            if not active:
+                return self.baseline_param_dict
+            # segments with the same interventions in place share their record
+            if active not in segment_param_dicts:
+                segment_param_dicts[active] = self.combine_interventions(
+                    population_size,
+                    [self.interventions[i] for i in active],
+                    infection_matrix,
+                    shielded_infection_matrix,
+                )
+            return segment_param_dicts[active]
+
+        self.schedule = InterventionSchedule.from_windows(
+            [
+                (intervention.start_times, intervention.end_times)
+                for intervention in self.interventions
+            ],
+            build_param_dict,
+        )
+
+    def combine_interventions(
+        self,
+        population_size,
+        interventions,
+        infection_matrix,
+        shielded_infection_matrix,
+    ):
+        """parameters of a segment with several interventions in place"""
+        combined = dict()
+        for key in interventions[0].params:
+            values = [
+                intervention.params[key]
+                for intervention in interventions
+                if intervention.params[key] is not None
+            ]
+            if not values:
+                combined[key] = None
+            elif key == "transmission_reduction_factor":
+                combined[key] = float(np.prod(values))
+            else:
+                combined[key] = max(values)
+        param_dict = self.build_intervention_param_dict(
+            population_size,
+            combined["transmission_reduction_factor"],
+            combined["isolation_capacity"],
+            combined["remove_symptomatic_rate"],
+            combined["remove_high_risk_rate"],
+            combined["first_high_risk_category_n"],
+            combined["icu_capacity"],
+        )
+        if any(intervention.apply_shielding for intervention in interventions):
+            param_dict["infection_matrix"] = shielded_infection_matrix
+        else:
+            param_dict["infection_matrix"] = infection_matrix
+        self._validate_input_params(
+            param_dict["transmission_reduction_factor"],
+            param_dict["remove_symptomatic_rate"],
+            param_dict["remove_high_risk_rate"],
+            param_dict["first_high_risk_category_n"],
+            param_dict["icu_capacity"],
+            param_dict["infection_matrix"],
+        )
+        return freeze_param_dict(param_dict)
+
+    def intervention_params_at_time_t(self, t: int):
+        return self.schedule.param_dict_at_time_t(t)
+
+    def compute_fingerprint(self):
+        return (
+            "multiple",
+            tuple(self.schedule.breakpoints),
+            tuple(
+                canonical_params(param_dict)
+                for param_dict in self.schedule.segment_param_dicts
+            ),
+        )
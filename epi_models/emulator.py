@@ -0,0 +1,392 @@
+from concurrent.futures import ThreadPoolExecutor
+from itertools import combinations_with_replacement
+
+import numpy as np
+import pandas as pd
+from scipy.stats import qmc
+
+from .config.compartmental_model import Config
+from .sensitivity import EPIDEMIC_FACTORS, SCENARIO_FACTORS, integrate_design
+
+# compartments the emulator predicts by default
+EMULATED_COMPARTMENTS = ["Infected_symptomatic", "Critical", "Deaths"]
+
+
+def legendre_exponents(num_factors, degree):
+    """exponents of the products of Legendre polynomials of the factors up to a total degree, a row per polynomial"""
+    exponents = []
+    for total_degree in range(degree + 1):
+        for factors in combinations_with_replacement(range(num_factors), total_degree):
+            exponents.append(np.bincount(factors, minlength=num_factors))
+    return np.array(exponents, dtype=int).reshape(-1, num_factors)
+
+
+def legendre_features(x, exponents):
+    """products of Legendre polynomials of points of [-1, 1] ** factors, a column per row of exponents"""
+    x = np.asarray(x, dtype=float)
+    degree = exponents.max(initial=0)
+    # polynomials of every factor by the three term recurrence, shape (degree + 1, points, factors)
+    polynomials = np.ones((degree + 1,) + x.shape)
+    if degree > 0:
+        polynomials[1] = x
+    for n in range(1, degree):
+        polynomials[n + 1] = (
+            (2 * n + 1) * x * polynomials[n] - n * polynomials[n - 1]
+        ) / (n + 1)
+    # polynomial of the exponent of every factor in every term at every point, shape (points, terms, factors)
+    return np.prod(
+        polynomials[
+            exponents[None, :, :],
+            np.arange(len(x))[:, None, None],
+            np.arange(x.shape[1])[None, None, :],
+        ],
+        axis=-1,
+    )
+
+
+class ScenarioEmulator:
+    """Polynomial chaos surrogate of the daily curves of a scenario over a box of factor values
+
+    The log of the compartment curves of solver runs is reduced to its leading principal components and every
+    component is fitted by a least squares expansion in Legendre polynomials of the factors, which are orthogonal
+    under the uniform distribution the training runs are drawn from. A prediction is then a couple of matrix products,
+    so percentile bands over thousands of draws come back in milliseconds. The exact solver stays the reference,
+    verify runs it on the same draws in the background.
+
+    The draws of the epidemic factors follow the normal distribution of the draws of the model the emulator was trained
+    on, or the rows of a generated_params_df, and are clipped to the trained bounds. The scenario factors have no
+    distribution in the model, they are drawn uniformly over their bounds unless they are fixed.
+    """
+
+    def __init__(
+        self,
+        factor_bounds,
+        compartments,
+        time_range,
+        exponents,
+        coefficients,
+        components,
+        mean_curve,
+        validation_error=None,
+        draw_distribution=None,
+    ):
+        self.factor_bounds = {
+            factor: (float(low), float(high))
+            for factor, (low, high) in factor_bounds.items()
+        }
+        self.factors = list(self.factor_bounds)
+        self.compartments = list(compartments)
+        self.time_range = np.asarray(time_range, dtype=float)
+        self.exponents = np.asarray(exponents, dtype=int)
+        self.coefficients = np.asarray(coefficients, dtype=float)
+        self.components = np.asarray(components, dtype=float)
+        self.mean_curve = np.asarray(mean_curve, dtype=float)
+        self.validation_error = validation_error
+        # (mean, standard deviation) of the normal draws of the epidemic factors by factor
+        self.draw_distribution = {
+            factor: (float(mean), float(std))
+            for factor, (mean, std) in (draw_distribution or dict()).items()
+        }
+
+    @staticmethod
+    def log_curves(totals, compartment_indices):
+        """log of the curves of (rows, compartments, time) totals laid out as a row per run"""
+        curves = np.maximum(totals[:, compartment_indices], 0)
+        return np.log1p(curves).reshape(len(curves), -1)
+
+    def scale_design(self, design):
+        """map factor values onto [-1, 1]"""
+        low, high = np.array(list(self.factor_bounds.values())).T
+        return 2 * (np.asarray(design, dtype=float) - low) / (high - low) - 1
+
+    @classmethod
+    def train(
+        cls,
+        model,
+        scenario,
+        factor_bounds,
+        num_training_runs=1024,
+        num_validation_runs=128,
+        compartments=None,
+        degree=None,
+        explained_variance=None,
+        seed=None,
+        t_stop=200,
+        **integrate_kwargs,
+    ):
+        """train an emulator on solver runs of the scenario at scrambled Sobol points of the factor box and measure its error on held-out runs at random points
+
+        factor_bounds maps factors to (low, high) bounds as in run_sobol_analysis, scenario factors replace the ones
+        of the scenario throughout the run.
+        """
+        factors = list(factor_bounds)
+        for factor in factors:
+            assert (
+                factor in EPIDEMIC_FACTORS + SCENARIO_FACTORS
+            ), f"{factor} is not a factor of the model"
+        if compartments is None:
+            compartments = EMULATED_COMPARTMENTS
+        if degree is None:
+            degree = Config.emulator_params["degree"]
+        if explained_variance is None:
+            explained_variance = Config.emulator_params["explained_variance"]
+        exponents = legendre_exponents(len(factors), degree)
+        assert num_training_runs >= len(
+            exponents
+        ), f"{len(exponents)} training runs are needed for degree {degree}"
+        low, high = np.array(list(factor_bounds.values()), dtype=float).T
+        training_design = qmc.scale(
+            qmc.Sobol(len(factors), scramble=True, seed=seed).random(num_training_runs),
+            low,
+            high,
+        )
+        rng = np.random.default_rng(seed)
+        validation_design = low + (high - low) * rng.random(
+            (num_validation_runs, len(factors))
+        )
+        name_to_index = {name: i for i, name in enumerate(Config.longname.values())}
+        compartment_indices = [name_to_index[name] for name in compartments]
+        totals = np.concatenate(
+            list(
+                integrate_design(
+                    model,
+                    scenario,
+                    factors,
+                    np.concatenate([training_design, validation_design]),
+                    t_stop,
+                    **integrate_kwargs,
+                )
+            )
+        )
+        curves = cls.log_curves(totals, compartment_indices)
+        training_curves = curves[:num_training_runs]
+        mean_curve = training_curves.mean(axis=0)
+        _, singular_values, components = np.linalg.svd(
+            training_curves - mean_curve, full_matrices=False
+        )
+        variance_share = np.cumsum(singular_values ** 2) / max(
+            np.sum(singular_values ** 2), np.finfo(float).tiny
+        )
+        num_components = int(np.searchsorted(variance_share, explained_variance)) + 1
+        components = components[:num_components]
+        emulator = cls(
+            factor_bounds,
+            compartments,
+            np.arange(t_stop + 1),
+            exponents,
+            np.zeros((len(exponents), num_components)),
+            components,
+            mean_curve,
+            draw_distribution={
+                factor: distribution
+                for factor, distribution in model.epidemic_parameter_distribution().items()
+                if factor in factors
+            },
+        )
+        features = legendre_features(emulator.scale_design(training_design), exponents)
+        scores = (training_curves - mean_curve) @ components.T
+        # ridge regression keeps the fit stable when the design barely determines the high degree terms
+        gram = features.T @ features
+        ridge = Config.emulator_params["ridge"] * np.trace(gram) / len(gram)
+        emulator.coefficients = np.linalg.solve(
+            gram + ridge * np.eye(len(gram)), features.T @ scores
+        )
+        if num_validation_runs > 0:
+            emulator.validation_error = emulator.prediction_error(
+                validation_design, totals[num_training_runs:]
+            )
+        return emulator
+
+    def predict(self, design):
+        """daily curves at every row of a design of factor values, a (rows, time) array per compartment"""
+        design = np.atleast_2d(np.asarray(design, dtype=float))
+        features = legendre_features(self.scale_design(design), self.exponents)
+        curves = np.expm1(
+            self.mean_curve + (features @ self.coefficients) @ self.components
+        ).reshape(len(design), len(self.compartments), len(self.time_range))
+        return {
+            compartment: np.maximum(curves[:, i], 0)
+            for i, compartment in enumerate(self.compartments)
+        }
+
+    def prediction_error(self, design, totals):
+        """error of the predictions at a design against the (rows, compartments, time) totals of solver runs there"""
+        predictions = self.predict(design)
+        name_to_index = {name: i for i, name in enumerate(Config.longname.values())}
+        rows = []
+        for compartment, predicted in predictions.items():
+            exact = totals[:, name_to_index[compartment]]
+            errors = predicted - exact
+            rmse = np.sqrt(np.mean(errors ** 2))
+            rows.append(
+                {
+                    "Compartment": compartment,
+                    "RMSE": rmse,
+                    "Max_abs_error": np.abs(errors).max(),
+                    "Relative_RMSE": rmse / max(np.sqrt(np.mean(exact ** 2)), 1e-12),
+                    # largest error of each run relative to its peak
+                    "Median_relative_error": np.median(
+                        np.abs(errors).max(axis=1) / np.maximum(exact.max(axis=1), 1)
+                    ),
+                }
+            )
+        return pd.DataFrame(rows)
+
+    def sample_design(
+        self, fixed_values=None, num_draws=1000, seed=None, generated_params_df=None
+    ):
+        """draws of the factors with the fixed ones held at their values, the epidemic ones drawn like the model draws them or taken from the rows of generated_params_df and the rest uniform over their bounds, clipped to the bounds"""
+        fixed_values = dict() if fixed_values is None else fixed_values
+        for factor, value in fixed_values.items():
+            assert factor in self.factor_bounds, f"{factor} is not emulated"
+            low, high = self.factor_bounds[factor]
+            assert low <= value <= high, f"{factor} is outside the trained bounds"
+        if generated_params_df is not None:
+            num_draws = len(generated_params_df)
+        rng = np.random.default_rng(seed)
+        design = np.empty((num_draws, len(self.factors)))
+        for i, (factor, (low, high)) in enumerate(self.factor_bounds.items()):
+            if factor in fixed_values:
+                design[:, i] = fixed_values[factor]
+            elif generated_params_df is not None and factor in generated_params_df:
+                design[:, i] = generated_params_df[factor].to_numpy()
+            elif factor in self.draw_distribution:
+                mean, std = self.draw_distribution[factor]
+                values = rng.normal(mean, std, num_draws)
+                # the lower bound of generate_epidemic_parameter_ranges
+                design[:, i] = np.where(values <= 1, 1, values)
+            else:
+                design[:, i] = rng.uniform(low, high, num_draws)
+        # the polynomials don't extrapolate past the box they were fitted on
+        low, high = np.array(list(self.factor_bounds.values())).T
+        return np.clip(design, low, high)
+
+    def bands_of_curves(self, curves, quantiles):
+        """frame of the daily quantiles of (draws, time) curves per compartment"""
+        bands = {"Time": self.time_range}
+        for compartment, values in curves.items():
+            for quantile, band in zip(
+                quantiles, np.quantile(values, quantiles, axis=0)
+            ):
+                bands[f"{compartment}_q{quantile:g}"] = band
+        return pd.DataFrame(bands)
+
+    def percentile_bands(
+        self,
+        fixed_values=None,
+        num_draws=1000,
+        quantiles=(0.05, 0.5, 0.95),
+        seed=None,
+        generated_params_df=None,
+    ):
+        """daily quantiles of the emulated curves over the draws of sample_design"""
+        return self.bands_of_curves(
+            self.predict(
+                self.sample_design(fixed_values, num_draws, seed, generated_params_df)
+            ),
+            quantiles,
+        )
+
+    def verify(
+        self,
+        model,
+        scenario,
+        fixed_values=None,
+        num_draws=1000,
+        quantiles=(0.05, 0.5, 0.95),
+        seed=None,
+        generated_params_df=None,
+        **integrate_kwargs,
+    ):
+        """start solver runs on the draws percentile_bands uses with the same arguments on a background thread, the future gives the exact bands and the error of the emulated ones"""
+        design = self.sample_design(fixed_values, num_draws, seed, generated_params_df)
+        name_to_index = {name: i for i, name in enumerate(Config.longname.values())}
+
+        def exact_bands():
+            totals = np.concatenate(
+                list(
+                    integrate_design(
+                        model,
+                        scenario,
+                        self.factors,
+                        design,
+                        len(self.time_range) - 1,
+                        **integrate_kwargs,
+                    )
+                )
+            )
+            return (
+                self.bands_of_curves(
+                    {
+                        compartment: totals[:, name_to_index[compartment]]
+                        for compartment in self.compartments
+                    },
+                    quantiles,
+                ),
+                self.prediction_error(design, totals),
+            )
+
+        executor = ThreadPoolExecutor(max_workers=1)
+        future = executor.submit(exact_bands)
+        # the thread finishes the runs and exits without anyone waiting on the executor
+        executor.shutdown(wait=False)
+        return future
+
+    def save(self, path):
+        """write the emulator to a .npz file"""
+        arrays = dict(
+            factors=np.array(self.factors),
+            factor_bounds=np.array(list(self.factor_bounds.values())),
+            compartments=np.array(self.compartments),
+            time_range=self.time_range,
+            exponents=self.exponents,
+            coefficients=self.coefficients,
+            components=self.components,
+            mean_curve=self.mean_curve,
+        )
+        if self.validation_error is not None:
+            arrays["validation_columns"] = np.array(
+                self.validation_error.columns[1:], dtype=str
+            )
+            arrays["validation_values"] = self.validation_error.iloc[:, 1:].to_numpy(
+                dtype=float
+            )
+        if self.draw_distribution:
+            arrays["distribution_factors"] = np.array(list(self.draw_distribution))
+            arrays["distribution_values"] = np.array(
+                list(self.draw_distribution.values())
+            )
+        np.savez_compressed(path, **arrays)
+
+    @classmethod
+    def load(cls, path):
+        """read an emulator written by save"""
+        with np.load(path, allow_pickle=False) as arrays:
+            validation_error = None
+            draw_distribution = None
+            if "distribution_values" in arrays:
+                draw_distribution = dict(
+                    zip(
+                        arrays["distribution_factors"].tolist(),
+                        arrays["distribution_values"],
+                    )
+                )
+            if "validation_values" in arrays:
+                validation_error = pd.DataFrame(
+                    arrays["validation_values"],
+                    columns=arrays["validation_columns"].tolist(),
+                )
+                validation_error.insert(
+                    0, "Compartment", arrays["compartments"].tolist()
+                )
+            return cls(
+                dict(zip(arrays["factors"].tolist(), arrays["factor_bounds"])),
+                arrays["compartments"].tolist(),
+                arrays["time_range"],
+                arrays["exponents"],
+                arrays["coefficients"],
+                arrays["components"],
+                arrays["mean_curve"],
+                validation_error,
+                draw_distribution,
+            )
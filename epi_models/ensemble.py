@@ -0,0 +1,141 @@
+import numpy as np
+import pandas as pd
+
+from .config.compartmental_model import Config
+
+
+def num_times_of(frame):
+    """number of time points of every draw in a result frame"""
+    time_values = frame["Time"].to_numpy()
+    return len(frame) // np.count_nonzero(time_values == time_values[0])
+
+
+def ensemble_array(frame, columns, num_times=None):
+    """values of a result frame laid out as a (draws, time) array for a column or (draws, time, columns) for a list of columns, the draws are the contiguous blocks of rows run_single_simulation gives"""
+    if num_times is None:
+        num_times = num_times_of(frame)
+    values = frame[columns].to_numpy(dtype=float)
+    return values.reshape((len(frame) // num_times, num_times) + values.shape[1:])
+
+
+def threshold_crossing_times(values, threshold, time_range=None):
+    """first time every draw of a (draws, time) array reaches the threshold with linear interpolation between the time points, NaN for the draws that never reach it"""
+    values = np.asarray(values, dtype=float)
+    num_draws, num_times = values.shape
+    if time_range is None:
+        time_range = np.arange(num_times)
+    time_range = np.asarray(time_range, dtype=float)
+    threshold = np.broadcast_to(np.asarray(threshold, dtype=float), (num_draws,))
+    reached = values >= threshold[:, None]
+    crossed = reached.any(axis=1)
+    after = np.argmax(reached, axis=1)
+    before = np.maximum(after - 1, 0)
+    draws = np.arange(num_draws)
+    value_before = values[draws, before]
+    value_after = values[draws, after]
+    step = value_after - value_before
+    share_of_step = np.divide(
+        threshold - value_before,
+        step,
+        out=np.zeros(num_draws),
+        where=(after > 0) & (step > 0),
+    )
+    crossing_times = time_range[before] + share_of_step * (
+        time_range[after] - time_range[before]
+    )
+    return np.where(crossed, crossing_times, np.nan)
+
+
+def compartment_crossing_times(frame, column, threshold, num_times=None):
+    """first day every draw of a result frame reaches the threshold in a column"""
+    if num_times is None:
+        num_times = num_times_of(frame)
+    return threshold_crossing_times(
+        ensemble_array(frame, column, num_times),
+        threshold,
+        ensemble_array(frame, "Time", num_times)[0],
+    )
+
+
+def reaction_delays(frame, symptomatic_share=None, deaths=None):
+    """days until the symptomatic infections reach a share of the population and until the first death for every draw of a result frame"""
+    if symptomatic_share is None:
+        symptomatic_share = Config.reaction_delay_params["symptomatic_share"]
+    if deaths is None:
+        deaths = Config.reaction_delay_params["deaths"]
+    num_times = num_times_of(frame)
+    time_range = ensemble_array(frame, "Time", num_times)[0]
+    # everybody is in one of the compartments so the population comes from the start of every draw
+    population = ensemble_array(frame, list(Config.longname.values()), num_times)[
+        :, 0, :
+    ].sum(axis=1)
+    return pd.DataFrame(
+        {
+            "R0": ensemble_array(frame, "R0", num_times)[:, 0],
+            "Symptomatic_threshold_day": threshold_crossing_times(
+                ensemble_array(frame, "Infected_symptomatic", num_times),
+                symptomatic_share * population,
+                time_range,
+            ),
+            "First_death_day": threshold_crossing_times(
+                ensemble_array(frame, "Deaths", num_times), deaths, time_range
+            ),
+        }
+    )
+
+
+def smooth_minimum(a, b, width):
+    """smooth approximation of np.minimum(a, b) for a that is never negative, (a + b - sqrt((a - b) ** 2 + w ** 2)) / 2 with w = width * a / (a + width)
+
+    It lies below the minimum by at most w / 2 <= width / 2, reached where a equals b, and by w ** 2 / (4 |a - b|) away
+    from it. The width tapers off with a, so the minimum is exact while a is zero: nothing moves when there is nobody
+    to move. A width of zero gives np.minimum.
+    """
+    if not np.any(width):
+        return np.minimum(a, b)
+    tapered_width = width * a / (a + width)
+    return (a + b - np.sqrt((a - b) ** 2 + tapered_width ** 2)) / 2
+
+
+def perron_roots(
+    matrices, start_vectors=None, tol=1e-10, max_iterations=100, squarings=4
+):
+    """largest eigenvalue of every nonnegative matrix of a (n, k, k) stack by batched power iteration, stopped once the Collatz-Wielandt bounds agree within the relative tolerance, the eigenvectors are returned as well to warm-start a stack of similar matrices
+
+    Each step multiplies by the matrix raised to the power 2 ** squarings, worked out by repeated squaring of the
+    matrix scaled by its largest row sum, so the iteration needs that many times fewer steps.
+    """
+    matrices = np.asarray(matrices, dtype=float)
+    num_matrices, size, _ = matrices.shape
+    if start_vectors is None:
+        vectors = np.full((num_matrices, size), 1 / size)
+    else:
+        vectors = np.array(start_vectors, dtype=float)
+    # the largest row sum bounds the eigenvalue so the scaled powers can't overflow
+    scale = matrices.sum(axis=2).max(axis=1)
+    scale[scale <= 0] = 1
+    powers = matrices / scale[:, None, None]
+    for _ in range(squarings):
+        powers = powers @ powers
+    roots = np.zeros(num_matrices)
+    active = np.arange(num_matrices)
+    for _ in range(max_iterations):
+        x = vectors[active]
+        y = np.einsum("nij,nj->ni", powers[active], x)
+        positive = x > 0
+        ratios = np.divide(y, x, out=np.zeros_like(y), where=positive)
+        # the eigenvalue lies between the smallest and largest ratio over the entries the vector is positive on
+        lower = np.where(positive, ratios, np.inf).min(axis=1)
+        upper = np.where(positive, ratios, -np.inf).max(axis=1)
+        total = y.sum(axis=1)
+        vanished = total <= 0
+        vectors[active] = np.divide(
+            y, total[:, None], out=np.full_like(y, 1 / size), where=~vanished[:, None]
+        )
+        roots[active] = np.where(vanished, 0, (lower + upper) / 2)
+        # bounds on the power within the tolerance bound the eigenvalue well within it
+        converged = vanished | (upper - lower <= tol * np.abs(upper))
+        active = active[~converged]
+        if len(active) == 0:
+            break
+    return scale * roots ** (1 / 2 ** squarings), vectors
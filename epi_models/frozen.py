@@ -0,0 +1,35 @@
+import copyreg
+from types import MappingProxyType
+
+import numpy as np
+
+
+def read_only_array(value, dtype=None):
+    """read-only array of a value, arrays that are already read-only are shared rather than copied"""
+    if (
+        isinstance(value, np.ndarray)
+        and not value.flags.writeable
+        and (dtype is None or value.dtype == dtype)
+    ):
+        return value
+    array = np.array(value, dtype=dtype)
+    array.setflags(write=False)
+    return array
+
+
+def freeze_param_dict(param_dict):
+    """read-only view of a parameter record with its arrays made read-only, so the scenarios, caches and runs sharing it can't change it for the others"""
+    return MappingProxyType(
+        {
+            key: read_only_array(value) if isinstance(value, np.ndarray) else value
+            for key, value in param_dict.items()
+        }
+    )
+
+
+def _reduce_param_dict(param_dict):
+    return freeze_param_dict, (dict(param_dict),)
+
+
+# the records are pickled as plain dicts and frozen again, so scenarios can be sent to other processes
+copyreg.pickle(MappingProxyType, _reduce_param_dict)
@@ -0,0 +1,88 @@
+import numpy as np
+
+from .config.compartmental_model import Config
+
+
+class IntensityProfile(object):
+    """intensity of an intervention over the days since its window started, 1 is the full effect of the intervention and 0 the baseline"""
+
+    # profiles that stay at the full effect need no precomputed grid
+    constant = False
+
+    def intensity(self, days, window_length):
+        raise NotImplementedError
+
+    def intensity_grid(self, start, end, grid_step=None):
+        """points of a window the intensity is precomputed at and the intensity there"""
+        if grid_step is None:
+            grid_step = Config.intensity_profile_params["grid_step"]
+        num_points = int(np.ceil((end - start) / grid_step)) + 1
+        times = np.linspace(start, end, num_points)
+        intensity = np.asarray(
+            self.intensity(times - start, end - start), dtype=float
+        ) * np.ones(num_points)
+        return times, intensity
+
+
+class ConstantIntensity(IntensityProfile):
+    constant = True
+
+    def intensity(self, days, window_length):
+        return np.ones(np.shape(days))
+
+
+class LinearDecayIntensity(IntensityProfile):
+    """effect waning linearly down to a share of it by the end of the window"""
+
+    def __init__(self, final_intensity=None, duration=None):
+        if final_intensity is None:
+            final_intensity = Config.intensity_profile_params["decay_final_intensity"]
+        assert 0 <= final_intensity <= 1
+        assert duration is None or duration > 0
+        self.final_intensity = final_intensity
+        self.duration = duration
+
+    def intensity(self, days, window_length):
+        duration = window_length if self.duration is None else self.duration
+        if duration == 0:
+            return np.ones(np.shape(days))
+        return 1 - (1 - self.final_intensity) * np.clip(days / duration, 0, 1)
+
+
+class ExponentialDecayIntensity(IntensityProfile):
+    """effect halving every half life"""
+
+    def __init__(self, half_life):
+        assert half_life > 0
+        self.half_life = half_life
+
+    def intensity(self, days, window_length):
+        return 0.5 ** (np.asarray(days) / self.half_life)
+
+
+class RampUpIntensity(IntensityProfile):
+    """effect building up linearly to the full effect over the ramp days"""
+
+    def __init__(self, ramp_days):
+        assert ramp_days >= 0
+        self.ramp_days = ramp_days
+
+    def intensity(self, days, window_length):
+        if self.ramp_days == 0:
+            return np.ones(np.shape(days))
+        return np.clip(np.asarray(days) / self.ramp_days, 0, 1)
+
+
+class DailyIntensity(IntensityProfile):
+    """intensity given for every day of the window, the last value holds after the series runs out"""
+
+    def __init__(self, daily_intensity):
+        daily_intensity = np.asarray(daily_intensity, dtype=float)
+        assert daily_intensity.ndim == 1 and len(daily_intensity) >= 1
+        assert (daily_intensity >= 0).all()
+        self.daily_intensity = daily_intensity
+
+    def intensity(self, days, window_length):
+        return np.interp(
+            days, np.arange(len(self.daily_intensity)), self.daily_intensity
+        )
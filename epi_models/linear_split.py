@@ -0,0 +1,410 @@
+from copy import copy
+
+import numpy as np
+from scipy.linalg import expm
+
+from .config.compartmental_model import Config
+from .model_spec import DRAW_RATE_COLUMNS
+
+
+class LinearSplitEngine(object):
+    """Right hand side of a compartmental model split into a linear part and the rest for an ensemble of draws
+
+    Most flows are linear in the state for a given draw: E -> I/A, I -> R/H, A -> R, H -> R/U, C -> D, U -> D and
+    Q -> R/H. They make up an operator that is worked out once per draw and only couples the compartments within an
+    age compartment, so it is kept as a (draws, age categories, compartments, compartments) stack of blocks. The
+    infections and the flows limited by the interventions and the ICU capacity are the nonlinear part N(y) and the
+    right hand side is L @ y + N(y). Both parts are compiled from a ModelSpec, the one of the model by default.
+
+    integrate advances the ensemble with the second order exponential time differencing scheme of Cox and Matthews,
+    the linear part is integrated exactly by the matrix exponentials of the blocks, precomputed for the step, so the
+    fast transitions don't limit the step size. jacobian gives the cheap Jacobian of the split for implicit solvers.
+    """
+
+    # ensembles of up to this many draws apply the blocks of the linear part as a stack of small matrix products, the
+    # larger ones entry by entry on the compartments laid out first
+    max_matmul_draws = 256
+    # nodes of the Gauss-Legendre rule the inflows of the downstream compartments are integrated with over every day
+    quadrature_nodes = 3
+    # imaginary step of the derivatives of N(y) in jacobian, any step small against the states gives them to rounding
+    complex_step = 1e-20
+
+    def __init__(self, model, generated_params_df, steps_per_day=None, spec=None):
+        self.model = model
+        self.spec = model.spec if spec is None else spec
+        if steps_per_day is None:
+            steps_per_day = Config.linear_split_params["steps_per_day"]
+        assert steps_per_day >= 1
+        self.steps_per_day = int(steps_per_day)
+        self.generated_params_df = generated_params_df
+        self.draw_rates = {
+            name: generated_params_df[name].to_numpy(dtype=float)[:, None]
+            for name in DRAW_RATE_COLUMNS
+        }
+        self.num_draws = len(generated_params_df)
+        self.state_shape = (
+            self.num_draws,
+            model.age_categories,
+            self.spec.num_compartments,
+        )
+        self.set_linear_blocks(self.spec.linear_blocks(model, generated_params_df))
+        self.hook_names, self.hook_routing = self.spec.hook_routing()
+        # the draw rates and the parameters the hook works out from them once
+        self.hook_rates = dict(self.draw_rates)
+        if self.spec.hook_parameters is not None:
+            self.hook_rates.update(self.spec.hook_parameters(model, self.draw_rates))
+        # compartments the hook reads by their position in the state
+        self.hook_inputs = [
+            (code, self.spec.index[code]) for code in self.spec.nonlinear_inputs
+        ]
+        # share of every hook flow of every age compartment that is in the equations, None for all of them
+        self.hook_shares = None
+        downstream = [self.spec.index[code] for code in self.spec.downstream()]
+        self.dynamic = [
+            i for i in range(self.spec.num_compartments) if i not in downstream
+        ]
+        self.downstream = downstream
+
+    def set_linear_blocks(self, linear_blocks):
+        self.linear_blocks = linear_blocks
+        # the blocks are sparse so the linear term of large ensembles is worked out entry by entry
+        rows, columns = np.nonzero(np.any(self.linear_blocks != 0, axis=(0, 1)))
+        self.linear_entries = [
+            (row, column, np.ascontiguousarray(self.linear_blocks[:, :, row, column]))
+            for row, column in zip(rows, columns)
+        ]
+        self._propagators = None
+
+    def with_stochastic_mask(self, stochastic_mask):
+        """copy of the engine with the flows into or out of the infection chain of the specification left out in the age compartments of stochastic_mask, for the hybrid runs that advance them in whole people"""
+        engine = copy(self)
+        chain_blocks = self.spec.linear_blocks(
+            self.model,
+            self.generated_params_df,
+            [flow for flow in self.spec.flows if self.spec.in_chain(flow)],
+        )
+        engine.set_linear_blocks(
+            self.linear_blocks
+            - np.asarray(stochastic_mask)[None, :, None, None] * chain_blocks
+        )
+        in_chain = np.array(
+            [
+                self.spec.in_chain(flow)
+                for flow in self.spec.flows
+                if flow.hook is not None
+            ],
+            dtype=bool,
+        )
+        engine.hook_shares = 1.0 - np.outer(stochastic_mask, in_chain)
+        return engine
+
+    @property
+    def propagators(self):
+        """propagators of a step of the exponential integrator, worked out on first use"""
+        if self._propagators is None:
+            self._propagators = self.etd_propagators(1 / self.steps_per_day)
+        return self._propagators
+
+    def etd_propagators(self, step):
+        """exp(step * L) and the phi functions phi_1(step * L) and phi_2(step * L) of every block, from the exponential of the augmented block matrix [[step * L, I, 0], [0, 0, I], [0, 0, 0]]"""
+        size = self.spec.num_compartments
+        augmented = np.zeros(self.linear_blocks.shape[:2] + (3 * size, 3 * size))
+        augmented[..., :size, :size] = step * self.linear_blocks
+        augmented[..., :size, size : 2 * size] = np.eye(size)
+        augmented[..., size : 2 * size, 2 * size :] = np.eye(size)
+        exponential = expm(augmented.reshape(-1, 3 * size, 3 * size)).reshape(
+            augmented.shape
+        )
+        return tuple(
+            exponential[..., :size, i * size : (i + 1) * size] for i in range(3)
+        )
+
+    @staticmethod
+    def apply_blocks(blocks, y3d):
+        """product of the blocks and the (draws, age categories, compartments) states"""
+        return np.einsum("dakc,dac->dak", blocks, y3d)
+
+    def linear_term(self, y3d):
+        """L @ y of (draws, age categories, compartments) states"""
+        if self.num_draws <= self.max_matmul_draws:
+            return np.matmul(self.linear_blocks, y3d[..., None])[..., 0]
+        by_compartment = np.moveaxis(y3d, 2, 0)
+        change = np.zeros(by_compartment.shape)
+        for row, column, rate in self.linear_entries:
+            change[row] += rate * by_compartment[column]
+        return np.moveaxis(change, 0, 2)
+
+    def nonlinear_term(self, t, y3d, scenario, param_overrides=None, repeats=1):
+        """N(y) of (draws, age categories, compartments) states, with repeats consecutive states for every draw"""
+        return self.add_nonlinear_term(
+            np.zeros(y3d.shape, dtype=y3d.dtype),
+            t,
+            y3d,
+            scenario,
+            param_overrides,
+            repeats,
+        )
+
+    def add_nonlinear_term(
+        self, change, t, y3d, scenario, param_overrides=None, repeats=1
+    ):
+        """add N(y) of (draws, age categories, compartments) states to change in place and return it"""
+        if self.spec.nonlinear_hook is None:
+            return change
+        hook_rates = self.hook_rates
+        if repeats > 1:
+            hook_rates = {
+                name: np.repeat(rate, repeats, axis=0)
+                for name, rate in hook_rates.items()
+            }
+            if param_overrides is not None:
+                param_overrides = {
+                    key: np.repeat(value, repeats, axis=0) if np.ndim(value) else value
+                    for key, value in param_overrides.items()
+                }
+        change += (
+            self.hook_amounts(
+                self.model.ensemble_scenario_dict(scenario, t, param_overrides),
+                {code: y3d[:, :, i] for code, i in self.hook_inputs},
+                y3d.shape[:2],
+                hook_rates,
+                change.dtype,
+            )
+            @ self.hook_routing
+        )
+        return change
+
+    def hook_amounts(self, scenario_dict, states, shape, hook_rates=None, dtype=float):
+        """(draws, age categories, hook flows) amounts of the hook flows in the equations from the (draws, age categories) states of the nonlinear inputs by their codes, the flows that are off are 0"""
+        amounts = self.spec.nonlinear_hook(
+            self.model,
+            scenario_dict,
+            states,
+            self.hook_rates if hook_rates is None else hook_rates,
+        )
+        stacked = np.zeros(tuple(shape) + (len(self.hook_names),), dtype=dtype)
+        for i, name in enumerate(self.hook_names):
+            amount = amounts.get(name, 0)
+            if isinstance(amount, np.ndarray):
+                stacked[:, :, i] = amount
+        if self.hook_shares is not None:
+            stacked *= self.hook_shares
+        return stacked
+
+    def reshape_states(self, y):
+        return y.reshape(self.state_shape)
+
+    def rhs(self, t, y, scenario, param_overrides=None):
+        """L @ y + N(y), the right hand side of the equations of every draw"""
+        y3d = self.reshape_states(y)
+        return self.add_nonlinear_term(
+            self.linear_term(y3d), t, y3d, scenario, param_overrides
+        ).reshape(y.shape)
+
+    def jacobian(self, t, y, scenario, param_overrides=None):
+        """(draws, states, states) Jacobian of the right hand side, the linear blocks plus the derivatives of N(y) by complex steps
+
+        N(y) only depends on the nonlinear inputs of the specification (S, I, A, H, C and Q for COVID_SPEC) so all the
+        derivatives come from one evaluation of N(y) on the states stepped along the imaginary axis in each of those
+        columns, stacked together. The imaginary part of N(y + ih e_j) / h is its derivative along e_j to rounding
+        whatever the step, as the hook only adds, multiplies, divides and picks the branch of a minimum by the real part.
+        """
+        _, num_ages, size = self.state_shape
+        y3d = self.reshape_states(y)
+        jacobian = np.zeros((self.num_draws, num_ages, size, num_ages, size))
+        ages = np.arange(num_ages)
+        jacobian[:, ages, :, ages, :] = np.moveaxis(self.linear_blocks, 1, 0)
+        if not self.spec.nonlinear_inputs:
+            return jacobian.reshape(self.num_draws, num_ages * size, num_ages * size)
+        columns = [
+            (age, self.spec.index[compartment])
+            for age in range(num_ages)
+            for compartment in self.spec.nonlinear_inputs
+        ]
+        column_ages, column_compartments = np.array(columns).T
+        stepped = np.repeat(y3d[:, None].astype(complex), len(columns), axis=1)
+        stepped[:, np.arange(len(columns)), column_ages, column_compartments] += (
+            1j * self.complex_step
+        )
+        derivatives = (
+            self.nonlinear_term(
+                t,
+                stepped.reshape((-1,) + y3d.shape[1:]),
+                scenario,
+                param_overrides,
+                repeats=len(columns),
+            )
+            .reshape(stepped.shape)
+            .imag
+            / self.complex_step
+        )
+        jacobian[:, :, :, column_ages, column_compartments] += np.moveaxis(
+            derivatives, 1, -1
+        )
+        return jacobian.reshape(self.num_draws, num_ages * size, num_ages * size)
+
+    def dynamic_mask(self):
+        """mask of the states of a draw, compartments * age categories, that are integrated when the downstream compartments are left out"""
+        mask = np.zeros((self.model.age_categories, self.spec.num_compartments), bool)
+        mask[:, self.dynamic] = True
+        return mask.ravel()
+
+    def reduced(self):
+        """engine of the equations of the dynamic compartments only, on the specification without the downstream compartments"""
+        return LinearSplitEngine(
+            self.model,
+            self.generated_params_df,
+            self.steps_per_day,
+            self.spec.reduced(),
+        )
+
+    def quadrature_times(self, time_range):
+        """(days, nodes) times within every day of time_range the inflows of the downstream compartments are integrated at"""
+        nodes, _ = np.polynomial.legendre.leggauss(self.quadrature_nodes)
+        return np.asarray(time_range, dtype=float)[:-1, None] + (nodes + 1) / 2
+
+    def stacked_hook_amounts(self, times, states, scenario, param_overrides=None):
+        """(times, draws, age categories, hook flows) amounts of the hook flows from the (times, draws, age categories, dynamic compartments) states at an array of times
+
+        The hook runs once for all the times the infection matrix is the same at, the other parameters of the scenario
+        that change between those times are passed to it as (rows, 1) arrays like the parameters of the draws.
+        """
+        num_times, num_draws, num_ages = states.shape[:3]
+        scenario_dicts = [scenario.intervention_params_at_time_t(t) for t in times]
+        groups = dict()
+        for k, scenario_dict in enumerate(scenario_dicts):
+            groups.setdefault(id(scenario_dict["infection_matrix"]), []).append(k)
+        inputs = [
+            (code, self.dynamic.index(self.spec.index[code]))
+            for code in self.spec.nonlinear_inputs
+        ]
+        amounts = np.zeros((num_times, num_draws, num_ages, len(self.hook_names)))
+        for group in groups.values():
+            # rows of the stack run through the draws at every time of the group
+            rows = len(group) * num_draws
+            scenario_dict = dict(scenario_dicts[group[0]])
+            for key, value in scenario_dict.items():
+                values = [scenario_dicts[k][key] for k in group]
+                if key != "infection_matrix" and len(set(values)) > 1:
+                    scenario_dict[key] = np.repeat(
+                        np.asarray(values, dtype=float), num_draws
+                    )[:, None]
+            for key, value in (param_overrides or dict()).items():
+                scenario_dict[key] = (
+                    np.tile(value, (len(group), 1)) if np.ndim(value) else value
+                )
+            amounts[group] = self.hook_amounts(
+                scenario_dict,
+                {
+                    code: states[group, :, :, i].reshape(rows, num_ages)
+                    for code, i in inputs
+                },
+                (rows, num_ages),
+                {
+                    name: np.tile(rate, (len(group), 1))
+                    for name, rate in self.hook_rates.items()
+                },
+            ).reshape(len(group), num_draws, num_ages, -1)
+        return amounts
+
+    def recover_downstream(
+        self,
+        y0,
+        time_range,
+        dynamic_states,
+        node_states,
+        scenario,
+        param_overrides=None,
+    ):
+        """states of every draw as a (draws, compartments * age categories, time) array from an integration of the states of dynamic_mask only
+
+        dynamic_states are the integrated states of every draw one after the other at the whole days of time_range,
+        (states, time), and node_states the same at the quadrature_times, (states, days, nodes), both read off the dense
+        output of the solver. The downstream compartments start from y0, the state every draw starts from, and follow
+        the linear system of their blocks driven by their inflows from the dynamic compartments. It is stepped through
+        every day exactly, exp(L) of the blocks times the state plus the inflows integrated against exp((1 - s) L) by
+        the Gauss-Legendre rule on the nodes.
+        """
+        time_range = np.asarray(time_range, dtype=float)
+        assert np.allclose(
+            np.diff(time_range), 1
+        ), "the downstream compartments are stepped through whole days"
+        num_ages = self.model.age_categories
+        num_days = len(time_range) - 1
+        dynamic_shape = (self.num_draws, num_ages, len(self.dynamic))
+        nodes, weights = np.polynomial.legendre.leggauss(self.quadrature_nodes)
+        # (days, nodes, draws, age categories, dynamic compartments) states at the nodes
+        states = np.moveaxis(
+            node_states.reshape(dynamic_shape + node_states.shape[1:]), (3, 4), (0, 1)
+        )
+        inflows = np.matmul(
+            self.linear_blocks[:, :, self.downstream][:, :, :, self.dynamic],
+            states[..., None],
+        )[..., 0]
+        hook_routing = self.hook_routing[:, self.downstream]
+        if self.spec.nonlinear_hook is not None and hook_routing.any():
+            inflows += (
+                self.stacked_hook_amounts(
+                    self.quadrature_times(time_range).ravel(),
+                    states.reshape((-1,) + dynamic_shape),
+                    scenario,
+                    param_overrides,
+                )
+                @ hook_routing
+            ).reshape(inflows.shape)
+        # exp(L) of the downstream blocks and exp((1 - s) L) at the nodes s of the day, worked out once for every
+        # distinct block
+        blocks = self.linear_blocks[:, :, self.downstream][:, :, :, self.downstream]
+        size = len(self.downstream)
+        distinct_blocks, block_index = np.unique(
+            blocks.reshape(-1, size, size), axis=0, return_inverse=True
+        )
+        fractions = np.append(1, (1 - nodes) / 2)
+        propagators = expm(
+            (fractions[:, None, None, None] * distinct_blocks).reshape(-1, size, size)
+        ).reshape((len(fractions),) + distinct_blocks.shape)[:, block_index.ravel()]
+        propagators = propagators.reshape((len(fractions),) + blocks.shape)
+        daily_inflows = np.matmul(
+            weights[:, None, None, None, None] / 2 * propagators[1:], inflows[..., None]
+        )[..., 0].sum(axis=1)
+        y_out = np.empty(
+            (self.num_draws, num_ages, self.spec.num_compartments, len(time_range))
+        )
+        y_out[:, :, self.dynamic] = dynamic_states.reshape(dynamic_shape + (-1,))
+        downstream = np.broadcast_to(
+            np.asarray(y0).reshape(num_ages, -1)[:, self.downstream],
+            (self.num_draws, num_ages, size),
+        )
+        y_out[:, :, self.downstream, 0] = downstream
+        for day in range(num_days):
+            downstream = (
+                self.apply_blocks(propagators[0], downstream) + daily_inflows[day]
+            )
+            y_out[:, :, self.downstream, day + 1] = downstream
+        return y_out.reshape(self.num_draws, -1, len(time_range))
+
+    def integrate(self, scenario, y0, time_range, param_overrides=None):
+        """states of every draw at the whole days of time_range as a (draws, compartments * age categories, time) array, y0 is the state every draw starts from"""
+        time_range = np.asarray(time_range, dtype=float)
+        assert np.allclose(
+            np.diff(time_range), 1
+        ), "the exponential integrator steps through whole days"
+        exponential, phi_1, phi_2 = self.propagators
+        step = 1 / self.steps_per_day
+        y3d = np.tile(y0, self.num_draws).reshape(self.state_shape)
+        y_out = np.empty((self.num_draws, len(y0), len(time_range)))
+        y_out[:, :, 0] = y3d.reshape(self.num_draws, -1)
+        t = time_range[0]
+        for day in range(1, len(time_range)):
+            for _ in range(self.steps_per_day):
+                nonlinear = self.nonlinear_term(t, y3d, scenario, param_overrides)
+                predictor = self.apply_blocks(
+                    exponential, y3d
+                ) + step * self.apply_blocks(phi_1, nonlinear)
+                corrector = self.nonlinear_term(
+                    t + step, predictor, scenario, param_overrides
+                )
+                y3d = predictor + step * self.apply_blocks(phi_2, corrector - nonlinear)
+                t += step
+            y_out[:, :, day] = y3d.reshape(self.num_draws, -1)
+        return y_out
@@ -0,0 +1,358 @@
+from typing import List
+
+import numpy as np
+import pandas as pd
+from scipy.integrate import ode
+
+from .config.compartmental_model import Config
+from .deterministic_compartmental_model import DeterministicCompartmentalModel
+from .linear_split import LinearSplitEngine
+from .model import ModelId
+from .model_spec import DRAW_RATE_COLUMNS
+from .params import CampParams
+from .time_budget import TimeBudget
+
+
+class ZoneScenarios(object):
+    """scenarios of the zones of a metapopulation model seen as one, the parameters of every zone are stacked along the first axis like the overrides of the draws of an ensemble"""
+
+    reactive = False
+
+    def __init__(self, scenarios):
+        self.scenarios = list(scenarios)
+
+    def intervention_params_at_time_t(self, t):
+        param_dicts = [
+            scenario.intervention_params_at_time_t(t) for scenario in self.scenarios
+        ]
+        zone_params = {
+            key: np.array([param_dict[key] for param_dict in param_dicts], dtype=float)[
+                :, None
+            ]
+            for key in [
+                "transmission_reduction_factor",
+                "isolation_capacity",
+                "remove_symptomatic_rate",
+                "first_high_risk_category_n",
+                "remove_high_risk_rate",
+                "icu_capacity",
+            ]
+        }
+        zone_params["infection_matrix"] = np.stack(
+            [param_dict["infection_matrix"] for param_dict in param_dicts]
+        )
+        return zone_params
+
+
+class MetapopulationModel(DeterministicCompartmentalModel):
+    """Deterministic compartmental model of a camp made up of zones coupled through a mobility matrix
+
+    Every zone has its own population, contact matrix and intervention scenario. mobility_matrix[z, w] is the share of
+    their time the residents of zone z spend in zone w, so residents of zone z are infected by the infectious people
+    present in each zone they visit with the contact matrix and the interventions of that zone. All the zones are
+    integrated together as one system, the zones take the place of the draws of an ensemble in the LinearSplitEngine
+    of the model so every flow is the one of the deterministic compartmental model, and the coupling is a couple of
+    tensor contractions in the infection pressure. With a single zone the model is the deterministic compartmental
+    model.
+    """
+
+    def __init__(
+        self,
+        zone_params: List[CampParams],
+        mobility_matrix,
+        num_iterations=1000,
+        zone_names=None,
+    ):
+        assert len(zone_params) >= 1
+        assert (
+            len({zone.country for zone in zone_params}) == 1
+        ), "all the zones need to be in the same country"
+        # the camp as a whole gives the epidemic parameters of the draws
+        camp_params = dict(zone_params[0].__dict__)
+        for age in [
+            "0_9",
+            "10_19",
+            "20_29",
+            "30_39",
+            "40_49",
+            "50_59",
+            "60_69",
+            "70_above",
+        ]:
+            camp_params[f"population_age_{age}"] = sum(
+                getattr(zone, f"population_age_{age}") for zone in zone_params
+            )
+        super().__init__(CampParams(camp_params), num_iterations)
+        self.num_zones = len(zone_params)
+        self.zone_names = (
+            [f"zone_{i}" for i in range(self.num_zones)]
+            if zone_names is None
+            else list(zone_names)
+        )
+        assert len(self.zone_names) == self.num_zones
+        zones = [self.process_and_load_camp_parameters(zone) for zone in zone_params]
+        self.zone_population_vectors = np.stack([zone[0] for zone in zones])
+        self.zone_population_sizes = np.array([zone[1] for zone in zones])
+        self.zone_infection_matrices = [zone[2] for zone in zones]
+        self.mobility_matrix = np.asarray(mobility_matrix, dtype=float)
+        assert self.mobility_matrix.shape == (self.num_zones, self.num_zones)
+        assert (self.mobility_matrix >= 0).all()
+        assert np.allclose(
+            self.mobility_matrix.sum(axis=1), 1
+        ), "the time residents spend across the zones needs to add up to 1"
+        # number of residents of each zone present in each zone and the number of people present in every zone
+        self.mobility_people = (
+            self.mobility_matrix * self.zone_population_sizes[:, None]
+        )
+        self.present_population = self.mobility_people.sum(axis=0)
+
+    def id(self):
+        return ModelId.MetapopulationModel
+
+    def state_population_size(self):
+        return self.zone_population_sizes[:, None]
+
+    def infection_pressure(self, scenario_dict, I_vec, A_vec):
+        """infections a susceptible resident of every zone and age compartment gets a day per unit of beta, from the infectious present in the zones they visit"""
+        # infectious people present in every zone as a share of the people present there
+        infectious_present = (
+            np.einsum(
+                "zw,za->wa",
+                self.mobility_people,
+                I_vec + self.AsymptInfectiousFactor * A_vec,
+            )
+            / self.present_population[:, None]
+        )
+        # Intervention: shielding and better hygiene apply in the zone where the contacts happen
+        force_in_zone = scenario_dict["transmission_reduction_factor"] * np.einsum(
+            "wab,wb->wa", scenario_dict["infection_matrix"], infectious_present
+        )
+        return np.dot(self.mobility_matrix, force_in_zone)
+
+    def zone_engine(
+        self,
+        beta,
+        latent_rate,
+        removal_rate,
+        hosp_rate,
+        death_rate_ICU,
+        death_rate_no_ICU,
+    ):
+        """LinearSplitEngine of a draw with the zones in place of the draws of an ensemble"""
+        rates = (
+            beta,
+            latent_rate,
+            removal_rate,
+            hosp_rate,
+            death_rate_ICU,
+            death_rate_no_ICU,
+        )
+        return LinearSplitEngine(
+            self,
+            pd.DataFrame([dict(zip(DRAW_RATE_COLUMNS, rates))] * self.num_zones),
+        )
+
+    def ode_equations(
+        self,
+        t,
+        y,
+        beta,
+        latent_rate,
+        removal_rate,
+        hosp_rate,
+        death_rate_ICU,
+        death_rate_no_ICU,
+        scenario,
+    ):
+        """the equations of the deterministic compartmental model for all the zones at once, y holds the fractions of each zone's population and scenario is the list of zone scenarios, run_model compiles the engine once for the whole run instead"""
+        return self.zone_engine(
+            beta,
+            latent_rate,
+            removal_rate,
+            hosp_rate,
+            death_rate_ICU,
+            death_rate_no_ICU,
+        ).rhs(t, y, ZoneScenarios(scenario))
+
+    def _zone_seeds(self, initial_number):
+        """initial number of people of every zone, a single number is used for each zone"""
+        seeds = np.broadcast_to(np.asarray(initial_number, dtype=float), self.num_zones)
+        return seeds / self.zone_population_sizes
+
+    def run_model(
+        self,
+        scenario,
+        t_stop=200,
+        r0=None,
+        beta=None,
+        latent_rate=None,
+        removal_rate=None,
+        hosp_rate=None,
+        death_rate_ICU=None,
+        death_rate_no_ICU=None,
+        initial_exposed=0,
+        initial_symp=0,
+        initial_asymp=0,
+        intergrator_type="vode",
+        integrator_params=None,
+        time_budget=None,
+        hybrid=False,
+        rng=None,
+    ):
+        """run all the zones together via differential equation solver from scipy, scenario is the list of zone scenarios and the initial numbers are given for each zone"""
+        if hybrid:
+            raise NotImplementedError(
+                "hybrid runs are not available for the metapopulation model"
+            )
+        assert len(scenario) == self.num_zones
+        if any(zone_scenario.reactive for zone_scenario in scenario):
+            raise NotImplementedError(
+                "reactive scenarios are not available for the metapopulation model"
+            )
+        # initialise the epidemic in every zone
+        seir_matrix = np.zeros((self.num_zones, self.number_compartments))
+        seir_matrix[:, Config.compartment_index["E"]] = self._zone_seeds(
+            initial_exposed
+        )
+        seir_matrix[:, Config.compartment_index["I"]] = self._zone_seeds(initial_symp)
+        seir_matrix[:, Config.compartment_index["A"]] = self._zone_seeds(initial_asymp)
+        seir_matrix[:, Config.compartment_index["S"]] = 1 - seir_matrix.sum(axis=1)
+        y0 = (
+            self.zone_population_vectors[:, :, None] / 100 * seir_matrix[:, None, :]
+        ).reshape(-1)
+
+        if integrator_params is None:
+            integrator_params = {"name": intergrator_type, "nsteps": 5000}
+        engine = self.zone_engine(
+            beta,
+            latent_rate,
+            removal_rate,
+            hosp_rate,
+            death_rate_ICU,
+            death_rate_no_ICU,
+        )
+        budget = TimeBudget(time_budget)
+        sol = (
+            ode(budget.bound(engine.rhs))
+            .set_f_params(ZoneScenarios(scenario))
+            .set_integrator(**integrator_params)
+        )
+        time_range = np.arange(t_stop + 1)  # 1 time value per day
+        sol.set_initial_value(y0, time_range[0])
+        y_out = np.zeros((len(y0), len(time_range)))
+        y_out[:, 0] = sol.y
+        for t_sim, t in enumerate(time_range[1:], start=1):
+            sol.integrate(t)
+            budget.check()
+            if not sol.successful():
+                raise RuntimeError("ode solver unsuccessful")
+            y_out[:, t_sim] = sol.y
+
+        return self.parse_zone_output(
+            y_out,
+            time_range,
+            r0,
+            latent_rate,
+            removal_rate,
+            hosp_rate,
+            death_rate_ICU,
+            death_rate_no_ICU,
+        )
+
+    def parse_zone_output(
+        self,
+        y_out,
+        time_range,
+        r0,
+        latent_rate,
+        removal_rate,
+        hosp_rate,
+        death_rate_ICU,
+        death_rate_no_ICU,
+    ):
+        """the output of every zone in the layout of parse_model_output stacked zone after zone with a Zone column"""
+        y_zones = y_out.reshape(self.num_zones, -1, len(time_range))
+        zone_params_df = pd.DataFrame(
+            {
+                "R0": r0,
+                "latentRate": latent_rate,
+                "removalRate": removal_rate,
+                "hospRate": hosp_rate,
+                "deathRateICU": death_rate_ICU,
+                "deathRateNoICU": death_rate_no_ICU,
+            },
+            index=range(self.num_zones),
+        )
+        # parse_ensemble_output scales by the population of the whole camp
+        zone_frame = self.parse_ensemble_output(
+            y_zones
+            * (self.zone_population_sizes / self.population_size)[:, None, None],
+            time_range,
+            zone_params_df,
+        )
+        zone_frame["Zone"] = np.repeat(self.zone_names, len(time_range))
+        return zone_frame
+
+    def run_single_simulation(
+        self,
+        scenario,
+        generated_params_df=None,
+        t_stop=200,
+        initial_exposed=1,
+        initial_symp=1,
+        initial_asymp=1,
+        integrator_chain=None,
+        time_budget=Config.draw_time_budget,
+        hybrid=False,
+        seed=None,
+    ):
+        """run every draw for the list of zone scenarios, failed draws are kept as missing values like in the deterministic compartmental model"""
+        if generated_params_df is None:
+            generated_params_df = self.generate_epidemic_parameter_ranges(
+                self.num_iterations
+            )  # default run 1000 iterations
+        sols = []
+        failed_draws = []
+        for index, row in generated_params_df.iterrows():
+            sol, errors = self.run_model_with_fallback(
+                integrator_chain=integrator_chain,
+                time_budget=time_budget,
+                scenario=scenario,
+                t_stop=t_stop,
+                r0=row["R0"],
+                beta=row["beta"],
+                latent_rate=row["latentRate"],
+                removal_rate=row["removalRate"],
+                hosp_rate=row["hospRate"],
+                death_rate_ICU=row["deathRateICU"],
+                death_rate_no_ICU=row["deathRateNoICU"],
+                initial_exposed=initial_exposed,
+                initial_symp=initial_symp,
+                initial_asymp=initial_asymp,
+                hybrid=hybrid,
+            )
+            if sol is None:
+                # keep a block of missing values for the failed draw so the other draws stay aligned
+                sol = self.parse_zone_output(
+                    np.full(
+                        (
+                            self.num_zones
+                            * self.number_compartments
+                            * self.age_categories,
+                            t_stop + 1,
+                        ),
+                        np.nan,
+                    ),
+                    np.arange(t_stop + 1),
+                    row["R0"],
+                    row["latentRate"],
+                    row["removalRate"],
+                    row["hospRate"],
+                    row["deathRateICU"],
+                    row["deathRateNoICU"],
+                )
+                failed_draws.append({"draw": index, "errors": errors})
+            sols.append(sol)
+        simulation_result_frame = pd.concat(sols, axis=0)
+        simulation_result_frame.attrs["failed_draws"] = failed_draws
+        return simulation_result_frame
@@ -16,8 +16,9 @@ class Model(ABC):
     def load_epidemic_parameters(self):
         # TODO: put the paraemters from compartmental models here can then later refactor out some when other models are brought in
         # This is read in via config/epidemic_parameters.py and modified there as research is updated
+        # lists are loaded as tuples so the shared config can't be changed through a model
         for k, v in covid_specific_parameters.items():
-            setattr(self, k, v)
+            setattr(self, k, tuple(v) if isinstance(v, list) else v)
 
     @abstractmethod
     def process_epidemic_parameters(self):
@@ -52,6 +53,7 @@ class ModelId(Enum):
     StochasticCompartmentalModel = 1
     AgentBasedModel = 2
     NetworkModel = 3
+    MetapopulationModel = 4
 
 
 class ModelRunner(ABC):
@@ -0,0 +1,242 @@
+import numpy as np
+
+from .config.compartmental_model import Config
+
+# rates every draw of generated_params_df comes with
+DRAW_RATE_COLUMNS = [
+    "beta",
+    "latentRate",
+    "removalRate",
+    "hospRate",
+    "deathRateICU",
+    "deathRateNoICU",
+]
+
+
+class Flow(object):
+    """Flow of people from a source compartment to a target compartment, either one None for flows out of or into the model
+
+    A linear flow has a rate per person in the source, a Python expression of parameters that are columns of
+    generated_params_df (one value per draw), attributes of the model (scalars or one value per age compartment) or
+    numbers. The other flows are taken from the dict of amounts per draw and age compartment the nonlinear hook of the
+    specification returns, under the name given as hook, a hook flow left out of the dict or given as 0 is off.
+    """
+
+    def __init__(self, source, target, rate=None, hook=None):
+        assert (rate is None) != (hook is None), "a flow has either a rate or a hook"
+        assert source is not None or target is not None
+        assert rate is None or source is not None, "a linear flow needs a source"
+        self.source = source
+        self.target = target
+        self.rate = rate
+        self.hook = hook
+        self._code = None if rate is None else compile(rate, f"<flow {rate}>", "eval")
+
+    def rate_names(self):
+        """parameters the rate expression refers to"""
+        return () if self._code is None else self._code.co_names
+
+    def evaluate_rate(self, namespace):
+        return eval(self._code, {"__builtins__": {}}, namespace)
+
+    def __repr__(self):
+        rate = self.rate if self.hook is None else f"hook {self.hook}"
+        return f"Flow({self.source} -> {self.target}, {rate})"
+
+
+class ModelSpec(object):
+    """Declarative specification of a compartmental model: compartments, flows and the hook for the flows that depend on the interventions
+
+    compartments is a list of (code, long name) pairs in the order of the state vector of every age compartment.
+    nonlinear_hook(model, scenario_dict, states, draw_rates) returns the amounts of the hook flows as (draws, age
+    categories) arrays, where states maps the codes of nonlinear_inputs, the compartments it reads, to their (draws,
+    age categories) states and draw_rates holds the (draws, 1) columns of DRAW_RATE_COLUMNS together with what
+    hook_parameters(model, draw_rates) adds to them, the parameters of the hook worked out once per engine. The hook
+    sees the compartments by their codes only, so they can sit anywhere in the state. chain are the compartments of the
+    infection chain that hybrid runs advance in whole people where there are few infections, the flows into or out of
+    them are left out of the equations of those age compartments. A specification compiles into the blocks of the
+    linear operator and the routing of the hook flows that LinearSplitEngine integrates, the right hand side, its
+    Jacobian and the exponential integrator then come for free.
+    """
+
+    def __init__(
+        self,
+        compartments,
+        flows,
+        nonlinear_hook=None,
+        nonlinear_inputs=(),
+        chain=(),
+        hook_parameters=None,
+    ):
+        self.compartments = [tuple(compartment) for compartment in compartments]
+        self.index = {code: i for i, (code, _) in enumerate(self.compartments)}
+        assert len(self.index) == len(self.compartments), "compartment codes repeat"
+        self.flows = list(flows)
+        for flow in self.flows:
+            for code in [flow.source, flow.target]:
+                assert code is None or code in self.index, f"{flow} has no compartment"
+        assert nonlinear_hook is not None or not any(
+            flow.hook for flow in self.flows
+        ), "hook flows need a nonlinear hook"
+        self.nonlinear_hook = nonlinear_hook
+        self.nonlinear_inputs = list(nonlinear_inputs)
+        self.chain = list(chain)
+        assert all(code in self.index for code in self.chain)
+        assert all(code in self.index for code in self.nonlinear_inputs)
+        self.hook_parameters = hook_parameters
+
+    @property
+    def num_compartments(self):
+        return len(self.compartments)
+
+    def extended(self, compartments=(), flows=()):
+        """specification with more compartments, appended to the state of every age compartment, and flows"""
+        return ModelSpec(
+            self.compartments + list(compartments),
+            self.flows + list(flows),
+            self.nonlinear_hook,
+            self.nonlinear_inputs,
+            self.chain,
+            self.hook_parameters,
+        )
+
+    def downstream(self):
+        """compartments the nonlinear inputs don't depend on, they only pass on the people flowing into them among themselves so they can be left out of the integration and recovered from their inflows"""
+        upstream = set(self.nonlinear_inputs)
+        while True:
+            sources = {
+                flow.source
+                for flow in self.flows
+                if flow.rate is not None and flow.target in upstream
+            } - upstream
+            if not sources:
+                break
+            upstream |= sources
+        return [code for code, _ in self.compartments if code not in upstream]
+
+    def reduced(self):
+        """the specification without the downstream compartments, the flows into them leave the model and the hook flows out of them come from outside"""
+        downstream = self.downstream()
+        flows = [
+            Flow(
+                None if flow.source in downstream else flow.source,
+                None if flow.target in downstream else flow.target,
+                flow.rate,
+                flow.hook,
+            )
+            for flow in self.flows
+            if flow.source not in downstream or flow.hook is not None
+        ]
+        return ModelSpec(
+            [
+                compartment
+                for compartment in self.compartments
+                if compartment[0] not in downstream
+            ],
+            [
+                flow
+                for flow in flows
+                if flow.source is not None or flow.target is not None
+            ],
+            self.nonlinear_hook,
+            self.nonlinear_inputs,
+            self.chain,
+            self.hook_parameters,
+        )
+
+    def parameter_namespace(self, model, generated_params_df):
+        """values of the parameters the rates refer to, draw parameters as (draws, 1) arrays"""
+        namespace = dict()
+        for flow in self.flows:
+            for name in flow.rate_names():
+                if name in generated_params_df:
+                    namespace[name] = generated_params_df[name].to_numpy(dtype=float)[
+                        :, None
+                    ]
+                elif hasattr(model, name):
+                    namespace[name] = np.asarray(getattr(model, name), dtype=float)
+                else:
+                    raise RuntimeError(f"the rate parameter {name} is not defined")
+        return namespace
+
+    def in_chain(self, flow):
+        """whether the flow goes into or out of the infection chain"""
+        return flow.source in self.chain or flow.target in self.chain
+
+    def linear_blocks(self, model, generated_params_df, flows=None):
+        """(draws, age categories, compartments, compartments) blocks of the linear operator, entry (i, j) is the rate of flow into compartment i per person in compartment j, of the flows given or all of them"""
+        namespace = self.parameter_namespace(model, generated_params_df)
+        shape = (len(generated_params_df), model.age_categories)
+        blocks = np.zeros(shape + (self.num_compartments, self.num_compartments))
+        for flow in self.flows if flows is None else flows:
+            if flow.rate is None:
+                continue
+            rate = np.broadcast_to(flow.evaluate_rate(namespace), shape)
+            source = self.index[flow.source]
+            blocks[:, :, source, source] -= rate
+            if flow.target is not None:
+                blocks[:, :, self.index[flow.target], source] += rate
+        return blocks
+
+    def hook_routing(self):
+        """names of the hook flows and the (hook flows, compartments) change in every compartment per unit of each"""
+        hooks = [flow for flow in self.flows if flow.hook is not None]
+        routing = np.zeros((len(hooks), self.num_compartments))
+        for i, flow in enumerate(hooks):
+            if flow.source is not None:
+                routing[i, self.index[flow.source]] -= 1
+            if flow.target is not None:
+                routing[i, self.index[flow.target]] += 1
+        return [flow.hook for flow in hooks], routing
+
+    def output_columns(self, ages, age_separator="_"):
+        """columns of a result frame: the compartments summed over the age compartments and every compartment of every age compartment"""
+        names = [name for _, name in self.compartments]
+        return names, [name + age_separator + age for age in ages for name in names]
+
+
+def covid_nonlinear_flows(model, scenario_dict, states, draw_rates):
+    """the interventions and capacity limits of DeterministicCompartmentalModel"""
+    return model.ensemble_nonlinear_flows(scenario_dict, states, draw_rates)
+
+
+def covid_hook_parameters(model, draw_rates):
+    """rates of the ICU flows of every draw and age compartment"""
+    return {
+        "icu_recovery_rate": draw_rates["deathRateICU"]
+        * (1 - np.asarray(model.death_prob_with_ICU)),
+        "icu_need_rate": draw_rates["hospRate"]
+        * np.asarray(model.p_critical_given_hospitalised),
+        "icu_stay": 1 - draw_rates["deathRateICU"],
+    }
+
+
+# DeterministicCompartmentalModel
+COVID_SPEC = ModelSpec(
+    [(code, name) for code, name, _ in Config.compartments],
+    [
+        Flow("E", "I", "p_symptomatic * latentRate"),
+        Flow("E", "A", "(1 - p_symptomatic) * latentRate"),
+        Flow("I", "H", "p_hosp_given_symptomatic * removalRate"),
+        Flow("I", "R", "(1 - p_hosp_given_symptomatic) * removalRate"),
+        Flow("A", "R", "removalRate"),
+        Flow("H", "U", "p_critical_given_hospitalised * hospRate"),
+        Flow("H", "R", "(1 - p_critical_given_hospitalised) * hospRate"),
+        Flow("C", "D", "death_prob_with_ICU * deathRateICU"),
+        # the survivors leave critical care here and get back to hospital through the hook while there are beds
+        Flow("C", None, "(1 - death_prob_with_ICU) * deathRateICU"),
+        Flow("U", "D", "deathRateNoICU"),
+        Flow("Q", "H", "p_hosp_given_symptomatic * quarant_rate"),
+        Flow("Q", "R", "(1 - p_hosp_given_symptomatic) * quarant_rate"),
+        Flow("S", "E", hook="newly_exposed"),
+        Flow("S", "O", hook="offsite"),
+        Flow("I", "Q", hook="quarantine_sicks"),
+        Flow("Q", "I", hook="quarantined_sicks_sendback"),
+        Flow(None, "H", hook="recovered_on_icu"),
+        Flow("U", "C", hook="icu_cared"),
+    ],
+    covid_nonlinear_flows,
+    ["S", "I", "A", "H", "C", "Q"],
+    ["E", "I", "A"],
+    covid_hook_parameters,
+)
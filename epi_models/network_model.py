@@ -0,0 +1,253 @@
+from collections import OrderedDict
+from threading import Lock
+
+import numpy as np
+from scipy.sparse import coo_matrix, csr_matrix
+
+from .agent_based_model import AgentBasedModel
+from .config.compartmental_model import Config
+from .model import ModelId
+from .params import CampParams
+
+
+class NetworkModel(AgentBasedModel):
+    """Epidemic on a sparse contact network of the camp residents
+
+    The residents are the nodes of a CSR graph whose edges are household members plus contacts drawn from the age
+    structured contact matrix, part of them within the block of neighbouring households. Transmission each day is a
+    sparse matrix-vector product over the infectious nodes. The graph is built once per camp and cached, up to the
+    graph_cache_size of Config.network_model_params most recently used ones. Interventions changing the infection
+    matrix of a scenario (such as shielding) become edge weight masks on the same graph, the edge_mask_cache_size most
+    recently used ones kept by every model, and isolated residents drop out of the infectious set.
+    """
+
+    # graphs already built keyed by the camp and graph settings, least recently used first
+    _contact_graph_cache = OrderedDict()
+    # the caches are used by the models of every thread, the lock is kept on the class so the models still pickle
+    _cache_lock = Lock()
+
+    def __init__(
+        self,
+        camp_params: CampParams,
+        num_iterations=1000,
+        seed=None,
+        mean_household_size=None,
+        isolation_compliance=None,
+        households_per_block=None,
+        block_contact_share=None,
+        graph_seed=0,
+    ):
+        super().__init__(
+            camp_params,
+            num_iterations,
+            seed=seed,
+            mean_household_size=mean_household_size,
+            household_transmission_share=0,
+            isolation_compliance=isolation_compliance,
+        )
+        model_params = Config.network_model_params
+        self.households_per_block = int(
+            model_params["households_per_block"]
+            if households_per_block is None
+            else households_per_block
+        )
+        self.block_contact_share = float(
+            model_params["block_contact_share"]
+            if block_contact_share is None
+            else block_contact_share
+        )
+        assert self.households_per_block >= 1
+        assert 0 <= self.block_contact_share <= 1
+        self.base_infection_matrix = np.array(self.infection_matrix)
+        graph_key = (
+            camp_params.country,
+            tuple(self.population_counts),
+            self.mean_household_size,
+            self.isolation_compliance,
+            self.households_per_block,
+            self.block_contact_share,
+            graph_seed,
+        )
+        with self._cache_lock:
+            contact_graph = self._contact_graph_cache.get(graph_key)
+            if contact_graph is not None:
+                self._contact_graph_cache.move_to_end(graph_key)
+        if contact_graph is None:
+            # built outside the lock so the models of other camps don't wait on it, the first graph stored is kept
+            contact_graph = self.generate_contact_graph(
+                np.random.default_rng(graph_seed)
+            )
+            with self._cache_lock:
+                contact_graph = self._contact_graph_cache.setdefault(
+                    graph_key, contact_graph
+                )
+                while len(self._contact_graph_cache) > model_params["graph_cache_size"]:
+                    self._contact_graph_cache.popitem(last=False)
+        (
+            self.agents,
+            self.contact_graph,
+            self.edge_age_pairs,
+            self.graph_eigenvalue,
+        ) = contact_graph
+        # masks of the scenarios keyed by their infection matrix, least recently used first
+        self._edge_mask_cache = OrderedDict()
+
+    def id(self):
+        return ModelId.NetworkModel
+
+    @staticmethod
+    def _household_edges(household):
+        """pairs of residents sharing a household"""
+        order = np.argsort(household, kind="stable")
+        household_sorted = household[order]
+        rows, cols = [], []
+        offset = 1
+        while offset < len(order):
+            same_household = household_sorted[:-offset] == household_sorted[offset:]
+            if not same_household.any():
+                break
+            rows.append(order[:-offset][same_household])
+            cols.append(order[offset:][same_household])
+            offset += 1
+        if not rows:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+        return np.concatenate(rows), np.concatenate(cols)
+
+    def _community_edges(self, rng, age, block, expected_edges):
+        """contacts outside the household drawn between age compartments, some of them within the same block"""
+        num_blocks = block.max() + 1
+        # residents sorted by block then age so the residents of an age compartment in a block are contiguous
+        group = block * self.age_categories + age
+        residents_by_group = np.argsort(group, kind="stable")
+        group_counts = np.bincount(group, minlength=num_blocks * self.age_categories)
+        group_starts = np.cumsum(group_counts) - group_counts
+        residents_by_age = [
+            np.flatnonzero(age == i) for i in range(self.age_categories)
+        ]
+        rows, cols = [], []
+        for i in range(self.age_categories):
+            for j in range(i, self.age_categories):
+                num_edges = rng.poisson(expected_edges[i, j])
+                if num_edges == 0 or len(residents_by_age[j]) == 0:
+                    continue
+                sources = rng.choice(residents_by_age[i], num_edges)
+                targets = rng.choice(residents_by_age[j], num_edges)
+                target_group = block[sources] * self.age_categories + j
+                within_block = (rng.random(num_edges) < self.block_contact_share) & (
+                    group_counts[target_group] > 0
+                )
+                target_group = target_group[within_block]
+                targets[within_block] = residents_by_group[
+                    group_starts[target_group]
+                    + np.floor(
+                        rng.random(len(target_group)) * group_counts[target_group]
+                    ).astype(np.int64)
+                ]
+                rows.append(sources)
+                cols.append(targets)
+        return np.concatenate(rows), np.concatenate(cols)
+
+    def generate_contact_graph(self, rng):
+        """build the residents and their symmetric contact graph, the expected number of contacts between age compartments follows the contact matrix"""
+        agents = self.generate_agents(rng)
+        age = agents["age"]
+        block = agents["household"] // self.households_per_block
+        household_rows, household_cols = self._household_edges(agents["household"])
+        # undirected edges expected between age compartments i <= j, household contacts are part of them
+        contacts = self.base_infection_matrix * self.population_counts[:, None]
+        expected_edges = np.triu((contacts + contacts.T) / 2) - np.diag(
+            np.diag(contacts) / 2
+        )
+        household_age_pairs = np.bincount(
+            np.minimum(age[household_rows], age[household_cols]) * self.age_categories
+            + np.maximum(age[household_rows], age[household_cols]),
+            minlength=self.age_categories ** 2,
+        ).reshape(self.age_categories, self.age_categories)
+        community_rows, community_cols = self._community_edges(
+            rng, age, block, np.maximum(expected_edges - household_age_pairs, 0)
+        )
+        rows = np.concatenate([household_rows, community_rows])
+        cols = np.concatenate([household_cols, community_cols])
+        no_self_loop = rows != cols
+        rows, cols = rows[no_self_loop], cols[no_self_loop]
+        num_agents = len(age)
+        # repeated contacts between the same residents are summed into the edge weight
+        contact_graph = coo_matrix(
+            (np.ones(2 * len(rows)), (np.r_[rows, cols], np.r_[cols, rows])),
+            shape=(num_agents, num_agents),
+        ).tocsr()
+        contact_graph.sum_duplicates()
+        edge_rows = np.repeat(np.arange(num_agents), np.diff(contact_graph.indptr))
+        edge_age_pairs = (
+            age[edge_rows] * self.age_categories + age[contact_graph.indices]
+        )
+        # mean contacts a resident of age compartment i has with age compartment j
+        degree_matrix = (
+            np.bincount(
+                edge_age_pairs,
+                weights=contact_graph.data,
+                minlength=self.age_categories ** 2,
+            ).reshape(self.age_categories, self.age_categories)
+            / np.maximum(self.population_counts[:, None], 1)
+        )
+        graph_eigenvalue = np.max(np.real(np.linalg.eigvals(degree_matrix)))
+        return agents, contact_graph, edge_age_pairs, graph_eigenvalue
+
+    def masked_contact_graph(self, infection_matrix):
+        """the contact graph with edge weights scaled by the change a scenario makes to the infection matrix, the graph structure is shared"""
+        if np.array_equal(infection_matrix, self.base_infection_matrix):
+            return self.contact_graph
+        mask_key = infection_matrix.tobytes()
+        with self._cache_lock:
+            masked_graph = self._edge_mask_cache.get(mask_key)
+            if masked_graph is not None:
+                self._edge_mask_cache.move_to_end(mask_key)
+                return masked_graph
+        scale = np.divide(
+            infection_matrix,
+            self.base_infection_matrix,
+            out=np.ones(infection_matrix.shape),
+            where=self.base_infection_matrix > 0,
+        )
+        masked_graph = csr_matrix(
+            (
+                self.contact_graph.data * scale.ravel()[self.edge_age_pairs],
+                self.contact_graph.indices,
+                self.contact_graph.indptr,
+            ),
+            shape=self.contact_graph.shape,
+        )
+        with self._cache_lock:
+            masked_graph = self._edge_mask_cache.setdefault(mask_key, masked_graph)
+            while (
+                len(self._edge_mask_cache)
+                > Config.network_model_params["edge_mask_cache_size"]
+            ):
+                self._edge_mask_cache.popitem(last=False)
+        return masked_graph
+
+    def transmission_pressure(self, agents, state, scenario_dict, beta):
+        """daily force of infection on every resident from their infectious contacts"""
+        if not self.graph_eigenvalue > 0:
+            # a graph without contacts spreads nothing
+            return np.zeros(self.contact_graph.shape[0])
+        index = Config.compartment_index
+        infectious = np.flatnonzero((state == index["I"]) | (state == index["A"]))
+        infectiousness = np.where(
+            state[infectious] == index["I"], 1, self.AsymptInfectiousFactor
+        )
+        # per contact rate matching the reproduction number of the compartmental model on this graph
+        per_contact_rate = (
+            scenario_dict["transmission_reduction_factor"]
+            * beta
+            * np.real(self.largest_eigenvalue)
+            / self.graph_eigenvalue
+        )
+        contact_graph = self.masked_contact_graph(scenario_dict["infection_matrix"])
+        return per_contact_rate * (contact_graph[infectious].T @ infectiousness)
+
+    def generate_agents(self, rng):
+        # once the graph is built the residents stay the same for every run
+        if hasattr(self, "agents"):
+            return self.agents
+        return super().generate_agents(rng)
@@ -0,0 +1,341 @@
+import time
+
+import numpy as np
+import pandas as pd
+from scipy.stats import norm, qmc
+
+from .config.compartmental_model import Config
+from .ensemble import ensemble_array
+from .scheduler import BASELINE_FAMILY, ScenarioScheduler
+from .sensitivity import EPIDEMIC_FACTORS
+
+
+def low_discrepancy_order(design, seed=None):
+    """order of the rows of a design such that every leading subset of it is spread over the rows like the whole
+
+    The rows are mapped to their ranks in every column, then the points of a scrambled Sobol sequence each take the
+    nearest row not taken yet in turn.
+    """
+    design = np.asarray(design, dtype=float)
+    num_rows, num_factors = design.shape
+    ranks = (np.argsort(np.argsort(design, axis=0), axis=0) + 0.5) / num_rows
+    sobol = qmc.Sobol(num_factors, scramble=True, seed=seed)
+    points = sobol.random(2 ** int(np.ceil(np.log2(max(num_rows, 1)))))
+    order = []
+    taken = np.zeros(num_rows, bool)
+    for point in points:
+        distances = ((ranks - point) ** 2).sum(axis=1)
+        distances[taken] = np.inf
+        row = int(np.argmin(distances))
+        if taken[row]:
+            break
+        taken[row] = True
+        order.append(row)
+    return np.array(order, dtype=int)
+
+
+def bands_of_arrays(values, time_range, compartments, quantiles):
+    """frame of the daily quantiles of (draws, time, compartments) values over the draws that didn't fail"""
+    values = values[~np.isnan(values).any(axis=(1, 2))]
+    bands = {"Time": time_range}
+    quantile_values = np.quantile(values, quantiles, axis=0)
+    for i, compartment in enumerate(compartments):
+        for quantile, band in zip(quantiles, quantile_values[:, :, i]):
+            bands[f"{compartment}_q{quantile:g}"] = band
+    return pd.DataFrame(bands)
+
+
+def percentile_bands(frame, compartments=None, quantiles=None):
+    """daily quantiles of the compartments of a result frame over its draws, the bands a progressive run ends on"""
+    if compartments is None:
+        compartments = Config.progressive_params["compartments"]
+    if quantiles is None:
+        quantiles = Config.progressive_params["quantiles"]
+    return bands_of_arrays(
+        ensemble_array(frame, list(compartments)),
+        ensemble_array(frame, "Time")[0],
+        compartments,
+        quantiles,
+    )
+
+
+def quantile_halfwidths(values, quantiles, confidence):
+    """half widths of the distribution free confidence intervals of the daily quantiles of (draws, time, compartments) values, a (quantiles, time, compartments) array
+
+    The interval of a quantile q over n draws runs between the order statistics of ranks n * q -/+ z * sqrt(n * q * (1 -
+    q)), it is infinite while those ranks fall outside the draws.
+    """
+    values = np.sort(values[~np.isnan(values).any(axis=(1, 2))], axis=0)
+    num_draws = len(values)
+    z = norm.ppf((1 + confidence) / 2)
+    halfwidths = np.full((len(quantiles),) + values.shape[1:], np.inf)
+    for i, quantile in enumerate(quantiles):
+        spread = z * np.sqrt(num_draws * quantile * (1 - quantile))
+        lower = int(np.floor(num_draws * quantile - spread))
+        upper = int(np.ceil(num_draws * quantile + spread))
+        if lower >= 0 and upper <= num_draws - 1:
+            halfwidths[i] = (values[upper] - values[lower]) / 2
+    return halfwidths
+
+
+class ProgressiveSnapshot(object):
+    """Bands of every scenario of a progressive run over the draws finished so far
+
+    bands maps the scenario keys to frames of daily quantiles like percentile_bands, num_draws to the draws each one is
+    over and num_exact_draws to how many of those come from the solver runs of the draws rather than the vectorised
+    ensemble. precision has a row per scenario, compartment and quantile with the largest half width over the days of the
+    confidence interval of the quantile, also relative to the peak of the highest band of the compartment. relative_precision is the largest
+    relative half width of the snapshot, infinite while there are too few draws to bound the outer quantiles.
+    """
+
+    def __init__(
+        self, bands, num_draws, num_exact_draws, total_draws, precision, seconds
+    ):
+        self.bands = bands
+        self.num_draws = num_draws
+        self.num_exact_draws = num_exact_draws
+        self.total_draws = total_draws
+        self.precision = precision
+        self.seconds = seconds
+
+    @property
+    def final(self):
+        return all(
+            num_draws == self.total_draws for num_draws in self.num_exact_draws.values()
+        )
+
+    @property
+    def relative_precision(self):
+        return self.precision["Relative_halfwidth"].max()
+
+
+class ProgressiveRun(object):
+    """Run the scenarios of a runner on growing batches of draws and take snapshots of their percentile bands on the way
+
+    The draws of generated_params_df run in low_discrepancy_order of the epidemic factors so the first ones already
+    cover the ranges of the parameters. Every batch is run for every distinct scenario in the order of
+    ScenarioScheduler, the batches start at first_batch_size draws and double up to max_batch_size. A snapshot is
+    taken whenever snapshot_interval seconds have passed since the last one and once all the draws are done.
+
+    The batches first go through the vectorised run_ensemble of the model with ensemble_method, which gives the early
+    snapshots at a fraction of the cost, then through run_single_simulation one draw at a time, whose results replace
+    the ensemble ones, so the last snapshot has the bands of the full run. An ensemble_method of False, and reactive
+    scenarios, skip the ensemble pass.
+    """
+
+    # arguments of run_single_simulation the ensemble pass takes on as well, run_single_simulation doesn't seed the
+    # exposed so neither does the ensemble pass
+    ensemble_run_kwargs = ["t_stop", "initial_symp", "initial_asymp"]
+
+    def __init__(
+        self,
+        runner,
+        compartments=None,
+        quantiles=None,
+        snapshot_interval=None,
+        first_batch_size=None,
+        max_batch_size=None,
+        confidence=None,
+        ensemble_method=None,
+        priorities=None,
+        families=None,
+        seed=None,
+        **run_kwargs,
+    ):
+        params = Config.progressive_params
+        self.runner = runner
+        self.compartments = list(
+            params["compartments"] if compartments is None else compartments
+        )
+        self.quantiles = list(params["quantiles"] if quantiles is None else quantiles)
+        self.snapshot_interval = (
+            params["snapshot_interval"]
+            if snapshot_interval is None
+            else snapshot_interval
+        )
+        self.first_batch_size = (
+            params["first_batch_size"] if first_batch_size is None else first_batch_size
+        )
+        self.max_batch_size = (
+            params["max_batch_size"] if max_batch_size is None else max_batch_size
+        )
+        self.confidence = params["confidence"] if confidence is None else confidence
+        self.ensemble_method = (
+            params["ensemble_method"] if ensemble_method is None else ensemble_method
+        )
+        assert self.snapshot_interval >= 0
+        assert 1 <= self.first_batch_size <= self.max_batch_size
+        assert 0 < self.confidence < 1
+        self.priorities = priorities
+        self.families = families
+        self.seed = seed
+        self.run_kwargs = run_kwargs
+
+    def scenarios(self):
+        """list of (scenario, scenario keys) with one scenario for every distinct fingerprint, in the order of ScenarioScheduler
+
+        The keys are the scenario ids of the baselines and "family|scenario_id" for the interventions.
+        """
+        scheduler = ScenarioScheduler(
+            self.runner, priorities=self.priorities, families=self.families
+        )
+        distinct = dict()
+        for _, family, scenario_id, scenario in scheduler.generate_queue():
+            key = (
+                scenario_id
+                if family == BASELINE_FAMILY
+                else "|".join([family, scenario_id])
+            )
+            fingerprint = scenario.fingerprint()
+            if fingerprint in distinct:
+                distinct[fingerprint][1].append(key)
+            else:
+                distinct[fingerprint] = (scenario, [key])
+        return list(distinct.values())
+
+    def batches(self, num_draws):
+        """slices of the draw order of the batches"""
+        start, size = 0, self.first_batch_size
+        while start < num_draws:
+            yield slice(start, min(start + size, num_draws))
+            start += size
+            size = min(2 * size, self.max_batch_size)
+
+    def snapshot(
+        self,
+        values,
+        draws_done,
+        exact_draws_done,
+        order,
+        time_range,
+        scenarios,
+        start_time,
+    ):
+        bands = dict()
+        num_draws = dict()
+        num_exact_draws = dict()
+        rows = []
+        for i, (_, keys) in enumerate(scenarios):
+            if draws_done[i] == 0:
+                continue
+            scenario_values = values[i][order[: draws_done[i]]]
+            scenario_bands = bands_of_arrays(
+                scenario_values, time_range, self.compartments, self.quantiles
+            )
+            halfwidths = quantile_halfwidths(
+                scenario_values, self.quantiles, self.confidence
+            ).max(axis=1)
+            for key in keys:
+                bands[key] = scenario_bands
+                num_draws[key] = draws_done[i]
+                num_exact_draws[key] = exact_draws_done[i]
+                for j, compartment in enumerate(self.compartments):
+                    # the widest band sets the scale of the compartment
+                    peak = max(
+                        scenario_bands[
+                            [
+                                f"{compartment}_q{quantile:g}"
+                                for quantile in self.quantiles
+                            ]
+                        ]
+                        .to_numpy()
+                        .max(),
+                        1,
+                    )
+                    for k, quantile in enumerate(self.quantiles):
+                        rows.append(
+                            {
+                                "Scenario": key,
+                                "Compartment": compartment,
+                                "Quantile": quantile,
+                                "Num_draws": draws_done[i],
+                                "Halfwidth": halfwidths[k, j],
+                                "Relative_halfwidth": halfwidths[k, j] / peak,
+                            }
+                        )
+        return ProgressiveSnapshot(
+            bands,
+            num_draws,
+            num_exact_draws,
+            len(order),
+            pd.DataFrame(rows),
+            time.monotonic() - start_time,
+        )
+
+    def snapshots(self):
+        """generator of the snapshots of the run, the last one is over all the draws"""
+        start_time = time.monotonic()
+        generated_params_df = self.runner.generated_params_df
+        factors = [
+            factor for factor in EPIDEMIC_FACTORS if factor in generated_params_df
+        ]
+        order = low_discrepancy_order(
+            generated_params_df[factors].to_numpy(), self.seed
+        )
+        scenarios = self.scenarios()
+        # (draws, time, compartments) values of every scenario by the position of the draws in generated_params_df
+        values = [None] * len(scenarios)
+        draws_done = [0] * len(scenarios)
+        exact_draws_done = [0] * len(scenarios)
+        time_range = None
+        last_snapshot = start_time
+        batches = list(self.batches(len(order)))
+        # (batch, scenario, exact) units of work, the ensemble pass over every batch comes first
+        units = [(batch, i, True) for batch in batches for i in range(len(scenarios))]
+        if self.ensemble_method:
+            units = [
+                (batch, i, False)
+                for batch in batches
+                for i, (scenario, _) in enumerate(scenarios)
+                if not scenario.reactive
+            ] + units
+        for unit_number, (batch, i, exact) in enumerate(units):
+            scenario = scenarios[i][0]
+            batch_params_df = generated_params_df.iloc[order[batch]]
+            if exact:
+                frame = self.runner.model.run_single_simulation(
+                    scenario, batch_params_df, **self.run_kwargs
+                )
+            else:
+                frame = self.runner.model.run_ensemble(
+                    scenario,
+                    batch_params_df,
+                    initial_exposed=0,
+                    method=self.ensemble_method,
+                    **{
+                        key: value
+                        for key, value in self.run_kwargs.items()
+                        if key in self.ensemble_run_kwargs
+                    },
+                )
+            batch_values = ensemble_array(frame, self.compartments)
+            if values[i] is None:
+                values[i] = np.full((len(order),) + batch_values.shape[1:], np.nan)
+                time_range = ensemble_array(frame, "Time")[0]
+            values[i][order[batch]] = batch_values
+            draws_done[i] = max(draws_done[i], batch.stop)
+            if exact:
+                exact_draws_done[i] = batch.stop
+            if (
+                unit_number < len(units) - 1
+                and time.monotonic() - last_snapshot >= self.snapshot_interval
+            ):
+                yield self.snapshot(
+                    values,
+                    draws_done,
+                    exact_draws_done,
+                    order,
+                    time_range,
+                    scenarios,
+                    start_time,
+                )
+                last_snapshot = time.monotonic()
+        yield self.snapshot(
+            values,
+            draws_done,
+            exact_draws_done,
+            order,
+            time_range,
+            scenarios,
+            start_time,
+        )
@@ -0,0 +1,53 @@
+from itertools import product
+
+
+class ScenarioGrid(object):
+    """Cartesian product of named intervention axes, each axis maps labels to the values passed to build_scenario
+
+    The scenarios are built lazily as the grid is iterated over, the id of a scenario is the labels of its axes joined
+    with the separator (e.g. "5%|one_month"). Scenarios whose compiled parameters are the same share a fingerprint,
+    distinct_scenarios groups them so each one is only run once.
+    """
+
+    def __init__(self, build_scenario, axes, separator="|"):
+        assert len(axes) >= 1
+        self.build_scenario = build_scenario
+        self.axes = [(axis_name, dict(axis_values)) for axis_name, axis_values in axes]
+        self.separator = separator
+
+    def __len__(self):
+        num_scenarios = 1
+        for _, axis_values in self.axes:
+            num_scenarios *= len(axis_values)
+        return num_scenarios
+
+    def _combinations(self):
+        return product(*[axis_values.items() for _, axis_values in self.axes])
+
+    def scenario_ids(self):
+        for combination in self._combinations():
+            yield self.separator.join(label for label, _ in combination)
+
+    def items(self):
+        """(scenario_id, scenario) pairs in the order of the axes, each scenario is built when it is reached"""
+        axis_names = [axis_name for axis_name, _ in self.axes]
+        for combination in self._combinations():
+            scenario_id = self.separator.join(label for label, _ in combination)
+            scenario = self.build_scenario(
+                **{
+                    axis_name: value
+                    for axis_name, (_, value) in zip(axis_names, combination)
+                }
+            )
+            yield scenario_id, scenario
+
+    def distinct_scenarios(self):
+        """list of (scenario, scenario_ids) with one scenario for every distinct fingerprint in the grid"""
+        distinct = dict()
+        for scenario_id, scenario in self.items():
+            fingerprint = scenario.fingerprint()
+            if fingerprint in distinct:
+                distinct[fingerprint][1].append(scenario_id)
+            else:
+                distinct[fingerprint] = (scenario, [scenario_id])
+        return list(distinct.values())
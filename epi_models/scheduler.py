@@ -0,0 +1,153 @@
+import time
+from math import inf
+
+import pandas as pd
+
+from .model import ModelRunner
+
+BASELINE_FAMILY = "baseline"
+
+
+class ScenarioScheduler(object):
+    """Run the baselines and intervention scenarios of a runner in priority order within an optional wall-clock deadline
+
+    priorities map either a family name (e.g. "isolate_symptomatic") or a single scenario in the form
+    "family|scenario_id" to a number, higher numbers run first and scenario level entries take precedence over
+    family level ones. Baselines always run first. The draws of a scenario run in chunks of chunk_size and no chunk
+    or scenario is started once the deadline (in seconds from the start of run) is reached: the scenario in progress
+    is cut short and flagged with the Reduced_estimate column, and the remaining scenarios are skipped, left out of
+    the results and listed in the summary with no draws. Only the baselines the others are compared to are always
+    estimated, from at least reduced_num_iterations draws.
+    """
+
+    def __init__(
+        self,
+        runner: ModelRunner,
+        priorities=None,
+        deadline=None,
+        reduced_num_iterations=10,
+        chunk_size=50,
+        default_priority=0,
+        families=None,
+    ):
+        assert deadline is None or deadline >= 0
+        assert reduced_num_iterations >= 1
+        assert chunk_size >= 1
+        self.runner = runner
+        self.priorities = dict(priorities) if priorities is not None else dict()
+        self.deadline = deadline
+        self.reduced_num_iterations = reduced_num_iterations
+        self.chunk_size = chunk_size
+        self.default_priority = default_priority
+        # restrict the run to a subset of the intervention families, default to all of them
+        self.families = families
+
+    def priority_of(self, family, scenario_id):
+        if family == BASELINE_FAMILY:
+            return inf
+        scenario_key = "|".join([family, scenario_id])
+        if scenario_key in self.priorities:
+            return self.priorities[scenario_key]
+        return self.priorities.get(family, self.default_priority)
+
+    def generate_queue(self):
+        """flatten all the scenarios of the runner into a list of (priority, family, scenario_id, scenario) ordered by priority"""
+        queue = [
+            (BASELINE_FAMILY, "do_nothing_baseline", self.runner.do_nothing_scenario),
+            (BASELINE_FAMILY, "camp_baseline", self.runner.camp_baseline),
+        ]
+        for family, generate_scenarios in self.runner.scenario_families().items():
+            if self.families is not None and family not in self.families:
+                continue
+            for scenario_id, scenario in generate_scenarios().items():
+                queue.append((family, scenario_id, scenario))
+        # sorted is stable so scenarios of equal priority keep the order of run_different_scenarios
+        return sorted(
+            [
+                (self.priority_of(family, scenario_id), family, scenario_id, scenario)
+                for family, scenario_id, scenario in queue
+            ],
+            key=lambda item: -item[0],
+        )
+
+    def _deadline_reached(self, start_time):
+        if self.deadline is None:
+            return False
+        return time.monotonic() - start_time >= self.deadline
+
+    def _run_scenario(self, scenario, start_time, minimum_draws):
+        """run the draws of the runner in chunks until the deadline, at least minimum_draws of them, returns the frame and whether it was cut short"""
+        generated_params_df = self.runner.generated_params_df
+        sols = []
+        draws_done = 0
+        num_draws = len(generated_params_df)
+        while draws_done < num_draws:
+            chunk_end = min(draws_done + self.chunk_size, num_draws)
+            if self._deadline_reached(start_time):
+                if draws_done >= minimum_draws:
+                    break
+                # only top up to the minimum number of draws once the deadline is hit
+                chunk_end = min(chunk_end, minimum_draws)
+            sols.append(
+                self.runner.model.run_single_simulation(
+                    scenario, generated_params_df.iloc[draws_done:chunk_end]
+                )
+            )
+            draws_done = chunk_end
+        scenario_df = pd.concat(sols, axis=0)
+        scenario_df.attrs["failed_draws"] = [
+            failed_draw for sol in sols for failed_draw in sol.attrs["failed_draws"]
+        ]
+        return scenario_df, draws_done < num_draws
+
+    def run(self):
+        """run every scenario and return the results per family along with a summary of what was run in full"""
+        start_time = time.monotonic()
+        results = dict()
+        summary = []
+        for priority, family, scenario_id, scenario in self.generate_queue():
+            if family != BASELINE_FAMILY and self._deadline_reached(start_time):
+                summary.append(
+                    {
+                        "Family": family,
+                        "Scenario_suffix": scenario_id,
+                        "Priority": priority,
+                        "Num_draws": 0,
+                        "Reduced_estimate": True,
+                        "Seconds": 0.0,
+                    }
+                )
+                continue
+            scenario_start_time = time.monotonic()
+            scenario_df, reduced = self._run_scenario(
+                scenario,
+                start_time,
+                self.reduced_num_iterations if family == BASELINE_FAMILY else 1,
+            )
+            num_draws = len(scenario_df) // scenario_df["Time"].nunique()
+            scenario_df["Reduced_estimate"] = [reduced] * len(scenario_df)
+            scenario_df["Num_draws"] = [num_draws] * len(scenario_df)
+            if family == BASELINE_FAMILY:
+                results[scenario_id] = scenario_df
+            else:
+                results.setdefault(family, dict())[scenario_id] = scenario_df
+            summary.append(
+                {
+                    "Family": family,
+                    "Scenario_suffix": scenario_id,
+                    "Priority": priority,
+                    "Num_draws": num_draws,
+                    "Reduced_estimate": reduced,
+                    "Seconds": time.monotonic() - scenario_start_time,
+                }
+            )
+        for family in self.runner.scenario_families():
+            if self.families is not None and family not in self.families:
+                continue
+            if family in results:
+                results[family] = self.runner.parse_scenario_dict_of_frames(
+                    results[family]
+                )
+            else:
+                results[family] = pd.DataFrame()
+        return results, pd.DataFrame(summary)
@@ -0,0 +1,217 @@
+from math import ceil, log2
+
+import numpy as np
+import pandas as pd
+from scipy.stats import qmc
+
+from .comparison import outcomes_of_arrays
+from .config.compartmental_model import Config
+
+# inputs of generate_epidemic_parameter_ranges, the ones that aren't factors are held at their central values
+EPIDEMIC_FACTORS = [
+    "R0",
+    "LatentPeriod",
+    "RemovalPeriod",
+    "HospPeriod",
+    "DeathICUPeriod",
+    "DeathNoICUPeriod",
+]
+# scenario parameters in numbers of people, scaled by the population size like the scenarios do
+SCENARIO_PEOPLE_FACTORS = [
+    "isolation_capacity",
+    "remove_symptomatic_rate",
+    "remove_high_risk_rate",
+    "icu_capacity",
+]
+SCENARIO_FACTORS = [
+    "transmission_reduction_factor",
+    "first_high_risk_category_n",
+] + SCENARIO_PEOPLE_FACTORS
+
+
+def saltelli_design(factor_bounds, num_base_samples, seed=None):
+    """Saltelli design from a scrambled Sobol sequence, the base matrices A and B have a row per sample and a column per factor and AB[i] is A with column i taken from B, the number of base samples is rounded up to a power of two"""
+    num_factors = len(factor_bounds)
+    bounds = np.array(list(factor_bounds.values()), dtype=float)
+    assert bounds.shape == (num_factors, 2) and (bounds[:, 0] < bounds[:, 1]).all()
+    sampler = qmc.Sobol(2 * num_factors, scramble=True, seed=seed)
+    samples = qmc.scale(
+        sampler.random_base2(ceil(log2(num_base_samples))),
+        np.tile(bounds[:, 0], 2),
+        np.tile(bounds[:, 1], 2),
+    )
+    A, B = samples[:, :num_factors], samples[:, num_factors:]
+    AB = np.repeat(A[None], num_factors, axis=0)
+    AB[np.arange(num_factors), :, np.arange(num_factors)] = B.T
+    return A, B, AB
+
+
+def sobol_indices(f_A, f_B, f_AB, num_bootstrap=1000, confidence=0.95, seed=None):
+    """first order (Saltelli 2010) and total (Jansen) indices of every factor from the outputs on a Saltelli design, with bootstrap intervals, returns (first order, total) each as an array of (estimate, low, high) rows per factor"""
+    num_samples = len(f_A)
+
+    def estimate(samples):
+        f_a, f_b, f_ab = f_A[samples], f_B[samples], f_AB[:, samples]
+        variance = np.var(np.concatenate([f_a, f_b], axis=-1), axis=-1)
+        variance = np.where(variance > 0, variance, np.nan)
+        first_order = np.mean(f_b * (f_ab - f_a), axis=-1) / variance
+        total = 0.5 * np.mean((f_a - f_ab) ** 2, axis=-1) / variance
+        return first_order, total
+
+    first_order, total = estimate(np.arange(num_samples))
+    # every bootstrap resample is worked out at once on a (resamples, samples) index array
+    resamples = np.random.default_rng(seed).integers(
+        0, num_samples, (num_bootstrap, num_samples)
+    )
+    bootstrap_first_order, bootstrap_total = estimate(resamples)
+    tail = (1 - confidence) / 2
+    return tuple(
+        np.column_stack(
+            [
+                point,
+                np.quantile(bootstrap, tail, axis=-1),
+                np.quantile(bootstrap, 1 - tail, axis=-1),
+            ]
+        )
+        for point, bootstrap in [
+            (first_order, bootstrap_first_order),
+            (total, bootstrap_total),
+        ]
+    )
+
+
+def integrate_design(
+    model,
+    scenario,
+    factors,
+    design,
+    t_stop=200,
+    chunk_size=1000,
+    rtol=1e-5,
+    atol=1e-10,
+):
+    """people in every compartment summed over the age compartments for chunks of rows of a design of factor values, yields (rows, compartments, time) arrays of the chunks integrated together through the ensemble path of the model"""
+    central_values = {
+        "R0": model.R_0_list[1],
+        "LatentPeriod": model.Latent_period,
+        "RemovalPeriod": model.Infectious_period,
+        "HospPeriod": model.Hosp_period,
+        "DeathICUPeriod": model.Death_period_withICU,
+        "DeathNoICUPeriod": model.Death_period,
+    }
+    generated_params_df = model.derive_epidemic_rates(
+        pd.DataFrame(
+            {
+                name: design[:, factors.index(name)]
+                if name in factors
+                else np.full(len(design), float(central_values[name]))
+                for name in EPIDEMIC_FACTORS
+            }
+        )
+    )
+    param_overrides = dict()
+    for name in SCENARIO_FACTORS:
+        if name not in factors:
+            continue
+        values = design[:, factors.index(name)]
+        if name in SCENARIO_PEOPLE_FACTORS:
+            values = values / model.population_size
+        elif name == "first_high_risk_category_n":
+            values = np.round(values)
+        param_overrides[name] = values
+    y0 = model.initial_state_vector(1, 1, 1)
+    time_range = np.arange(t_stop + 1)
+    for chunk_start in range(0, len(design), chunk_size):
+        chunk = slice(chunk_start, chunk_start + chunk_size)
+        y_out = model.integrate_ensemble(
+            scenario,
+            generated_params_df.iloc[chunk],
+            y0,
+            time_range,
+            {name: values[chunk] for name, values in param_overrides.items()},
+            rtol,
+            atol,
+        )
+        yield model.population_size * y_out.reshape(
+            len(y_out), model.age_categories, model.number_compartments, -1
+        ).sum(axis=1)
+
+
+def evaluate_design(model, scenario, factors, design, t_stop=200, **integrate_kwargs):
+    """outcomes of every row of a design of factor values"""
+    time_range = np.arange(t_stop + 1)
+    index = Config.compartment_index
+    outcomes = [
+        outcomes_of_arrays(
+            totals[:, index["D"]],
+            totals[:, index["I"]],
+            totals[:, index["C"]],
+            time_range,
+        )
+        for totals in integrate_design(
+            model, scenario, factors, design, t_stop, **integrate_kwargs
+        )
+    ]
+    return {
+        outcome: np.concatenate(
+            [chunk_outcomes[outcome] for chunk_outcomes in outcomes]
+        )
+        for outcome in outcomes[0]
+    }
+
+
+def run_sobol_analysis(
+    model,
+    scenario,
+    factor_bounds,
+    num_base_samples=1024,
+    seed=None,
+    num_bootstrap=1000,
+    confidence=0.95,
+    **evaluate_kwargs,
+):
+    """first order and total Sobol indices of deaths, the symptomatic peak and ICU days with respect to the factors
+
+    factor_bounds maps factors to (low, high) bounds of a uniform distribution, the factors are inputs of
+    generate_epidemic_parameter_ranges (R0 and periods in days) or scenario parameters, which replace the ones of the
+    scenario throughout the run and are given in numbers of people where the scenarios take numbers of people. The
+    num_base_samples * (factors + 2) model evaluations run through the ensemble path in chunks.
+    """
+    factors = list(factor_bounds)
+    for factor in factors:
+        assert (
+            factor in EPIDEMIC_FACTORS + SCENARIO_FACTORS
+        ), f"{factor} is not a factor of the model"
+    A, B, AB = saltelli_design(factor_bounds, num_base_samples, seed)
+    num_samples = len(A)
+    outcomes = evaluate_design(
+        model,
+        scenario,
+        factors,
+        np.concatenate([A, B, AB.reshape(-1, len(factors))]),
+        **evaluate_kwargs,
+    )
+    rows = []
+    for outcome, values in outcomes.items():
+        first_order, total = sobol_indices(
+            values[:num_samples],
+            values[num_samples : 2 * num_samples],
+            values[2 * num_samples :].reshape(len(factors), num_samples),
+            num_bootstrap,
+            confidence,
+            seed,
+        )
+        for i, factor in enumerate(factors):
+            rows.append(
+                {
+                    "Outcome": outcome,
+                    "Factor": factor,
+                    "First_order": first_order[i, 0],
+                    "First_order_low": first_order[i, 1],
+                    "First_order_high": first_order[i, 2],
+                    "Total": total[i, 0],
+                    "Total_low": total[i, 1],
+                    "Total_high": total[i, 2],
+                }
+            )
+    return pd.DataFrame(rows)
@@ -0,0 +1,309 @@
+import numpy as np
+
+from .config.compartmental_model import Config
+from .deterministic_compartmental_model import DeterministicCompartmentalModel
+from .model import ModelId
+from .params import CampParams
+
+
+class StochasticCompartmentalModel(DeterministicCompartmentalModel):
+    """Stochastic counterpart of the deterministic compartmental model with the same 11 disease and 8 age compartments
+
+    Integer numbers of people are moved between compartments by binomial tau-leaping. Every row of the generated
+    parameters is one replicate and all the replicates are advanced together as a (replicates, compartments, ages)
+    array so that thousands of replicates run in seconds.
+    """
+
+    def __init__(
+        self, camp_params: CampParams, num_iterations=1000, time_step=0.5, seed=None
+    ):
+        super().__init__(camp_params, num_iterations)
+        assert (1 / time_step) == round(
+            1 / time_step
+        ), "time step needs to divide a day into a whole number of steps"
+        self.time_step = time_step
+        self.seed = seed
+        self.population_counts = np.rint(
+            self.population_vector * self.population_size / 100
+        ).astype(np.int64)
+
+    def id(self):
+        return ModelId.StochasticCompartmentalModel
+
+    @staticmethod
+    def _binomial(rng, n, p):
+        """binomial samples drawn only where there is anybody to move, most compartments are empty most of the time"""
+        p = np.broadcast_to(p, n.shape)
+        samples = np.zeros(n.shape, dtype=np.int64)
+        active = (n > 0) & (p > 0)
+        samples[active] = rng.binomial(n[active], p[active])
+        return samples
+
+    @staticmethod
+    def _allocate(rng, n, pool):
+        """draw n people of shape (replicates,) without replacement from a pool of shape (replicates, k) sorted into k groups"""
+        samples = np.zeros(pool.shape, dtype=np.int64)
+        remaining_n = np.minimum(n, pool.sum(axis=1))
+        if not remaining_n.any():
+            return samples
+        remaining_pool = pool.sum(axis=1)
+        for k in range(pool.shape[1] - 1):
+            remaining_pool = remaining_pool - pool[:, k]
+            samples[:, k] = rng.hypergeometric(pool[:, k], remaining_pool, remaining_n)
+            remaining_n = remaining_n - samples[:, k]
+        samples[:, -1] = remaining_n
+        return samples
+
+    def initial_state(
+        self, rng, num_replicates, initial_exposed, initial_symp, initial_asymp
+    ):
+        """integer initial conditions with the seeded infections spread across the age compartments by population"""
+        state = np.zeros(
+            (num_replicates, self.number_compartments, self.age_categories),
+            dtype=np.int64,
+        )
+        state[:, Config.compartment_index["S"], :] = self.population_counts
+        for compartment, initial_number in [
+            ("E", initial_exposed),
+            ("I", initial_symp),
+            ("A", initial_asymp),
+        ]:
+            seeded = self._allocate(
+                rng,
+                np.full(num_replicates, initial_number, dtype=np.int64),
+                state[:, Config.compartment_index["S"], :],
+            )
+            state[:, Config.compartment_index[compartment], :] += seeded
+            state[:, Config.compartment_index["S"], :] -= seeded
+        return state
+
+    def tau_leap(
+        self,
+        rng,
+        state,
+        scenario_dict,
+        beta,
+        latent_rate,
+        removal_rate,
+        hosp_rate,
+        death_rate_ICU,
+        death_rate_no_ICU,
+    ):
+        """advance all replicates by one time step, the rates are arrays of shape (replicates, 1)"""
+        tau = self.time_step
+        index = Config.compartment_index
+        S, E, I, A, H, C, Q, U = (
+            state[:, index[compartment], :]
+            for compartment in ["S", "E", "I", "A", "H", "C", "Q", "U"]
+        )
+        flows = np.zeros(state.shape, dtype=np.int64)
+
+        def move(source, target, number):
+            flows[:, index[source], :] -= number
+            flows[:, index[target], :] += number
+
+        def leaving(compartment_vec, rate):
+            return self._binomial(rng, compartment_vec, -np.expm1(-rate * tau))
+
+        # S -> E with the force of infection of the deterministic model on population fractions
+        infectious = (I + self.AsymptInfectiousFactor * A) / self.population_size
+        force_of_infection = (
+            scenario_dict["transmission_reduction_factor"]
+            * beta
+            * np.dot(infectious, scenario_dict["infection_matrix"].T)
+        )
+        newly_exposed = leaving(S, force_of_infection)
+        move("S", "E", newly_exposed)
+
+        # Intervention: removing high risk population from the oldest age compartments
+        first_high_risk_category_n = (
+            self.age_categories - scenario_dict["first_high_risk_category_n"]
+        )
+        if scenario_dict["remove_high_risk_rate"] > 0:
+            high_risk_pool = (S - newly_exposed)[:, first_high_risk_category_n:]
+            offsite = self._allocate(
+                rng,
+                rng.poisson(
+                    scenario_dict["remove_high_risk_rate"] * self.population_size * tau,
+                    len(state),
+                ),
+                high_risk_pool,
+            )
+            flows[:, index["S"], first_high_risk_category_n:] -= offsite
+            flows[:, index["O"], first_high_risk_category_n:] += offsite
+
+        # E -> I or A
+        E_latent = leaving(E, latent_rate)
+        E_to_I = self._binomial(rng, E_latent, self.p_symptomatic)
+        move("E", "I", E_to_I)
+        move("E", "A", E_latent - E_to_I)
+
+        # I -> H or R
+        I_removed = leaving(I, removal_rate)
+        I_to_H = self._binomial(rng, I_removed, self.p_hosp_given_symptomatic)
+        move("I", "H", I_to_H)
+        move("I", "R", I_removed - I_to_H)
+
+        # A -> R
+        move("A", "R", leaving(A, removal_rate))
+
+        # Intervention: removing symptomatic individuals into Q within the isolation capacity
+        if (scenario_dict["remove_symptomatic_rate"] > 0) and (
+            scenario_dict["isolation_capacity"] > 0
+        ):
+            Q_left_over_capacity = np.maximum(
+                np.floor(scenario_dict["isolation_capacity"] * self.population_size)
+                - Q.sum(axis=1),
+                0,
+            ).astype(np.int64)
+            to_quarantine = np.minimum(
+                rng.poisson(
+                    scenario_dict["remove_symptomatic_rate"]
+                    * self.population_size
+                    * tau,
+                    len(state),
+                ),
+                Q_left_over_capacity,
+            )
+            # no age bias in who is moved
+            quarantine_sicks = self._allocate(rng, to_quarantine, I - I_removed)
+            move("I", "Q", quarantine_sicks)
+            Q_quarantined = leaving(Q, self.quarant_rate)
+        else:
+            # the intervention is off so the ones still infectious go back into I
+            Q_leaving = leaving(Q, 1.0)
+            Q_quarantined = self._binomial(rng, Q_leaving, self.quarant_rate)
+            move("Q", "I", Q_leaving - Q_quarantined)
+        Q_to_H = self._binomial(rng, Q_quarantined, self.p_hosp_given_symptomatic)
+        move("Q", "H", Q_to_H)
+        move("Q", "R", Q_quarantined - Q_to_H)
+
+        # H -> R or needing critical care
+        H_leaving = leaving(H, hosp_rate)
+        needing_care = self._binomial(
+            rng, H_leaving, self.p_critical_given_hospitalised
+        )
+        move("H", "R", H_leaving - needing_care)
+
+        # C -> D or back to H
+        C_leaving = leaving(C, death_rate_ICU)
+        deaths_on_icu = self._binomial(rng, C_leaving, self.death_prob_with_ICU)
+        move("C", "D", deaths_on_icu)
+        move("C", "H", C_leaving - deaths_on_icu)
+
+        # ICU beds allocated on a first come, first served basis, the rest go without ICU care
+        icu_beds_free = np.maximum(
+            np.floor(scenario_dict["icu_capacity"] * self.population_size)
+            - (C - C_leaving).sum(axis=1),
+            0,
+        ).astype(np.int64)
+        icu_cared = self._allocate(rng, icu_beds_free, needing_care)
+        move("H", "C", icu_cared)
+        move("H", "U", needing_care - icu_cared)
+
+        # U -> D
+        move("U", "D", leaving(U, death_rate_no_ICU))
+
+        return state + flows
+
+    def run_replicates(
+        self,
+        scenario,
+        generated_params_df,
+        t_stop=200,
+        initial_exposed=1,
+        initial_symp=1,
+        initial_asymp=1,
+        seed=None,
+    ):
+        """run all replicates and return the daily counts with the shape (replicates, compartments * age categories, time)"""
+        if scenario.reactive:
+            raise NotImplementedError(
+                "reactive scenarios need the solver of the deterministic model"
+            )
+        rng = np.random.default_rng(self.seed if seed is None else seed)
+        num_replicates = len(generated_params_df)
+        rates = [
+            generated_params_df[param_name].to_numpy()[:, None]
+            for param_name in [
+                "beta",
+                "latentRate",
+                "removalRate",
+                "hospRate",
+                "deathRateICU",
+                "deathRateNoICU",
+            ]
+        ]
+        steps_per_day = int(round(1 / self.time_step))
+        state = self.initial_state(
+            rng, num_replicates, initial_exposed, initial_symp, initial_asymp
+        )
+        y_out = np.zeros(
+            (num_replicates, self.age_categories, self.number_compartments, t_stop + 1),
+            dtype=np.int64,
+        )
+        y_out[..., 0] = state.transpose(0, 2, 1)
+        for day in range(t_stop):
+            for step in range(steps_per_day):
+                scenario_dict = scenario.intervention_params_at_time_t(
+                    day + step * self.time_step
+                )
+                state = self.tau_leap(rng, state, scenario_dict, *rates)
+            y_out[..., day + 1] = state.transpose(0, 2, 1)
+        return y_out.reshape(num_replicates, -1, t_stop + 1)
+
+    def run_single_simulation(
+        self,
+        scenario,
+        generated_params_df=None,
+        t_stop=200,
+        initial_exposed=1,
+        initial_symp=1,
+        initial_asymp=1,
+        seed=None,
+    ):
+        if generated_params_df is None:
+            generated_params_df = self.generate_epidemic_parameter_ranges(
+                self.num_iterations
+            )  # default run 1000 iterations
+        y_out = self.run_replicates(
+            scenario,
+            generated_params_df,
+            t_stop,
+            initial_exposed,
+            initial_symp,
+            initial_asymp,
+            seed,
+        )
+        simulation_result_frame = self.parse_ensemble_output(
+            y_out / self.population_size, np.arange(t_stop + 1), generated_params_df
+        )
+        simulation_result_frame.attrs["failed_draws"] = []
+        return simulation_result_frame
+
+    def run_multiple_simulations(
+        self,
+        scenario_dict,
+        generated_params_df=None,
+        t_stop=200,
+        initial_exposed=1,
+        initial_symp=1,
+        initial_asymp=1,
+        seed=None,
+    ):
+        if generated_params_df is None:
+            generated_params_df = self.generate_epidemic_parameter_ranges(
+                self.num_iterations
+            )  # default run 1000 iterations
+        simulation_result_frame_dict = {}
+        for scenario_key, scenario in scenario_dict.items():
+            simulation_result_frame_dict[scenario_key] = self.run_single_simulation(
+                scenario,
+                generated_params_df,
+                t_stop,
+                initial_exposed,
+                initial_symp,
+                initial_asymp,
+                seed,
+            )
+        return simulation_result_frame_dict
@@ -0,0 +1,35 @@
+import time
+
+import numpy as np
+
+
+class TimeBudget(object):
+    """wall-clock deadline of an attempt at a run, None seconds for no deadline
+
+    The solvers can't be interrupted from within their right hand side, so the equations wrapped by bound stand still
+    once the deadline has passed: the solver then gets through the rest of its interval in a few cheap steps and check
+    raises straight after it returns, so no single interval can run past the budget by more than an evaluation.
+    """
+
+    def __init__(self, seconds=None):
+        self.deadline = None if seconds is None else time.monotonic() + seconds
+
+    def spent(self):
+        return (self.deadline is not None) and (time.monotonic() > self.deadline)
+
+    def check(self):
+        if self.spent():
+            raise RuntimeError("ode solver exceeded its time budget")
+
+    def bound(self, equations):
+        """equations(t, y, *args) that return no change once the deadline has passed"""
+        if self.deadline is None:
+            return equations
+        deadline = self.deadline
+
+        def bounded_equations(t, y, *args):
+            if time.monotonic() > deadline:
+                return np.zeros_like(y)
+            return equations(t, y, *args)
+
+        return bounded_equations
@@ -0,0 +1,102 @@
+import os
+from pathlib import Path
+
+import numpy as np
+import pytest
+from numpy.testing import assert_allclose
+
+from epi_models import AgePreview, CampParams, DeterministicCompartmentalModelRunner
+
+
+@pytest.fixture(scope="module")
+def runner():
+    base_dir = Path(os.path.dirname(__file__)).parents[0]
+    camp_params = CampParams.load_from_json(
+        base_dir / "epi_models" / "config" / "sample_input.json"
+    )
+    return DeterministicCompartmentalModelRunner(camp_params, num_iterations=10)
+
+
+def leading_eigenpair(model):
+    """largest eigenvalue and eigenvector of the next generation matrix weighted by the infectiousness of every age compartment"""
+    p_symptomatic = np.asarray(model.p_symptomatic)
+    infectiousness = p_symptomatic + model.AsymptInfectiousFactor * (1 - p_symptomatic)
+    eigenvalues, eigenvectors = np.linalg.eig(
+        0.01
+        * model.population_vector[:, None]
+        * model.infection_matrix
+        * infectiousness[None, :]
+    )
+    leading = np.argmax(np.real(eigenvalues))
+    return np.real(eigenvalues[leading]), np.abs(np.real(eigenvectors[:, leading]))
+
+
+def test_coarse_model_keeps_the_epidemic_at_the_start(runner):
+    model = runner.model
+    coarse_model = model.with_age_limits([0, 20, 60, 80])
+    assert coarse_model.ages == ["0_19", "20_59", "60_above"]
+    assert coarse_model.infection_matrix.shape == (3, 3)
+    assert_allclose(coarse_model.population_vector.sum(), 100)
+    eigenvalue, infections = leading_eigenpair(model)
+    coarse_eigenvalue, coarse_infections = leading_eigenpair(coarse_model)
+    assert_allclose(coarse_eigenvalue, eigenvalue)
+    # the infections of the coarse compartments are the sums of the ones they merge
+    coarse_infections *= infections.sum() / coarse_infections.sum()
+    assert_allclose(
+        coarse_infections, coarse_model.age_weights.astype(bool) @ infections
+    )
+    for probabilities in [
+        ["p_symptomatic"],
+        ["p_symptomatic", "p_hosp_given_symptomatic"],
+        [
+            "p_symptomatic",
+            "p_hosp_given_symptomatic",
+            "p_critical_given_hospitalised",
+        ],
+    ]:
+        expected = np.prod([getattr(model, name) for name in probabilities], axis=0)
+        coarse = np.prod(
+            [getattr(coarse_model, name) for name in probabilities], axis=0
+        )
+        assert_allclose(coarse_infections @ coarse, infections @ expected)
+    # the banding of the model is left as it is
+    same_model = model.with_age_limits(model.age_limits)
+    assert_allclose(same_model.infection_matrix, model.infection_matrix)
+    assert_allclose(same_model.p_symptomatic, model.p_symptomatic)
+
+
+def test_preview_maps_back_to_the_columns_of_the_model(runner):
+    model, generated_params_df = runner.model, runner.generated_params_df
+    scenario = runner.do_nothing_scenario
+    exact = model.run_ensemble(scenario, generated_params_df)
+    same_bands = AgePreview(model, model.age_limits).run(
+        scenario, generated_params_df, rtol=1e-6, atol=1e-12
+    )
+    assert_allclose(same_bands.to_numpy(), exact.to_numpy())
+
+    preview = AgePreview(model)
+    frame = preview.run(scenario, generated_params_df)
+    assert list(frame.columns) == list(exact.columns)
+    assert_allclose(
+        frame[["Deaths_" + age for age in model.ages]].sum(axis=1), frame["Deaths"]
+    )
+    assert frame.attrs["unaggregated_interventions"] == []
+    error = preview.error(scenario, generated_params_df, frame).set_index("Compartment")
+    assert (error.loc[["Infected_symptomatic", "Deaths"], "Relative_RMSE"] < 0.05).all()
+    assert (error["Age_relative_RMSE"] < 0.2).all()
+
+    with pytest.raises(AssertionError):
+        model.with_age_limits([0, 25, 80])
+
+
+def test_preview_flags_the_interventions_it_does_not_follow(runner):
+    model, generated_params_df = runner.model, runner.generated_params_df
+    preview = AgePreview(model)
+    frame = preview.run(runner.camp_baseline, generated_params_df.iloc[:2], t_stop=20)
+    assert frame.attrs["unaggregated_interventions"] == [
+        "isolate_symptomatic",
+        "remove_high_risk_residents",
+    ]
+    # the default bands are the ones of the configuration the model has
+    coarse_model = model.with_age_limits([0, 30, 60, 80])
+    assert list(AgePreview(coarse_model).coarse_model.age_limits) == [0, 60, 80]
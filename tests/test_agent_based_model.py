@@ -0,0 +1,74 @@
+import os
+from pathlib import Path
+
+import numpy as np
+import pytest
+from numpy.testing import assert_allclose
+
+from epi_models import (
+    AgentBasedModel,
+    CampParams,
+    DeterministicCompartmentalModelScenario,
+)
+
+COMPARTMENTS = [
+    "Susceptible",
+    "Exposed",
+    "Infected_symptomatic",
+    "Infected_asymptomatic",
+    "Recovered",
+    "Hospitalised",
+    "Critical",
+    "Deaths",
+    "Offsite",
+    "Quarantined",
+    "No_ICU_Care",
+]
+
+
+@pytest.fixture(scope="module")
+def model():
+    base_dir = Path(os.path.dirname(__file__)).parents[0]
+    camp_params = CampParams.load_from_json(
+        base_dir / "epi_models" / "config" / "sample_input.json"
+    )
+    return AgentBasedModel(camp_params, seed=0)
+
+
+@pytest.fixture(scope="module")
+def result(model):
+    scenario = DeterministicCompartmentalModelScenario(
+        model.population_size,
+        model.infection_matrix,
+        isolation_capacity=200,
+        remove_symptomatic_rate=100,
+        remove_high_risk_rate=100,
+        icu_capacity=6,
+    )
+    generated_params_df = model.generate_epidemic_parameter_ranges(3)
+    return model.run_single_simulation(
+        scenario, generated_params_df, initial_exposed=10
+    )
+
+
+def test_agents_are_stored_as_arrays(model):
+    agents = model.generate_agents(np.random.default_rng(0))
+    assert len(agents["age"]) == model.population_size
+    assert_allclose(np.bincount(agents["age"]), model.population_counts, err_msg="ages")
+    household_sizes = np.bincount(agents["household"])
+    assert household_sizes.max() - household_sizes.min() <= 1
+    assert 0.7 < agents["compliant"].mean() < 0.9
+
+
+def test_every_agent_is_accounted_for(model, result):
+    assert len(result) == 3 * 201
+    assert_allclose(result[COMPARTMENTS].sum(axis=1), model.population_size)
+    assert (result["Recovered"].to_numpy()[200::201] > 0).all()
+
+
+def test_capacities_are_respected(result):
+    assert (result["Critical"] <= 6).all()
+    assert (result["Quarantined"] <= 200).all()
+    assert (result["Quarantined"] > 0).any()
+    assert (result["Offsite_0_9"] == 0).all()
+    assert (result["Offsite_70_above"] > 0).any()
@@ -0,0 +1,67 @@
+import os
+from pathlib import Path
+
+import numpy as np
+import pytest
+from numpy.testing import assert_allclose
+
+from epi_models import CampParams, DeterministicCompartmentalModelRunner
+from epi_models.comparison import compare_scenarios, draw_outcomes, paired_comparison
+
+
+@pytest.fixture(scope="module")
+def runner():
+    base_dir = Path(os.path.dirname(__file__)).parents[0]
+    camp_params = CampParams.load_from_json(
+        base_dir / "epi_models" / "config" / "sample_input.json"
+    )
+    return DeterministicCompartmentalModelRunner(camp_params, num_iterations=4)
+
+
+@pytest.fixture(scope="module")
+def camp_baseline(runner):
+    return runner.model.run_single_simulation(
+        runner.camp_baseline, runner.generated_params_df
+    )
+
+
+def test_paired_comparison_of_hygiene_scenarios(runner, camp_baseline):
+    hygiene_results = runner.run_better_hygiene_scenarios()
+    comparison = compare_scenarios(camp_baseline, hygiene_results)
+    assert len(comparison) == 9 * 3
+    assert (comparison["Num_pairs"] == 4).all()
+    deaths = comparison.set_index(["Scenario_suffix", "Outcome"])
+    six_months = deaths.loc[("15%|six_month", "Deaths")]
+    assert six_months["Difference"] == "Deaths_averted"
+    # the paired difference is the difference of the means
+    assert_allclose(
+        six_months["Difference_mean"],
+        six_months["Baseline_mean"] - six_months["Scenario_mean"],
+    )
+    assert six_months["Difference_q0.05"] > 0
+    assert six_months["Ratio_q0.95"] < 1
+    assert (
+        deaths.loc[("5%|one_month", "Deaths"), "Difference_mean"]
+        < six_months["Difference_mean"]
+    )
+
+
+def test_failed_draws_are_left_out_and_pairing_is_checked(runner, camp_baseline):
+    scenario_frame = camp_baseline.copy()
+    # a failed draw is a block of missing values
+    scenario_frame.iloc[201:402, scenario_frame.columns.get_loc("Deaths")] = np.nan
+    comparison = paired_comparison(camp_baseline, scenario_frame)
+    assert (comparison["Num_pairs"] == [3, 4, 4]).all()
+    assert_allclose(comparison["Difference_mean"], 0)
+    outcomes = draw_outcomes(camp_baseline)
+    assert_allclose(
+        comparison["Baseline_mean"][1:],
+        [
+            outcomes["Peak_symptomatic"].mean(),
+            outcomes["ICU_days"].mean(),
+        ],
+    )
+    shuffled = scenario_frame.copy()
+    shuffled["R0"] = shuffled["R0"].to_numpy()[::-1]
+    with pytest.raises(AssertionError):
+        paired_comparison(camp_baseline, shuffled)
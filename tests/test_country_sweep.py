@@ -0,0 +1,56 @@
+import os
+from pathlib import Path
+
+import numpy as np
+import pytest
+from numpy.testing import assert_allclose
+
+from epi_models import CampParams, CountrySweep, DeterministicCompartmentalModelRunner
+from epi_models.comparison import draw_outcomes
+
+
+@pytest.fixture(scope="module")
+def camp_params():
+    base_dir = Path(os.path.dirname(__file__)).parents[0]
+    return CampParams.load_from_json(
+        base_dir / "epi_models" / "config" / "sample_input.json"
+    )
+
+
+def test_contact_matrices_of_every_country_are_aggregated_together(camp_params):
+    sweep = CountrySweep(camp_params, num_iterations=1)
+    assert len(sweep.countries) == 155
+    assert sweep.infection_matrices.shape == (155, 8, 8)
+    assert np.isfinite(sweep.infection_matrices).all()
+    for country in ["Greece", "Nepal"]:
+        model = DeterministicCompartmentalModelRunner(
+            CampParams({**camp_params.__dict__, "country": country}), 1
+        ).model
+        swept_model = sweep.models[country]
+        assert_allclose(swept_model.infection_matrix, model.infection_matrix)
+        assert_allclose(swept_model.largest_eigenvalue, model.largest_eigenvalue)
+        assert_allclose(swept_model.im_beta_list, model.im_beta_list)
+
+
+def test_sweep_matches_the_runner_of_each_country(camp_params):
+    countries = ["Greece", "Nepal", "Uganda"]
+    sweep = CountrySweep(camp_params, countries, num_iterations=3)
+    outcome_frame, sensitivity_frame = sweep.run()
+    assert len(outcome_frame) == 3 * 2 * 3
+    assert len(sensitivity_frame) == 2 * 3
+    assert sensitivity_frame["Between_country_share"].between(0, 1).all()
+    assert set(sensitivity_frame["Most_severe_country"]) <= set(countries)
+
+    runner = DeterministicCompartmentalModelRunner(
+        CampParams({**camp_params.__dict__, "country": "Uganda"}), num_iterations=3
+    )
+    expected = draw_outcomes(
+        runner.model.run_ensemble(runner.camp_baseline, runner.generated_params_df)
+    )
+    swept = outcome_frame.set_index(["Country", "Scenario", "Outcome"])
+    for outcome, values in expected.items():
+        assert_allclose(
+            swept.loc[("Uganda", "camp_baseline", outcome), "Mean"],
+            values.mean(),
+            rtol=1e-4,
+        )
@@ -0,0 +1,282 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import numpy as np
+import pytest
+from numpy.testing import assert_allclose
+
+from epi_models import (
+    CampParams,
+    DailyIntensity,
+    DeterministicCompartmentalModel,
+    DeterministicCompartmentalModelScenario,
+    ExponentialDecayIntensity,
+    Intervention,
+    MultipleInterventionScenario,
+    ReactiveInterventionScenario,
+    SingleInterventionScenario,
+    StateCondition,
+)
+
+
+@pytest.fixture(scope="module")
+def model():
+    base_dir = Path(os.path.dirname(__file__)).parents[0]
+    camp_params = CampParams.load_from_json(
+        base_dir / "epi_models" / "config" / "sample_input.json"
+    )
+    return DeterministicCompartmentalModel(camp_params)
+
+
+@pytest.fixture(scope="module")
+def run_kwargs(model):
+    row = model.generate_epidemic_parameter_ranges(1).iloc[0]
+    return dict(
+        t_stop=200,
+        r0=row["R0"],
+        beta=row["beta"],
+        latent_rate=row["latentRate"],
+        removal_rate=row["removalRate"],
+        hosp_rate=row["hospRate"],
+        death_rate_ICU=row["deathRateICU"],
+        death_rate_no_ICU=row["deathRateNoICU"],
+        initial_exposed=1,
+        initial_symp=1,
+        initial_asymp=1,
+    )
+
+
+def test_state_condition_reads_compartments_across_ages(model):
+    condition = StateCondition(["I", "A"], 100, model.population_size)
+    y = np.zeros(88)
+    y[2 + 11 * np.arange(8)] = 10 / model.population_size
+    assert_allclose(condition.margin(y) * model.population_size, -20)
+    y[3] = 20 / model.population_size
+    assert condition.is_met(y)
+    assert not StateCondition(["I"], 50, model.population_size, above=False).is_met(y)
+
+
+def test_reactive_intervention_switches_at_the_thresholds(model, run_kwargs):
+    population_size = model.population_size
+    baseline = DeterministicCompartmentalModelScenario(
+        population_size, model.infection_matrix, icu_capacity=6
+    )
+    scenario = ReactiveInterventionScenario(
+        population_size,
+        model.infection_matrix,
+        start_condition=StateCondition(["I"], 100, population_size),
+        stop_condition=StateCondition(["I"], 50, population_size, above=False),
+        transmission_reduction_factor_inter=0.5,
+        camp_specific_baseline_scenario=baseline,
+    )
+    baseline_result = model.run_model(baseline, **run_kwargs)
+    result = model.run_model(scenario, **run_kwargs)
+    start, stop = result.attrs["switch_times"][:2]
+    # switched on between the days the baseline went past 100 symptomatic infections
+    crossing_day = np.argmax(baseline_result["Infected_symptomatic"].to_numpy() > 100)
+    assert crossing_day - 1 < start < crossing_day
+    assert_allclose(
+        result["Infected_symptomatic"].iloc[: int(start)],
+        baseline_result["Infected_symptomatic"].iloc[: int(start)],
+        rtol=1e-3,
+    )
+    assert start < stop
+    assert result["Deaths"].iloc[-1] < baseline_result["Deaths"].iloc[-1]
+    # switched off again once the symptomatic infections dropped below 50
+    infected_at_stop = np.interp(stop, result["Time"], result["Infected_symptomatic"])
+    assert_allclose(infected_at_stop, 50, rtol=0.05)
+    # the runs switch copies of the scenario, so runs going on at the same time don't see each other's switches
+    assert not scenario.active and scenario.switch_times == []
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        results = list(
+            executor.map(lambda _: model.run_model(scenario, **run_kwargs), range(2))
+        )
+    for other_result in results:
+        assert other_result.attrs["switch_times"] == result.attrs["switch_times"]
+    with pytest.raises(NotImplementedError):
+        model.expected_counts(2.5, 0.5, 4, scenario)
+
+
+def test_multiple_interventions_combine_over_merged_segments(model):
+    population_size = model.population_size
+    infection_matrix = np.array(model.infection_matrix)
+    scenario = MultipleInterventionScenario(
+        population_size,
+        infection_matrix,
+        [
+            Intervention([10, 60], [40, 80], transmission_reduction_factor=0.8),
+            Intervention([30], [50], apply_shielding=True, isolation_capacity=100),
+            Intervention([35], [45], transmission_reduction_factor=0.5),
+        ],
+    )
+    assert scenario.schedule.breakpoints[:3] == [10, 30, 35]
+    assert scenario.intervention_params_at_time_t(5) is scenario.baseline_param_dict
+    assert scenario.intervention_params_at_time_t(20)[
+        "transmission_reduction_factor"
+    ] == (0.8)
+    both = scenario.intervention_params_at_time_t(40)
+    assert_allclose(both["transmission_reduction_factor"], 0.4)
+    assert_allclose(both["isolation_capacity"] * population_size, 100)
+    assert not np.array_equal(both["infection_matrix"], infection_matrix)
+    # the end of a window is still part of it
+    assert scenario.intervention_params_at_time_t(50)["isolation_capacity"] == (
+        both["isolation_capacity"]
+    )
+    assert scenario.intervention_params_at_time_t(50.5) is (
+        scenario.baseline_param_dict
+    )
+    assert scenario.intervention_params_at_time_t(
+        61
+    ) is scenario.intervention_params_at_time_t(20)
+    # shielding works on a copy of the infection matrix
+    assert_allclose(infection_matrix, model.infection_matrix)
+
+
+def test_single_intervention_package_matches_single_intervention(model, run_kwargs):
+    population_size = model.population_size
+    single = SingleInterventionScenario(
+        population_size,
+        [20],
+        [90],
+        np.array(model.infection_matrix),
+        transmission_reduction_factor_inter=0.6,
+        icu_capacity_inter=10,
+    )
+    package = MultipleInterventionScenario(
+        population_size,
+        np.array(model.infection_matrix),
+        [Intervention([20], [90], transmission_reduction_factor=0.6, icu_capacity=10)],
+    )
+    for t in [0, 19.5, 20, 55.5, 90, 90.5, 150]:
+        for key in ["transmission_reduction_factor", "icu_capacity"]:
+            assert package.intervention_params_at_time_t(t)[key] == (
+                single.intervention_params_at_time_t(t)[key]
+            )
+    assert_allclose(
+        model.run_model(package, **run_kwargs)["Deaths"],
+        model.run_model(single, **run_kwargs)["Deaths"],
+    )
+
+
+def test_intensity_profiles_move_parameters_towards_the_baseline(model):
+    population_size = model.population_size
+
+    def scenario(**kwargs):
+        return SingleInterventionScenario(
+            population_size,
+            [10, 50],
+            [30, 60],
+            np.array(model.infection_matrix),
+            transmission_reduction_factor_inter=0.5,
+            **kwargs,
+        )
+
+    def reduction_factor(scenario, t):
+        return scenario.intervention_params_at_time_t(t)[
+            "transmission_reduction_factor"
+        ]
+
+    decay = scenario(inter_rate_change="Decay")
+    assert_allclose(reduction_factor(decay, 10), 0.5)
+    # 70% of the effect is left at the end of the window
+    assert_allclose(reduction_factor(decay, 30), 1 - 0.7 * 0.5)
+    assert_allclose(reduction_factor(decay, 20), 1 - 0.85 * 0.5)
+    assert reduction_factor(decay, 40) == 1
+    # every window is in place, not only the first one
+    assert_allclose(reduction_factor(decay, 50), 0.5)
+    exponential = scenario(intensity_profile=ExponentialDecayIntensity(5))
+    assert_allclose(reduction_factor(exponential, 20), 1 - 0.25 * 0.5, rtol=1e-3)
+    daily = scenario(intensity_profile=DailyIntensity([0, 1, 0.5]))
+    assert_allclose(
+        [reduction_factor(daily, t) for t in [10, 11, 11.5, 12, 25]],
+        [1, 0.5, 0.625, 0.75, 0.75],
+    )
+    assert daily.intervention_params_at_time_t(11)["infection_matrix"] is (
+        daily.intervention_param_dict["infection_matrix"]
+    )
+
+
+def test_scenarios_are_immutable_and_shareable_between_threads(model, run_kwargs):
+    population_size = model.population_size
+    infection_matrix = model.infection_matrix
+    camp_baseline = DeterministicCompartmentalModelScenario(
+        population_size, infection_matrix, icu_capacity=6
+    )
+    scenarios = [
+        camp_baseline,
+        SingleInterventionScenario(
+            population_size,
+            [0],
+            [100],
+            infection_matrix,
+            apply_shielding=True,
+            camp_specific_baseline_scenario=camp_baseline,
+        ),
+        SingleInterventionScenario(
+            population_size,
+            [0],
+            [100],
+            infection_matrix,
+            transmission_reduction_factor_inter=0.7,
+            camp_specific_baseline_scenario=camp_baseline,
+        ),
+        ReactiveInterventionScenario(
+            population_size,
+            infection_matrix,
+            start_condition=StateCondition(["I"], 100, population_size),
+            stop_condition=StateCondition(["I"], 50, population_size, above=False),
+            transmission_reduction_factor_inter=0.5,
+            camp_specific_baseline_scenario=camp_baseline,
+        ),
+    ]
+    # building the scenarios changes neither the model nor the camp baseline
+    assert_allclose(infection_matrix, model.infection_matrix)
+    assert camp_baseline.baseline_param_dict["infection_matrix"] is infection_matrix
+    with pytest.raises(TypeError):
+        scenarios[1].intervention_param_dict["icu_capacity"] = 1
+    with pytest.raises(ValueError):
+        scenarios[1].intervention_param_dict["infection_matrix"][0, 0] = 0
+    with pytest.raises(ValueError):
+        model.infection_matrix[0, 0] = 0
+    assert scenarios[1].fingerprint() is scenarios[1].fingerprint()
+    # only the runs of a reactive scenario switch
+    with pytest.raises(RuntimeError):
+        scenarios[3].switch(10)
+    serial = [model.run_model(scenario, **run_kwargs) for scenario in scenarios]
+    with ThreadPoolExecutor(max_workers=3) as executor:
+        concurrent = list(
+            executor.map(
+                lambda scenario: model.run_model(scenario, **run_kwargs),
+                scenarios * 2,
+            )
+        )
+    for serial_result, concurrent_result in zip(serial * 2, concurrent):
+        assert_allclose(serial_result["Deaths"], concurrent_result["Deaths"])
+        assert serial_result.attrs.get("switch_times") == concurrent_result.attrs.get(
+            "switch_times"
+        )
+
+
+def test_effective_reproduction_number_follows_susceptibles_and_interventions(model):
+    generated_params_df = model.generate_epidemic_parameter_ranges(3)
+    baseline = DeterministicCompartmentalModelScenario(
+        model.population_size, model.infection_matrix
+    )
+    scenario = SingleInterventionScenario(
+        model.population_size,
+        [0],
+        [20],
+        model.infection_matrix,
+        transmission_reduction_factor_inter=0.5,
+    )
+    baseline_result = model.run_single_simulation(baseline, generated_params_df)
+    r_eff = model.effective_reproduction_number(baseline_result, baseline)
+    assert r_eff.shape == (3, 201)
+    # nearly everybody is susceptible at the start
+    assert_allclose(r_eff[:, 0], generated_params_df["R0"], rtol=1e-3)
+    assert (np.diff(r_eff, axis=1) <= 1e-12).all()
+    assert (r_eff[:, -1] < 1).all()
+    result = model.run_single_simulation(scenario, generated_params_df)
+    scenario_r_eff = model.effective_reproduction_number(result, scenario)
+    assert_allclose(scenario_r_eff[:, 0], 0.5 * r_eff[:, 0])
@@ -0,0 +1,91 @@
+import os
+from pathlib import Path
+
+import numpy as np
+import pytest
+from numpy.polynomial.legendre import legval
+from numpy.testing import assert_allclose
+
+from epi_models import (
+    CampParams,
+    DeterministicCompartmentalModelRunner,
+    ScenarioEmulator,
+)
+from epi_models.emulator import legendre_exponents, legendre_features
+
+
+@pytest.fixture(scope="module")
+def runner():
+    base_dir = Path(os.path.dirname(__file__)).parents[0]
+    camp_params = CampParams.load_from_json(
+        base_dir / "epi_models" / "config" / "sample_input.json"
+    )
+    return DeterministicCompartmentalModelRunner(camp_params, num_iterations=1)
+
+
+def test_legendre_features_are_products_of_legendre_polynomials():
+    exponents = legendre_exponents(3, 3)
+    # 1 + 3 + 6 + 10 polynomials up to total degree 3
+    assert exponents.shape == (20, 3)
+    assert (exponents.sum(axis=1) <= 3).all()
+    x = np.random.default_rng(0).uniform(-1, 1, (5, 3))
+    expected = [
+        [
+            np.prod([legval(point[i], [0] * k + [1]) for i, k in enumerate(row)])
+            for row in exponents
+        ]
+        for point in x
+    ]
+    assert_allclose(legendre_features(x, exponents), expected, atol=1e-12)
+
+
+def test_emulator_matches_the_solver_and_round_trips(runner, tmp_path):
+    factor_bounds = {"R0": (2.5, 4), "LatentPeriod": (3, 5), "icu_capacity": (0, 40)}
+    emulator = ScenarioEmulator.train(
+        runner.model,
+        runner.do_nothing_scenario,
+        factor_bounds,
+        num_training_runs=256,
+        num_validation_runs=32,
+        seed=0,
+    )
+    validation_error = emulator.validation_error.set_index("Compartment")
+    assert (validation_error["Relative_RMSE"] < 0.1).all()
+
+    emulator.save(tmp_path / "emulator.npz")
+    loaded = ScenarioEmulator.load(tmp_path / "emulator.npz")
+    assert_allclose(
+        loaded.validation_error.set_index("Compartment").to_numpy(),
+        validation_error.to_numpy(),
+    )
+    bands = emulator.percentile_bands({"icu_capacity": 10}, num_draws=200, seed=1)
+    assert_allclose(
+        loaded.percentile_bands({"icu_capacity": 10}, num_draws=200, seed=1),
+        bands,
+    )
+    assert (bands["Deaths_q0.05"] <= bands["Deaths_q0.5"]).all()
+
+    # the epidemic factors are drawn like the model draws them, clipped to the trained bounds
+    assert loaded.draw_distribution == emulator.draw_distribution
+    design = emulator.sample_design({"icu_capacity": 10}, num_draws=1000, seed=1)
+    assert_allclose(np.mean(design[:, 0] == 4), 0.5, atol=0.05)
+    assert (design[:, 2] == 10).all()
+    generated_params_df = runner.model.generate_epidemic_parameter_ranges(50)
+    design = emulator.sample_design(
+        {"icu_capacity": 10}, generated_params_df=generated_params_df
+    )
+    assert_allclose(design[:, 0], np.clip(generated_params_df["R0"], 2.5, 4))
+    assert_allclose(design[:, 1], np.clip(generated_params_df["LatentPeriod"], 3, 5))
+    assert (bands["Deaths_q0.5"] <= bands["Deaths_q0.95"]).all()
+
+    exact_bands, error = emulator.verify(
+        runner.model,
+        runner.do_nothing_scenario,
+        {"icu_capacity": 10},
+        num_draws=200,
+        seed=1,
+    ).result()
+    assert list(exact_bands.columns) == list(bands.columns)
+    final_deaths = exact_bands["Deaths_q0.5"].iloc[-1]
+    assert abs(bands["Deaths_q0.5"].iloc[-1] - final_deaths) < 0.1 * final_deaths
+    assert (error["Relative_RMSE"] < 0.1).all()
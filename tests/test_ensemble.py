@@ -0,0 +1,87 @@
+import numpy as np
+import pandas as pd
+from numpy.testing import assert_allclose
+
+from epi_models.config.compartmental_model import Config
+from epi_models.ensemble import (
+    compartment_crossing_times,
+    ensemble_array,
+    perron_roots,
+    reaction_delays,
+    smooth_minimum,
+    threshold_crossing_times,
+)
+
+
+def synthetic_frame(num_draws=3, num_times=11):
+    time_range = np.arange(num_times)
+    frame = pd.DataFrame(
+        0.0,
+        index=np.tile(time_range, num_draws),
+        columns=list(Config.longname.values()) + ["Time", "R0"],
+    )
+    frame["Time"] = np.tile(time_range, num_draws)
+    frame["R0"] = np.repeat(np.arange(num_draws) + 2.0, num_times)
+    # draw d has d + 1 new symptomatic infections and half a death a day
+    frame["Infected_symptomatic"] = np.concatenate(
+        [(draw + 1) * time_range for draw in range(num_draws)]
+    )
+    frame["Deaths"] = np.tile(0.5 * time_range, num_draws)
+    frame["Susceptible"] = 20000 - frame["Infected_symptomatic"] - frame["Deaths"]
+    return frame
+
+
+def test_crossing_times_are_interpolated_between_days():
+    values = np.array(
+        [[0.0, 1.0, 3.0, 7.0], [5.0, 6.0, 7.0, 8.0], [0.0, 0.0, 0.0, 1.0]]
+    )
+    assert_allclose(
+        threshold_crossing_times(values, 2.0), [1.5, 0.0, np.nan], equal_nan=True
+    )
+    assert_allclose(
+        threshold_crossing_times(values, [5.0, 8.0, 1.0], time_range=[0, 2, 4, 6]),
+        [5.0, 6.0, 6.0],
+    )
+
+
+def test_frame_is_read_as_draws_by_time():
+    frame = synthetic_frame()
+    assert ensemble_array(frame, "Deaths").shape == (3, 11)
+    assert ensemble_array(frame, ["Deaths", "R0"]).shape == (3, 11, 2)
+    assert_allclose(
+        compartment_crossing_times(frame, "Infected_symptomatic", 4.5),
+        [4.5, 2.25, 1.5],
+    )
+
+
+def test_reaction_delays_of_every_draw():
+    delays = reaction_delays(synthetic_frame())
+    assert_allclose(delays["R0"], [2, 3, 4])
+    # 0.01% of 20000 people is 2 symptomatic infections
+    assert_allclose(delays["Symptomatic_threshold_day"], [2, 1, 2 / 3])
+    assert_allclose(delays["First_death_day"], [2, 2, 2])
+
+
+def test_perron_roots_match_eigenvalues():
+    rng = np.random.default_rng(0)
+    matrices = rng.random((50, 8, 8))
+    # a susceptible fraction of zero leaves a row of zeros
+    matrices[0, 3, :] = 0
+    matrices[1] = 0
+    roots, vectors = perron_roots(matrices)
+    assert_allclose(roots, np.abs(np.linalg.eigvals(matrices)).max(axis=1), rtol=1e-9)
+    # warm-started from the eigenvectors the roots come out straight away
+    warm_roots, _ = perron_roots(matrices, vectors, max_iterations=1)
+    assert_allclose(warm_roots[2:], roots[2:], rtol=1e-9)
+
+
+def test_smooth_minimum_stays_within_half_its_width():
+    rng = np.random.default_rng(0)
+    a = rng.random(1000) * 10
+    b = rng.random(1000) * 20 - 5
+    width = 0.5
+    smoothed = smooth_minimum(a, b, width)
+    assert np.all(smoothed <= np.minimum(a, b))
+    assert np.all(smoothed >= np.minimum(a, b) - width / 2)
+    assert_allclose(smooth_minimum(np.zeros(3), [-1.0, 0.0, 1.0], width), [-1, 0, 0])
+    assert np.array_equal(smooth_minimum(a, b, 0), np.minimum(a, b))
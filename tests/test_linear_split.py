@@ -0,0 +1,117 @@
+import os
+from copy import copy
+from pathlib import Path
+
+import numpy as np
+import pytest
+from numpy.testing import assert_allclose
+
+from epi_models import CampParams, DeterministicCompartmentalModelRunner
+from epi_models.linear_split import LinearSplitEngine
+from epi_models.model_spec import DRAW_RATE_COLUMNS
+
+
+@pytest.fixture(scope="module")
+def runner():
+    base_dir = Path(os.path.dirname(__file__)).parents[0]
+    camp_params = CampParams.load_from_json(
+        base_dir / "epi_models" / "config" / "sample_input.json"
+    )
+    return DeterministicCompartmentalModelRunner(camp_params, num_iterations=3)
+
+
+@pytest.fixture(scope="module")
+def isolation_scenario(runner):
+    return dict(runner.generate_isolate_symptomatic_scenarios().items())[
+        "upper_bound|0.25%|fifty_day"
+    ]
+
+
+def people(model, y_out):
+    """people in every compartment summed over the age compartments"""
+    return model.population_size * y_out.reshape(
+        len(y_out), model.age_categories, model.number_compartments, -1
+    ).sum(axis=1)
+
+
+def test_split_adds_up_to_the_equations_and_their_jacobian(runner, isolation_scenario):
+    model, generated_params_df = runner.model, runner.generated_params_df
+    engine = LinearSplitEngine(model, generated_params_df)
+    y = np.random.default_rng(0).random(3 * 88) * 0.02
+
+    def equations(y):
+        return engine.rhs(3.0, y, isolation_scenario)
+
+    assert_allclose(
+        equations(y).reshape(3, 88),
+        [
+            model.ode_equations(
+                3.0,
+                y.reshape(3, 88)[draw],
+                *generated_params_df[DRAW_RATE_COLUMNS].iloc[draw],
+                isolation_scenario,
+            )
+            for draw in range(3)
+        ],
+        atol=1e-15,
+    )
+    # large ensembles work the linear part out entry by entry
+    looped = copy(engine)
+    looped.max_matmul_draws = 0
+    assert_allclose(looped.rhs(3.0, y, isolation_scenario), equations(y), atol=1e-15)
+    jacobian = engine.jacobian(3.0, y, isolation_scenario)
+    step = 1e-7
+    for column in [0, 2, 13, 20, 60]:
+        # the draws are independent so a column of every draw is perturbed at once
+        perturbation = np.zeros((3, 88))
+        perturbation[:, column] = step
+        finite_differences = (equations(y + perturbation.ravel()) - equations(y)) / step
+        assert_allclose(
+            jacobian[:, :, column], finite_differences.reshape(3, 88), atol=1e-5
+        )
+    # the complex steps give the derivatives of N(y) to rounding whatever the step
+    stepped = copy(engine)
+    stepped.complex_step = 1e-8
+    assert_allclose(
+        stepped.jacobian(3.0, y, isolation_scenario), jacobian, rtol=1e-12, atol=1e-14
+    )
+
+
+def test_exponential_integrator_matches_the_adaptive_one(runner, isolation_scenario):
+    model, generated_params_df = runner.model, runner.generated_params_df
+    y0 = model.initial_state_vector(1, 1, 1)
+    time_range = np.arange(201)
+    for scenario in [runner.do_nothing_scenario, isolation_scenario]:
+        adaptive = people(
+            model,
+            model.integrate_ensemble(scenario, generated_params_df, y0, time_range),
+        )
+        exponential = people(
+            model,
+            model.integrate_ensemble(
+                scenario, generated_params_df, y0, time_range, method="ETD2RK"
+            ),
+        )
+        # within 1% of the peak of every compartment
+        assert_allclose(
+            exponential,
+            adaptive,
+            atol=0.01 * adaptive.max(axis=2, keepdims=True).max(),
+        )
+
+
+def test_jacobian_drives_an_implicit_solver(runner, isolation_scenario):
+    model, generated_params_df = runner.model, runner.generated_params_df
+    y0 = model.initial_state_vector(1, 1, 1)
+    time_range = np.arange(201)
+    implicit = model.integrate_ensemble(
+        isolation_scenario, generated_params_df, y0, time_range, method="BDF"
+    )
+    adaptive = model.integrate_ensemble(
+        isolation_scenario, generated_params_df, y0, time_range
+    )
+    assert_allclose(
+        people(model, implicit),
+        people(model, adaptive),
+        atol=1e-3 * people(model, adaptive).max(),
+    )
@@ -0,0 +1,119 @@
+import os
+from pathlib import Path
+
+import numpy as np
+import pytest
+from numpy.testing import assert_allclose
+
+from epi_models import (
+    CampParams,
+    DeterministicCompartmentalModelRunner,
+    DeterministicCompartmentalModelScenario,
+    MetapopulationModel,
+)
+
+
+@pytest.fixture(scope="module")
+def camp_params():
+    base_dir = Path(os.path.dirname(__file__)).parents[0]
+    return CampParams.load_from_json(
+        base_dir / "epi_models" / "config" / "sample_input.json"
+    )
+
+
+def zone(camp_params, scale):
+    zone_params = dict(camp_params.__dict__)
+    for key, value in camp_params.__dict__.items():
+        if key.startswith("population_age_"):
+            zone_params[key] = int(value * scale)
+    return CampParams(zone_params)
+
+
+def zone_scenarios(model):
+    return [
+        DeterministicCompartmentalModelScenario(
+            model.zone_population_sizes[i], model.zone_infection_matrices[i]
+        )
+        for i in range(model.num_zones)
+    ]
+
+
+def run_kwargs(generated_params_df):
+    row = generated_params_df.iloc[0]
+    return dict(
+        t_stop=200,
+        r0=row["R0"],
+        beta=row["beta"],
+        latent_rate=row["latentRate"],
+        removal_rate=row["removalRate"],
+        hosp_rate=row["hospRate"],
+        death_rate_ICU=row["deathRateICU"],
+        death_rate_no_ICU=row["deathRateNoICU"],
+        initial_exposed=1,
+        initial_symp=1,
+        initial_asymp=1,
+    )
+
+
+def test_single_zone_matches_compartmental_model(camp_params):
+    runner = DeterministicCompartmentalModelRunner(camp_params, num_iterations=1)
+    model = runner.model
+    metapopulation_model = MetapopulationModel([camp_params], [[1.0]])
+    # the camp baseline isolates the symptomatic, moves the high risk residents out and has few ICU beds
+    scenario = runner.camp_baseline
+    # both run the same compiled equations, tight enough for the error of the solver to stay below the comparison
+    kwargs = dict(
+        run_kwargs(runner.generated_params_df),
+        integrator_params={
+            "name": "vode",
+            "nsteps": 50000,
+            "rtol": 1e-10,
+            "atol": 1e-14,
+        },
+    )
+    result = model.run_model(scenario, **kwargs)
+    zone_result = metapopulation_model.run_model([scenario], **kwargs)
+    assert (zone_result["Zone"] == "zone_0").all()
+    assert result["Offsite"].iloc[-1] > 1000
+    assert_allclose(
+        zone_result[result.columns].to_numpy(), result.to_numpy(), rtol=1e-6, atol=1e-6
+    )
+
+
+def test_zones_are_coupled_by_mobility(camp_params):
+    zone_params = [zone(camp_params, 0.5), zone(camp_params, 0.25)]
+    isolated_model = MetapopulationModel(zone_params, np.eye(2), zone_names=["a", "b"])
+    coupled_model = MetapopulationModel(
+        zone_params, [[0.9, 0.1], [0.1, 0.9]], zone_names=["a", "b"]
+    )
+    kwargs = dict(
+        run_kwargs(isolated_model.generate_epidemic_parameter_ranges(1)),
+        initial_exposed=[10, 0],
+        initial_symp=0,
+        initial_asymp=0,
+    )
+    isolated = isolated_model.run_model(zone_scenarios(isolated_model), **kwargs)
+    coupled = coupled_model.run_model(zone_scenarios(coupled_model), **kwargs)
+    compartments = [
+        "Susceptible",
+        "Exposed",
+        "Infected_symptomatic",
+        "Infected_asymptomatic",
+        "Recovered",
+        "Hospitalised",
+        "Critical",
+        "Deaths",
+        "Offsite",
+        "Quarantined",
+        "No_ICU_Care",
+    ]
+    for result in [isolated, coupled]:
+        assert len(result) == 2 * 201
+        assert_allclose(
+            result.groupby("Zone")[compartments].sum().sum(axis=1) / 201,
+            [10000, 5000],
+            rtol=1e-3,
+        )
+    # without mobility the epidemic stays in the zone it started in
+    assert isolated.loc[isolated["Zone"] == "b", "Recovered"].max() < 1e-6
+    assert coupled.loc[coupled["Zone"] == "b", "Recovered"].iloc[-1] > 1000
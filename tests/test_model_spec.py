@@ -0,0 +1,215 @@
+import os
+import timeit
+from copy import copy
+from pathlib import Path
+
+import numpy as np
+import pytest
+from numpy.testing import assert_allclose
+from scipy.integrate import ode
+
+from epi_models import CampParams, DeterministicCompartmentalModelRunner
+from epi_models.config.compartmental_model import Config
+from epi_models.deterministic_compartmental_model_scenario import (
+    DeterministicCompartmentalModelScenario,
+)
+from epi_models.linear_split import LinearSplitEngine
+from epi_models.model_spec import COVID_SPEC, DRAW_RATE_COLUMNS, Flow
+
+
+@pytest.fixture(scope="module")
+def runner():
+    base_dir = Path(os.path.dirname(__file__)).parents[0]
+    camp_params = CampParams.load_from_json(
+        base_dir / "epi_models" / "config" / "sample_input.json"
+    )
+    return DeterministicCompartmentalModelRunner(camp_params, num_iterations=3)
+
+
+def reference_equations(t, y, model, rates, scenario):
+    """the equations of DeterministicCompartmentalModel written out by hand for a single draw"""
+    beta, latent, removal, hosp, death_icu, death_no_icu = rates
+    p = scenario.intervention_params_at_time_t(t)
+    states = dict(zip(COVID_SPEC.index, y.reshape(model.age_categories, -1).T))
+    S, E, I, A, H, C, Q, U = (states[code] for code in "SEIAHCQU")
+    newly_exposed = (
+        p["transmission_reduction_factor"]
+        * beta
+        * S
+        * (p["infection_matrix"] @ (I + model.AsymptInfectiousFactor * A))
+    )
+    high_risk = np.arange(model.age_categories) >= (
+        model.age_categories - p["first_high_risk_category_n"]
+    )
+    S_high_risk = high_risk * S
+    S_removal = S_high_risk.sum()
+    offsite = 0 * S
+    if S_removal > 0:
+        offsite = min(S_removal, p["remove_high_risk_rate"]) / S_removal * S_high_risk
+    quarantine, sendback = 0 * I, 0 * Q
+    if p["remove_symptomatic_rate"] > 0 and p["isolation_capacity"] > 0:
+        removed = min(
+            I.sum(), p["remove_symptomatic_rate"], p["isolation_capacity"] - Q.sum()
+        )
+        if I.sum() > 0:
+            quarantine = removed / I.sum() * I
+    elif Q.sum() > 0:
+        sendback = (1 - model.quarant_rate) * Q
+    if H.sum() > 0:
+        on_icu = p["icu_capacity"] / H.sum() * H
+    else:
+        on_icu = np.full(
+            model.age_categories, p["icu_capacity"] / model.population_size
+        )
+    needing_care = hosp * model.p_critical_given_hospitalised * H
+    icu_cared = np.minimum(needing_care, on_icu - (1 - death_icu) * C)
+    p_hosp = model.p_hosp_given_symptomatic
+    changes = {
+        "S": -newly_exposed - offsite,
+        "E": newly_exposed - latent * E,
+        "I": model.p_symptomatic * latent * E - removal * I - quarantine + sendback,
+        "A": (1 - model.p_symptomatic) * latent * E - removal * A,
+        "H": p_hosp * removal * I
+        - hosp * H
+        + death_icu * (1 - model.death_prob_with_ICU) * np.minimum(C, on_icu)
+        + p_hosp * model.quarant_rate * Q,
+        "C": icu_cared - death_icu * C,
+        "U": needing_care - icu_cared - death_no_icu * U,
+        "R": (1 - p_hosp) * removal * I
+        + removal * A
+        + hosp * (1 - model.p_critical_given_hospitalised) * H
+        + (1 - p_hosp) * model.quarant_rate * Q,
+        "D": death_no_icu * U + model.death_prob_with_ICU * death_icu * C,
+        "O": offsite,
+        "Q": quarantine - model.quarant_rate * Q - sendback,
+    }
+    return np.stack(
+        [changes[code] for code, _ in COVID_SPEC.compartments], axis=1
+    ).ravel()
+
+
+def test_compiled_specification_runs_the_equations(runner):
+    model, generated_params_df = runner.model, runner.generated_params_df
+    rates = tuple(generated_params_df[DRAW_RATE_COLUMNS].iloc[0])
+    time_range = np.arange(201)
+    y0 = model.initial_state_vector(1, 1, 1)
+    # tight enough for the error of the solver to stay below the comparison
+    integrator_params = {"name": "vode", "nsteps": 50000, "rtol": 1e-10, "atol": 1e-14}
+    for scenario in [
+        runner.camp_baseline,
+        dict(runner.generate_isolate_symptomatic_scenarios().items())[
+            "upper_bound|0.25%|fifty_day"
+        ],
+    ]:
+        solver = (
+            ode(reference_equations)
+            .set_f_params(model, rates, scenario)
+            .set_integrator(**integrator_params)
+            .set_initial_value(y0, 0)
+        )
+        expected = [y0]
+        for t in time_range[1:]:
+            expected.append(solver.integrate(t))
+        expected = model.population_size * np.array(expected)
+        frame = model.run_model(
+            scenario,
+            time_range[-1],
+            **dict(
+                zip(
+                    [
+                        "beta",
+                        "latent_rate",
+                        "removal_rate",
+                        "hosp_rate",
+                        "death_rate_ICU",
+                        "death_rate_no_ICU",
+                    ],
+                    rates,
+                )
+            ),
+            initial_exposed=1,
+            initial_symp=1,
+            initial_asymp=1,
+            integrator_params=integrator_params,
+        )
+        _, age_columns = COVID_SPEC.output_columns(model.ages)
+        assert_allclose(frame[age_columns].to_numpy(), expected, rtol=1e-6, atol=1e-5)
+    assert [name for _, name in COVID_SPEC.compartments] == list(
+        Config.longname.values()
+    )
+    # U only passes the people who get no ICU care on to D, nothing the nonlinear flows read depends on it
+    assert COVID_SPEC.downstream() == ["R", "D", "O", "U"]
+    reduced = COVID_SPEC.reduced()
+    assert [code for code, _ in reduced.compartments] == list("SEIAHCQ")
+    assert [(flow.source, flow.target) for flow in reduced.flows if flow.hook] == [
+        ("S", "E"),
+        ("S", None),
+        ("I", "Q"),
+        ("Q", "I"),
+        (None, "H"),
+        (None, "C"),
+    ]
+    names, age_names = COVID_SPEC.output_columns(model.ages)
+    assert age_names[: len(names) + 1] == [
+        name + "_" + model.ages[0] for name in names
+    ] + [names[0] + "_" + model.ages[1]]
+
+
+def test_compiled_equations_keep_up_with_the_hand_written_ones(runner):
+    model, generated_params_df = runner.model, runner.generated_params_df
+    rates = tuple(generated_params_df[DRAW_RATE_COLUMNS].iloc[0])
+    y = model.initial_state_vector(1, 1, 1)
+    # every intervention of the camp is on at day 5
+    scenario = runner.camp_baseline
+    engine = model.draw_engine(*rates)
+
+    def best_time(equations):
+        return min(timeit.repeat(equations, number=500, repeat=7))
+
+    assert_allclose(
+        engine.rhs(5.0, y, scenario),
+        reference_equations(5.0, y, model, rates, scenario),
+        rtol=1e-12,
+        atol=1e-15,
+    )
+    reference_time = best_time(
+        lambda: reference_equations(5.0, y, model, rates, scenario)
+    )
+    assert best_time(lambda: engine.rhs(5.0, y, scenario)) <= reference_time
+    # ode_equations keeps the engine of the rates instead of compiling it again
+    assert (
+        best_time(lambda: model.ode_equations(5.0, y, *rates, scenario))
+        <= reference_time
+    )
+
+
+def test_extended_specification_runs_through_the_engine(runner):
+    model = copy(runner.model)
+    model.spec = COVID_SPEC.extended(
+        [("V", "Vaccinated")], [Flow("S", "V", "vaccination_rate")]
+    )
+    # the same epidemic in every draw so only the vaccination differs
+    generated_params_df = runner.generated_params_df.iloc[[0, 0, 0]].reset_index(
+        drop=True
+    )
+    generated_params_df["vaccination_rate"] = [0.0, 0.01, 0.05]
+    assert model.spec.downstream() == ["R", "D", "O", "U", "V"]
+    scenario = DeterministicCompartmentalModelScenario(
+        model.population_size, model.infection_matrix
+    )
+    y0 = np.concatenate(
+        [model.initial_state_vector(1, 1, 1).reshape(8, 11), np.zeros((8, 1))], axis=1
+    ).ravel()
+    time_range = np.arange(101)
+    y_out = LinearSplitEngine(model, generated_params_df).integrate(
+        scenario, y0, time_range
+    )
+    totals = model.population_size * y_out.reshape(3, 8, 12, -1).sum(axis=1)
+    vaccinated = totals[:, model.spec.index["V"]]
+    deaths = totals[:, model.spec.index["D"]]
+    assert np.all(vaccinated[0] == 0)
+    assert np.all(np.diff(vaccinated[1:], axis=1) >= 0)
+    assert vaccinated[2, -1] > vaccinated[1, -1] > 0
+    assert deaths[0, -1] > deaths[1, -1] > deaths[2, -1]
+    frame = model.parse_ensemble_output(y_out, time_range, generated_params_df)
+    assert_allclose(frame["Vaccinated"].to_numpy(), vaccinated.ravel())
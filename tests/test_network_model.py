@@ -0,0 +1,134 @@
+import os
+import pickle
+from copy import copy
+from pathlib import Path
+
+import numpy as np
+import pytest
+from numpy.testing import assert_allclose
+
+from epi_models import CampParams, DeterministicCompartmentalModelScenario, NetworkModel
+from epi_models.config.compartmental_model import Config
+
+COMPARTMENTS = [
+    "Susceptible",
+    "Exposed",
+    "Infected_symptomatic",
+    "Infected_asymptomatic",
+    "Recovered",
+    "Hospitalised",
+    "Critical",
+    "Deaths",
+    "Offsite",
+    "Quarantined",
+    "No_ICU_Care",
+]
+
+
+@pytest.fixture(scope="module")
+def camp_params():
+    base_dir = Path(os.path.dirname(__file__)).parents[0]
+    return CampParams.load_from_json(
+        base_dir / "epi_models" / "config" / "sample_input.json"
+    )
+
+
+@pytest.fixture(scope="module")
+def model(camp_params):
+    return NetworkModel(camp_params, seed=0)
+
+
+def test_contact_graph_follows_contact_matrix(model):
+    graph = model.contact_graph
+    assert graph.shape == (model.population_size, model.population_size)
+    assert (graph != graph.T).nnz == 0
+    assert graph.diagonal().sum() == 0
+    # mean contacts per resident of each age compartment against the contact matrix
+    age = model.agents["age"]
+    degree = np.bincount(age, weights=np.asarray(graph.sum(axis=1)).ravel())
+    # contacts are symmetrised between age compartments as every edge has two ends
+    contacts = model.base_infection_matrix * model.population_counts[:, None]
+    expected_degree = ((contacts + contacts.T) / 2).sum(axis=1)
+    populated = model.population_counts > 100
+    assert_allclose(
+        degree[populated],
+        expected_degree[populated],
+        rtol=0.1,
+    )
+
+
+def test_contact_graph_is_cached_per_camp(camp_params, model):
+    other_model = NetworkModel(camp_params, seed=1)
+    assert other_model.contact_graph is model.contact_graph
+    assert (
+        NetworkModel(camp_params, graph_seed=1).contact_graph is not model.contact_graph
+    )
+    # only the most recently used graphs are kept
+    graph_cache_size = Config.network_model_params["graph_cache_size"]
+    for graph_seed in range(2, graph_cache_size + 2):
+        NetworkModel(camp_params, graph_seed=graph_seed)
+    assert len(NetworkModel._contact_graph_cache) == graph_cache_size
+    assert NetworkModel(camp_params).contact_graph is not model.contact_graph
+
+
+def test_shielding_masks_edge_weights(model):
+    # contacts between the two oldest age compartments and the rest cut to a quarter
+    shielded_matrix = np.array(model.base_infection_matrix)
+    shielded_matrix[:6, 6:] *= 0.25
+    shielded_matrix[6:, :6] *= 0.25
+    masked_graph = model.masked_contact_graph(shielded_matrix)
+    assert np.shares_memory(masked_graph.indices, model.contact_graph.indices)
+    assert np.shares_memory(masked_graph.indptr, model.contact_graph.indptr)
+    age = model.agents["age"]
+    rows = np.repeat(np.arange(len(age)), np.diff(masked_graph.indptr))
+    between_groups = (age[rows] >= 6) != (age[masked_graph.indices] >= 6)
+    assert_allclose(
+        masked_graph.data[between_groups] / model.contact_graph.data[between_groups],
+        0.25,
+    )
+    assert (
+        model.masked_contact_graph(model.base_infection_matrix) is model.contact_graph
+    )
+    # only the most recently used masks are kept
+    edge_mask_cache_size = Config.network_model_params["edge_mask_cache_size"]
+    for scale in np.linspace(0.1, 0.9, edge_mask_cache_size + 1):
+        model.masked_contact_graph(scale * model.base_infection_matrix)
+    assert len(model._edge_mask_cache) == edge_mask_cache_size
+    assert model.masked_contact_graph(shielded_matrix) is not masked_graph
+
+
+def test_model_pickles_and_copes_without_contacts(model):
+    # the processes of a pool get their models pickled, the lock of the caches stays with the class
+    unpickled = pickle.loads(pickle.dumps(model))
+    assert (unpickled.contact_graph != model.contact_graph).nnz == 0
+    scenario = DeterministicCompartmentalModelScenario(
+        model.population_size, model.infection_matrix
+    )
+    scenario_dict = scenario.intervention_params_at_time_t(0)
+    state = np.full(model.population_size, Config.compartment_index["I"])
+    no_contacts = copy(model)
+    no_contacts.graph_eigenvalue = 0.0
+    pressure = no_contacts.transmission_pressure(
+        model.agents, state, scenario_dict, 0.5
+    )
+    assert pressure.shape == (model.population_size,)
+    assert not pressure.any()
+
+
+def test_every_resident_is_accounted_for(model):
+    scenario = DeterministicCompartmentalModelScenario(
+        model.population_size,
+        model.infection_matrix,
+        isolation_capacity=200,
+        remove_symptomatic_rate=100,
+        icu_capacity=6,
+    )
+    generated_params_df = model.generate_epidemic_parameter_ranges(2)
+    result = model.run_single_simulation(
+        scenario, generated_params_df, initial_exposed=10
+    )
+    assert len(result) == 2 * 201
+    assert_allclose(result[COMPARTMENTS].sum(axis=1), model.population_size)
+    assert (result["Recovered"].to_numpy()[200::201] > 0).all()
+    assert (result["Critical"] <= 6).all()
+    assert (result["Quarantined"] <= 200).all()
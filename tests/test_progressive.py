@@ -0,0 +1,79 @@
+import os
+from pathlib import Path
+
+import numpy as np
+import pytest
+from numpy.testing import assert_allclose
+from pandas.testing import assert_frame_equal
+from scipy.stats import qmc
+
+from epi_models import CampParams, DeterministicCompartmentalModelRunner
+from epi_models.progressive import low_discrepancy_order, percentile_bands
+
+
+@pytest.fixture(scope="module")
+def runner():
+    base_dir = Path(os.path.dirname(__file__)).parents[0]
+    camp_params = CampParams.load_from_json(
+        base_dir / "epi_models" / "config" / "sample_input.json"
+    )
+    return DeterministicCompartmentalModelRunner(camp_params, num_iterations=12)
+
+
+def test_low_discrepancy_order_spreads_the_first_draws():
+    design = np.random.default_rng(3).normal(size=(256, 4))
+    order = low_discrepancy_order(design, seed=3)
+    assert sorted(order) == list(range(256))
+    ranks = (np.argsort(np.argsort(design, axis=0), axis=0) + 0.5) / len(design)
+    for num_draws in [16, 32, 64]:
+        assert qmc.discrepancy(ranks[order[:num_draws]]) < qmc.discrepancy(
+            ranks[:num_draws]
+        )
+
+
+def test_snapshots_tighten_to_the_full_run(runner):
+    snapshots = list(
+        runner.run_progressive(snapshot_interval=0, families=[], first_batch_size=2)
+    )
+    assert [snapshot.final for snapshot in snapshots] == [False] * (
+        len(snapshots) - 1
+    ) + [True]
+    assert snapshots[0].num_draws == {"do_nothing_baseline": 2}
+    # the early snapshots come from the vectorised ensemble, the solver runs of the draws replace them later
+    assert snapshots[0].num_exact_draws == {"do_nothing_baseline": 0}
+    ensemble_done = [
+        snapshot
+        for snapshot in snapshots
+        if snapshot.num_draws.get("camp_baseline", 0) == 12
+        and snapshot.num_exact_draws["do_nothing_baseline"] == 0
+    ]
+    assert ensemble_done
+    for key, scenario in [
+        ("do_nothing_baseline", runner.do_nothing_scenario),
+        ("camp_baseline", runner.camp_baseline),
+    ]:
+        # the ensemble bands are close to the exact ones
+        exact = percentile_bands(
+            runner.model.run_single_simulation(scenario, runner.generated_params_df)
+        )
+        assert_allclose(
+            ensemble_done[-1].bands[key].to_numpy(),
+            exact.to_numpy(),
+            atol=0.01 * exact.to_numpy().max(),
+        )
+    draw_counts = [snapshot.num_draws.get("camp_baseline", 0) for snapshot in snapshots]
+    assert draw_counts == sorted(draw_counts) and draw_counts[-1] == 12
+    # too few draws to bound the outer quantiles at first
+    assert snapshots[0].relative_precision == np.inf
+    final = snapshots[-1]
+    assert set(final.precision["Num_draws"]) == {12}
+    for scenario_key, scenario in [
+        ("do_nothing_baseline", runner.do_nothing_scenario),
+        ("camp_baseline", runner.camp_baseline),
+    ]:
+        assert_frame_equal(
+            final.bands[scenario_key],
+            percentile_bands(
+                runner.model.run_single_simulation(scenario, runner.generated_params_df)
+            ),
+        )
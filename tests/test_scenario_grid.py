@@ -0,0 +1,88 @@
+import os
+from pathlib import Path
+
+import pytest
+from numpy.testing import assert_allclose
+
+from epi_models import (
+    CampParams,
+    DeterministicCompartmentalModelRunner,
+    ScenarioGrid,
+    SingleInterventionScenario,
+)
+
+
+@pytest.fixture(scope="module")
+def runner():
+    base_dir = Path(os.path.dirname(__file__)).parents[0]
+    camp_params = CampParams.load_from_json(
+        base_dir / "epi_models" / "config" / "sample_input.json"
+    )
+    return DeterministicCompartmentalModelRunner(camp_params, num_iterations=2)
+
+
+@pytest.fixture(scope="module")
+def isolation_grid(runner):
+    built = []
+    baseline_capacity = int(runner.camp_params.isolation_capacity)
+
+    def build_scenario(capacity, end_times):
+        built.append((capacity, end_times))
+        return SingleInterventionScenario(
+            runner.model.population_size,
+            [0],
+            end_times,
+            runner.model.infection_matrix,
+            isolation_capacity_inter=capacity,
+            camp_specific_baseline_scenario=runner.camp_baseline,
+        )
+
+    grid = ScenarioGrid(
+        build_scenario,
+        [
+            (
+                "capacity",
+                {
+                    "current": baseline_capacity,
+                    "double": 2 * baseline_capacity,
+                    "twice_current": 2 * baseline_capacity,
+                },
+            ),
+            ("end_times", {"fifty_day": [50], "one_hundred_day": [100]}),
+        ],
+    )
+    return grid, built
+
+
+def test_grid_is_lazy_and_merges_equivalent_scenarios(runner, isolation_grid):
+    grid, built = isolation_grid
+    assert len(grid) == 6
+    assert not built
+    assert list(grid.scenario_ids())[:2] == [
+        "current|fifty_day",
+        "current|one_hundred_day",
+    ]
+    distinct = grid.distinct_scenarios()
+    assert len(built) == 6
+    scenario_ids = [sorted(ids) for _, ids in distinct]
+    # the current capacity is the baseline whatever the duration
+    assert scenario_ids == [
+        ["current|fifty_day", "current|one_hundred_day"],
+        ["double|fifty_day", "twice_current|fifty_day"],
+        ["double|one_hundred_day", "twice_current|one_hundred_day"],
+    ]
+    assert distinct[0][0].fingerprint() == runner.camp_baseline.fingerprint()
+
+
+def test_run_scenario_grid_fans_results_out(runner, isolation_grid):
+    grid, _ = isolation_grid
+    result = runner.run_scenario_grid(grid)
+    assert list(result["Scenario_suffix"].unique()) == list(grid.scenario_ids())
+    by_id = dict(tuple(result.groupby("Scenario_suffix")))
+    assert_allclose(
+        by_id["double|fifty_day"]["Deaths"], by_id["twice_current|fifty_day"]["Deaths"]
+    )
+    assert (
+        by_id["double|fifty_day"]["Deaths"].iloc[-1]
+        <= by_id["current|fifty_day"]["Deaths"].iloc[-1]
+    )
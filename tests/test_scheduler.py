@@ -0,0 +1,82 @@
+import os
+import time
+from pathlib import Path
+
+import pytest
+
+from epi_models import (
+    CampParams,
+    DeterministicCompartmentalModelRunner,
+    ScenarioScheduler,
+)
+
+
+@pytest.fixture(scope="module")
+def runner():
+    base_dir = Path(os.path.dirname(__file__)).parents[0]
+    camp_params = CampParams.load_from_json(
+        base_dir / "epi_models" / "config" / "sample_input.json"
+    )
+    return DeterministicCompartmentalModelRunner(camp_params, num_iterations=3)
+
+
+def test_queue_follows_priorities(runner):
+    scheduler = ScenarioScheduler(
+        runner,
+        priorities={"shielding": 2, "isolate_symptomatic|low_bound|0.1%|fifty_day": 5},
+    )
+    queue = [
+        (family, scenario_id)
+        for _, family, scenario_id, _ in scheduler.generate_queue()
+    ]
+    assert queue[:2] == [
+        ("baseline", "do_nothing_baseline"),
+        ("baseline", "camp_baseline"),
+    ]
+    assert queue[2] == ("isolate_symptomatic", "low_bound|0.1%|fifty_day")
+    assert [family for family, _ in queue[3:6]] == ["shielding"] * 3
+    # the rest keep the order of run_different_scenarios
+    assert queue[6][0] == "better_hygiene"
+
+
+def test_deadline_flags_reduced_estimates(runner):
+    scheduler = ScenarioScheduler(runner, deadline=0, reduced_num_iterations=1)
+    results, summary = scheduler.run()
+    assert summary["Reduced_estimate"].all()
+    baselines = summary["Family"] == "baseline"
+    assert (summary.loc[baselines, "Num_draws"] == 1).all()
+    assert results["do_nothing_baseline"]["Reduced_estimate"].all()
+    # nothing else is started past the deadline
+    assert (summary.loc[~baselines, "Num_draws"] == 0).all()
+    for family in runner.scenario_families():
+        assert results[family].empty
+
+
+def test_short_deadline_bounds_the_wall_time(runner):
+    deadline = 0.5
+    scheduler = ScenarioScheduler(
+        runner, deadline=deadline, reduced_num_iterations=1, chunk_size=1
+    )
+    start_time = time.monotonic()
+    results, summary = scheduler.run()
+    # past the deadline by at most the draw in progress
+    assert time.monotonic() - start_time < deadline + 1
+    assert (summary["Num_draws"] == 0).any()
+    assert summary["Seconds"].sum() < deadline + 1
+    for family in runner.scenario_families():
+        assert set(results[family].get("Scenario_suffix", [])) == set(
+            summary.loc[
+                (summary["Family"] == family) & (summary["Num_draws"] > 0),
+                "Scenario_suffix",
+            ]
+        )
+
+
+def test_no_deadline_runs_all_draws(runner):
+    scheduler = ScenarioScheduler(runner, chunk_size=2, families=["shielding"])
+    results, summary = scheduler.run()
+    assert list(results) == ["do_nothing_baseline", "camp_baseline", "shielding"]
+    assert not summary["Reduced_estimate"].any()
+    assert (summary["Num_draws"] == 3).all()
+    assert len(results["camp_baseline"]) == 3 * 201
+    assert len(results["shielding"]) == 3 * 3 * 201
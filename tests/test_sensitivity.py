@@ -0,0 +1,55 @@
+import os
+from pathlib import Path
+
+import numpy as np
+import pytest
+from numpy.testing import assert_allclose
+
+from epi_models import CampParams, DeterministicCompartmentalModelRunner
+from epi_models.sensitivity import run_sobol_analysis, saltelli_design, sobol_indices
+
+
+@pytest.fixture(scope="module")
+def runner():
+    base_dir = Path(os.path.dirname(__file__)).parents[0]
+    camp_params = CampParams.load_from_json(
+        base_dir / "epi_models" / "config" / "sample_input.json"
+    )
+    return DeterministicCompartmentalModelRunner(camp_params, num_iterations=1)
+
+
+def test_saltelli_design_and_indices_of_a_known_function():
+    A, B, AB = saltelli_design({"x": (0, 1), "y": (0, 1), "z": (0, 1)}, 1000, seed=0)
+    assert A.shape == (1024, 3) and AB.shape == (3, 1024, 3)
+    assert_allclose(AB[1][:, [0, 2]], A[:, [0, 2]])
+    assert_allclose(AB[1][:, 1], B[:, 1])
+
+    # additive function with variances 1:4:0 so the indices are 0.2, 0.8 and 0
+    def f(x):
+        return x[..., 0] + 2 * x[..., 1]
+
+    first_order, total = sobol_indices(f(A), f(B), f(AB), seed=0)
+    assert_allclose(first_order[:, 0], [0.2, 0.8, 0], atol=0.02)
+    assert_allclose(total[:, 0], [0.2, 0.8, 0], atol=0.02)
+    assert (first_order[:, 1] <= first_order[:, 0]).all()
+    assert (first_order[:, 0] <= first_order[:, 2]).all()
+
+
+def test_sobol_analysis_ranks_the_factors(runner):
+    indices = run_sobol_analysis(
+        runner.model,
+        runner.camp_baseline,
+        {"R0": (2.5, 5.5), "LatentPeriod": (3, 5), "icu_capacity": (0, 40)},
+        num_base_samples=64,
+        seed=0,
+        num_bootstrap=200,
+    ).set_index(["Outcome", "Factor"])
+    assert len(indices) == 3 * 3
+    assert indices.loc[("Deaths", "R0"), "Total"] > 0.5
+    assert indices.loc[("Deaths", "R0"), "Total"] > (
+        indices.loc[("Deaths", "LatentPeriod"), "Total"]
+    )
+    # ICU beds change who dies but not how the infection spreads
+    assert_allclose(indices.loc[("Peak_symptomatic", "icu_capacity"), "Total"], 0)
+    assert indices.loc[("ICU_days", "icu_capacity"), "Total"] > 0.05
+    assert np.isfinite(indices.to_numpy()).all()
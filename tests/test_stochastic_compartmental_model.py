@@ -0,0 +1,89 @@
+import os
+from pathlib import Path
+
+import numpy as np
+import pytest
+from numpy.testing import assert_allclose, assert_array_equal
+
+from epi_models import (
+    CampParams,
+    DeterministicCompartmentalModelScenario,
+    StochasticCompartmentalModel,
+)
+
+COMPARTMENTS = [
+    "Susceptible",
+    "Exposed",
+    "Infected_symptomatic",
+    "Infected_asymptomatic",
+    "Recovered",
+    "Hospitalised",
+    "Critical",
+    "Deaths",
+    "Offsite",
+    "Quarantined",
+    "No_ICU_Care",
+]
+
+
+@pytest.fixture(scope="module")
+def model():
+    base_dir = Path(os.path.dirname(__file__)).parents[0]
+    camp_params = CampParams.load_from_json(
+        base_dir / "epi_models" / "config" / "sample_input.json"
+    )
+    return StochasticCompartmentalModel(camp_params, seed=0)
+
+
+@pytest.fixture(scope="module")
+def scenario(model):
+    return DeterministicCompartmentalModelScenario(
+        model.population_size,
+        model.infection_matrix,
+        isolation_capacity=200,
+        remove_symptomatic_rate=100,
+        remove_high_risk_rate=100,
+        icu_capacity=6,
+    )
+
+
+@pytest.fixture(scope="module")
+def result(model, scenario):
+    generated_params_df = model.generate_epidemic_parameter_ranges(200)
+    return model.run_single_simulation(scenario, generated_params_df)
+
+
+def test_same_output_shape_as_deterministic_model(model, scenario, result):
+    generated_params_df = model.generate_epidemic_parameter_ranges(1)
+    deterministic_result = super(type(model), model).run_single_simulation(
+        scenario, generated_params_df
+    )
+    assert list(result.columns) == list(deterministic_result.columns)
+    assert len(result) == 200 * len(deterministic_result)
+
+
+def test_whole_people_are_conserved(model, result):
+    assert_allclose(result[COMPARTMENTS].sum(axis=1), model.population_size)
+    assert_allclose(result[COMPARTMENTS], np.rint(result[COMPARTMENTS]), atol=1e-9)
+    assert (result[COMPARTMENTS] >= 0).all().all()
+
+
+def test_capacities_are_respected(model, result):
+    assert (result["Critical"] <= 6).all()
+    assert (result["Quarantined"] <= 200).all()
+    # offsite removal only draws on the oldest age compartments
+    assert (result["Offsite_0_9"] == 0).all()
+    assert (result["Offsite_70_above"] > 0).any()
+
+
+def test_some_replicates_fade_out(result):
+    final_recovered = result[result["Time"] == 200]["Recovered"].to_numpy()
+    assert (final_recovered < 50).any()
+    assert (final_recovered > 1000).any()
+
+
+def test_seed_makes_runs_reproducible(model, scenario):
+    generated_params_df = model.generate_epidemic_parameter_ranges(5)
+    first = model.run_single_simulation(scenario, generated_params_df, t_stop=30)
+    second = model.run_single_simulation(scenario, generated_params_df, t_stop=30)
+    assert_array_equal(first.to_numpy(), second.to_numpy())